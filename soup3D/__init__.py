@@ -7,15 +7,27 @@ from OpenGL.GLU import *
 from pyglm import glm
 import os
 import shlex
-import imageio.v2 as imageio
 import json
 import struct
 import base64
 import math
+import numpy as np
 
+import soup3D.state
 import soup3D.shader
+import soup3D.texture
+import soup3D.compressed
+import soup3D.diskcache
+import soup3D.upload
+import soup3D.stream
+import soup3D.atlas
+import soup3D.texarray
+import soup3D.ring
+import soup3D.deferred
 import soup3D.camera
 import soup3D.light
+import soup3D.shadow
+import soup3D.bake
 import soup3D.ui
 import soup3D.skeleton
 from soup3D.name import *
@@ -85,22 +97,18 @@ class Model:
         self.width, self.height, self.length = 1, 1, 1
         self.faces = list(face)
 
-        # 将表面按照表面着色器分类
-        self.face_groups = {}
-        for face in self.faces:
-            surface = face.surface
-            if id(surface) not in self.face_groups:
-                self.face_groups[id(surface)] = []
-            self.face_groups[id(surface)].append(face)
-            if hasattr(surface, "set_model_mat"):
-                surface.set_model_mat(self.get_model_mat())
-            if hasattr(surface, "set_projection_mat"):
-                surface.set_projection_mat(get_projection_mat())
-            if hasattr(surface, "set_view_mat"):
-                surface.set_view_mat(soup3D.camera.get_view_mat())
-
         self.list_id = None
-        self.surfaces = None
+        self.list_dirty = False
+        self.model_mat = self.get_model_mat()
+        self.model_mat_data = soup3D.ring.pack_mat4(self.model_mat)
+        self.version = 0        # 模型变换版本，移动、旋转、缩放时递增
+        self.bounds = None      # 模型空间包围球(球心, 半径)，None表示需要重新计算
+        self.draw_data = np.zeros(soup3D.ring.DRAW_BLOCK_SIZE // 4, dtype=np.float32)  # 绘制数据
+        self.draw_key = None    # 绘制数据对应的(模型变换版本, 光源布局版本)
+        self.light_selection = soup3D.light.LightSelection()  # 选出的光源，只改变颜色的光源不影响排名时沿用
+
+        # 将表面按照表面着色器分类
+        self._group_faces()
 
     def __add__(self, other: "Model"):
         """
@@ -113,44 +121,200 @@ class Model:
         self.faces += other.faces
 
         # 将表面按照表面着色器分类
+        self._group_faces()
+
+        if self.list_id is not None:
+            self.gen_dis_list()
+
+        return self
+
+    def _group_faces(self):
+        """
+        将表面按照表面着色器分类，并将表面着色器按照管线分组
+        :return: None
+        """
         self.face_groups = {}
+        self.surfaces = {}
+        self.bounds = None
+        self.draw_key = None
+        self.light_count = 0  # 需要选出的光源数量，取材质最多光源数量的最大值
         for face in self.faces:
             surface = face.surface
             if id(surface) not in self.face_groups:
                 self.face_groups[id(surface)] = []
+                self.surfaces[id(surface)] = surface
             self.face_groups[id(surface)].append(face)
-            if hasattr(surface, "set_model_mat"):
-                surface.set_model_mat(self.get_model_mat())
-            if hasattr(surface, "set_projection_mat"):
-                surface.set_projection_mat(get_projection_mat())
-            if hasattr(surface, "set_view_mat"):
-                surface.set_view_mat(soup3D.camera.get_view_mat())
+        for surface in self.surfaces.values():
+            self.light_count = max(self.light_count, getattr(surface, "max_light_count", 0))
+        self.light_count = min(self.light_count, soup3D.light.MODEL_LIGHT_COUNT)
 
-        if self.list_id is not None:
-            self.gen_dis_list()
+        self._group_pipelines()
 
-        return self
+    def _group_pipelines(self):
+        """
+        将表面着色器按照管线分组，使用同一管线的材质在显示列表中连续绘制，只需切换一次着色器程序
+        :return: None
+        """
+        self.pipelines = {}
+        self.pipeline_groups = {}
+        for surface_id in self.surfaces:
+            pipeline = _get_pipeline(self.surfaces[surface_id])
+            if id(pipeline) not in self.pipelines:
+                self.pipelines[id(pipeline)] = pipeline
+                self.pipeline_groups[id(pipeline)] = []
+            self.pipeline_groups[id(pipeline)].append(surface_id)
+
+    def _update_model_mat(self):
+        """
+        重新计算模型矩阵，在移动、旋转、缩放模型时自动调用
+        :return: None
+        """
+        self.model_mat = self.get_model_mat()
+        self.model_mat_data = soup3D.ring.pack_mat4(self.model_mat)
+        self.version += 1
+
+    def _compute_bounds(self):
+        """
+        计算模型空间的包围球，只统计使用自动着色器的表面。带骨骼权重的顶点会随骨骼运动，包含这类顶点时半径为无穷大。
+        :return: (球心, 半径)
+        """
+        positions = []
+        skinned = False
+        for face in self.faces:
+            if not hasattr(face.surface, "pipeline"):
+                continue
+            for v in face.vertex:
+                if isinstance(v[0], dict):
+                    skinned = True
+                elif len(v) >= 3:
+                    positions.append(v[0:3])
+
+        if skinned or not positions:
+            return np.zeros(3, dtype=np.float32), math.inf
+
+        positions = np.array(positions, dtype=np.float32)
+        low = positions.min(axis=0)
+        high = positions.max(axis=0)
+        center = (low + high) / 2
+        radius = float(np.linalg.norm(positions - center, axis=1).max())
+        return center, radius
+
+    def get_world_bounds(self):
+        """
+        获取世界空间的包围球，半径按模型矩阵中最大的缩放放大
+        :return: (球心, 半径)
+        """
+        if self.bounds is None:
+            self.bounds = self._compute_bounds()
+        center, radius = self.bounds
+
+        world = self.model_mat * glm.vec4(*center, 1)
+        if math.isinf(radius):
+            return np.array((world.x, world.y, world.z), dtype=np.float32), radius
+        scale = max(abs(self.width), abs(self.height), abs(self.length))
+        return np.array((world.x, world.y, world.z), dtype=np.float32), radius * scale
+
+    def get_draw_data(self) -> np.ndarray:
+        """
+        获取写入环形缓冲区的绘制数据：模型矩阵，以及按包围球选出的影响该模型的光源。只在模型或光源移动时重新选择光源；光源只改变颜色
+        时，只有它可能改变该模型的光源排名才重新选择。
+        :return: 按std140布局排列的float32数组
+        """
+        key = (self.version, soup3D.light.environment.version)
+        if self.draw_key == key and self.light_selection.color == soup3D.light.color_version:
+            return self.draw_data
+
+        center, radius = self.get_world_bounds()
+        if self.draw_key == key and self.light_selection.is_current(center, radius):
+            return self.draw_data
+        selected = self.light_selection.select(center, radius, self.light_count)
+
+        self.draw_data[0:16] = self.model_mat_data
+        ints = self.draw_data.view(np.int32)
+        ints[16:28] = 0
+        ints[16] = len(selected)
+        ints[20:20 + len(selected)] = selected
+        self.draw_key = key
+        return self.draw_data
+
+    def get_shadow_key(self) -> tuple:
+        """
+        获取影响阴影贴图的模型状态，模型移动、重建显示列表或骨骼姿态变化时会改变
+        :return: (模型变换版本, 显示列表id, 各管线的骨骼姿态版本...)
+        """
+        key = [self.version, self.list_id]
+        for pipeline in self.pipelines.values():
+            # 直接使用ShaderProgram的表面自身作为管线，没有骨骼姿态
+            if isinstance(pipeline, soup3D.shader.Pipeline) and pipeline.skinned:
+                key.append(pipeline.get_pose_key())
+        return tuple(key)
+
+    def update_pipelines(self):
+        """
+        向模型用到的管线上传需要更新的数据，会在每帧绘制该模型前自动调用
+        :return: None
+        """
+        for pipeline in self.pipelines.values():
+            if pipeline.is_dirty():
+                pipeline.update()
+
+    def mark_list_dirty(self):
+        """
+        标记显示列表需要重新生成，显示列表会在下一次绘制时重新生成
+        :return: None
+        """
+        self.list_dirty = True
+
+    def is_ready(self) -> bool:
+        """
+        查询模型用到的着色器是否都已编译完成，尚未发起编译的着色器会在此时发起编译
+        :return: 是否可以绘制该模型
+        """
+        ready = True
+        for surface_id in self.face_groups:
+            surface = self.face_groups[surface_id][0].surface
+            if hasattr(surface, "is_ready") and not surface.is_ready():
+                ready = False
+        return ready
 
     def gen_dis_list(self):
         """
-        创建显示列表，该操作开销较大，不建议实时使用
+        创建显示列表，该操作开销较大，不建议实时使用。若着色器尚未编译完成，会等待编译完成。显示列表中的表面按照管线排序，同一管线的
+        材质之间只切换纹理与材质常量。
         :return: None
         """
+        # 材质切换管线后需要重新分组
+        self._group_pipelines()
+
+        for pipeline in self.pipelines.values():
+            if hasattr(pipeline, "warm_up"):
+                pipeline.warm_up(wait=True)
+
+        if self.list_id is not None:
+            glDeleteLists(self.list_id, 1)
+
         self.list_id = glGenLists(1)
-        self.surfaces = {}
+        soup3D.state.begin_record()
         glNewList(self.list_id, GL_COMPILE)
-        for surface_id in self.face_groups:
-            faces = self.face_groups[surface_id]
-            for i, face in enumerate(faces):
-                surface = face.surface
-                if id(surface) not in self.surfaces:
-                    self.surfaces[id(surface)] = surface
-                if i == 0 and hasattr(surface, "use"):
-                    surface.use()
-                surface.rend(face.mode, face.vertex)
-                if i == len(faces) - 1 and hasattr(surface, "unuse"):
-                    surface.unuse()
+        for pipeline_id in self.pipeline_groups:
+            pipeline = self.pipelines[pipeline_id]
+            if hasattr(pipeline, "use"):
+                pipeline.use()
+            for surface_id in self.pipeline_groups[pipeline_id]:
+                surface = self.surfaces[surface_id]
+                if hasattr(surface, "bind"):
+                    surface.bind()
+                for face in self.face_groups[surface_id]:
+                    surface.rend(face.mode, face.vertex)
+            if hasattr(pipeline, "unuse"):
+                pipeline.unuse()
         glEndList()
+        soup3D.state.end_record()
+        self.list_dirty = False
+
+        for surface in self.surfaces.values():
+            if hasattr(surface, "register_model"):
+                surface.register_model(self)
 
     def del_dis_list(self):
         """
@@ -175,21 +339,21 @@ class Model:
 
     def paint(self) -> None:
         """
-        在单帧绘制该模型
+        在单帧绘制该模型，着色器尚未编译完成时会跳过绘制
         :return: None
         """
-        if self.list_id is None:
+        if self.list_id is None and self.is_ready():
             self.gen_dis_list()
         render_queue.append(self)
 
     def show(self) -> None:
         """
-        固定每帧渲染该模型
+        固定每帧渲染该模型，着色器编译完成后才会开始绘制
         :return: None
         """
         global stable_shapes
 
-        if self.list_id is None:
+        if self.list_id is None and self.is_ready():
             self.gen_dis_list()
         stable_shapes[id(self)] = self
 
@@ -210,10 +374,7 @@ class Model:
         :return: None
         """
         self.x, self.y, self.z = x, y, z
-        for face in self.faces:
-            surface = face.surface
-            if hasattr(surface, "set_model_mat"):
-                surface.set_model_mat(self.get_model_mat())
+        self._update_model_mat()
 
     def turn(self, yaw: int | float, pitch: int | float, roll: int | float) -> None:
         """
@@ -224,10 +385,7 @@ class Model:
         :return: None
         """
         self.yaw, self.pitch, self.roll = yaw, pitch, roll
-        for face in self.faces:
-            surface = face.surface
-            if hasattr(surface, "set_model_mat"):
-                surface.set_model_mat(self.get_model_mat())
+        self._update_model_mat()
 
     def size(self, width: int | float, height: int | float, length: int | float) -> None:
         """
@@ -238,10 +396,7 @@ class Model:
         :return: None
         """
         self.width, self.height, self.length = width, height, length
-        for face in self.faces:
-            surface = face.surface
-            if hasattr(surface, "set_model_mat"):
-                surface.set_model_mat(self.get_model_mat())
+        self._update_model_mat()
 
     def get_model_mat(self) -> glm.mat4:
         """
@@ -306,7 +461,7 @@ def _build_channel_value(val):
     :return: 通道值，float或Channel对象
     """
     if isinstance(val, tuple) and len(val) == 3 and val[0] == "channel":
-        texture = soup3D.shader.Texture(val[1])
+        texture = soup3D.texture.load(val[1])
         return soup3D.shader.Channel(texture, val[2])
     return val
 
@@ -331,7 +486,7 @@ def _build_surface_arg(val):
     :return: 表面参数值
     """
     if isinstance(val, tuple) and len(val) == 2 and val[0] == "texture":
-        return soup3D.shader.Texture(val[1])
+        return soup3D.texture.load(val[1])
     return val
 
 
@@ -426,7 +581,7 @@ def _build_gltf_base_color(bc_data: tuple) -> soup3D.shader.MixChannel:
     """
     if bc_data[0] == "textured":
         _, img_bytes, w, h, fmt, has_alpha = bc_data
-        tex = soup3D.shader.Texture(img_bytes, width=w, height=h, format=fmt)
+        tex = soup3D.texture.from_bytes(img_bytes, w, h, fmt)
         r_ch = soup3D.shader.Channel(tex, 0)
         g_ch = soup3D.shader.Channel(tex, 1)
         b_ch = soup3D.shader.Channel(tex, 2)
@@ -446,7 +601,7 @@ def _build_gltf_emission(emi_data) -> tuple | soup3D.shader.Texture:
     """
     if isinstance(emi_data, tuple) and len(emi_data) == 5 and emi_data[0] == "image":
         _, img_bytes, w, h, fmt = emi_data
-        return soup3D.shader.Texture(img_bytes, width=w, height=h, format=fmt)
+        return soup3D.texture.from_bytes(img_bytes, w, h, fmt)
     return emi_data
 
 
@@ -507,7 +662,8 @@ def init(width: int | float = 1920,
          fov: int | float = 45,
          bg_color: tuple[int | float, int | float, int | float] = (0.0, 0.0, 0.0),
          near: int | float = 0.1,
-         far: int | float = 1024) -> None:
+         far: int | float = 1024,
+         renderer: str = FORWARD) -> None:
     """
     初始化3D引擎
     :param width:    视网膜宽度
@@ -516,8 +672,15 @@ def init(width: int | float = 1920,
     :param bg_color: 背景颜色
     :param near:     最近渲染距离
     :param far:      最远渲染距离
+    :param renderer: 渲染方式，可以填写这些内容：
+                     "forward": 前向渲染，绘制每个片段时计算光照，支持半透明混合
+                     "deferred": 延迟渲染，先将所有模型写入G缓冲区，再逐像素计算光照，适合光源较多或重叠绘制较多的场景，所有
+                                 表面按不透明绘制
     :return: None
     """
+    if renderer not in (FORWARD, DEFERRED):
+        raise ValueError(f"unknown renderer: {renderer}")
+
     global proj_fov, proj_near, proj_far
     global proj_width, proj_height
     proj_fov = fov
@@ -527,10 +690,13 @@ def init(width: int | float = 1920,
     proj_width = width
     proj_height = height
 
+    soup3D.deferred.use_deferred(renderer == DEFERRED)
+
     glClearColor(*bg_color, 1)  # 在上下文创建后设置背景颜色
-    glEnable(GL_DEPTH_TEST)  # 启用深度测试
-    glEnable(GL_BLEND)  # 启用混合
-    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)  # 设置混合函数
+    soup3D.state.invalidate()
+    soup3D.state.enable(GL_DEPTH_TEST)  # 启用深度测试
+    soup3D.state.enable(GL_BLEND)  # 启用混合
+    soup3D.state.blend_func(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)  # 设置混合函数
     glMatrixMode(GL_PROJECTION)
     glLoadIdentity()
     gluPerspective(fov, (width / height), near, far)
@@ -557,10 +723,8 @@ def resize(width: int | float, height: int | float) -> None:
     gluPerspective(proj_fov, aspect_ratio, proj_near, proj_far)
     glMatrixMode(GL_MODELVIEW)
 
-    for surface_id in soup3D.shader.set_mat_queue:
-        surface = soup3D.shader.set_mat_queue[surface_id]
-        if hasattr(surface, "set_projection_mat"):
-            surface.set_projection_mat(get_projection_mat())
+    # 透视矩阵位于相机统一缓冲区中，在下一帧统一更新
+    soup3D.camera.mark_dirty()
 
 
 def background_color(r: int | float, g: int | float, b: int | float) -> None:
@@ -595,7 +759,7 @@ def _paint_ui(shape: soup3D.ui.Shape, x: int | float, y: int | float) -> None:
 
     if shape.texture:
         glEnable(GL_TEXTURE_2D)
-        glBindTexture(GL_TEXTURE_2D, shape.tex_id)
+        soup3D.state.bind_texture(0, GL_TEXTURE_2D, shape.tex_id)
 
         # 使用混合处理透明度
         glEnable(GL_BLEND)
@@ -621,16 +785,15 @@ def _paint_ui(shape: soup3D.ui.Shape, x: int | float, y: int | float) -> None:
 def _render_fullscreen_image(img: soup3D.shader.Img) -> None:
     """渲染全屏叠加图像"""
     # 获取视口尺寸
-    viewport = glGetIntegerv(GL_VIEWPORT)
-    width, height = viewport[2], viewport[3]
+    width, height = proj_width, proj_height
 
     # 获取纹理 ID
     tex_id = img.get_texture_id()
 
     # 重置着色器管线状态，切换到固定功能管线
-    glUseProgram(0)
-    glActiveTexture(GL_TEXTURE0)
-    glBindVertexArray(0)
+    soup3D.state.use_program(0)
+    soup3D.state.active_texture(0)
+    soup3D.state.bind_vertex_array(0)
 
     # 保存当前矩阵状态
     glMatrixMode(GL_PROJECTION)
@@ -679,6 +842,31 @@ def _render_fullscreen_image(img: soup3D.shader.Img) -> None:
     glPopMatrix()
 
 
+def _get_pipeline(surface: soup3D.shader.Surface):
+    """
+    获取表面着色器使用的管线，没有管线的表面着色器(如ShaderProgram)自身即为管线
+    :param surface: 表面着色器
+    :return: 管线
+    """
+    if hasattr(surface, "pipeline"):
+        return surface.pipeline
+    return surface
+
+
+def _prepare_model(model: Model) -> bool:
+    """
+    确认模型可以绘制，着色器编译完成后生成延迟创建的显示列表，材质变化后重新生成显示列表
+    :param model: 需要绘制的模型
+    :return: 是否可以在本帧绘制该模型
+    """
+    if model.list_id is not None and not model.list_dirty:
+        return True
+    if not model.is_ready():
+        return False
+    model.gen_dis_list()
+    return True
+
+
 def update():
     """
     更新画布
@@ -688,9 +876,12 @@ def update():
     # 清空画布
     glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
+    # 帧与帧之间可能有外部代码修改OpenGL状态，每帧开始时重新确认状态
+    soup3D.state.invalidate()
+    soup3D.state.enable(GL_DEPTH_TEST)
+
     # 设置光源
-    if soup3D.light.dirty:
-        soup3D.light.set_surface_light()
+    soup3D.light.upload()
 
     # 执行更新执行列队
     EAU += soup3D.light.EAU
@@ -704,22 +895,47 @@ def update():
     EAU = []
     light.EAU = []
 
-    # 渲染固定渲染物体
+    # 检查后台编译的着色器
+    soup3D.shader.poll_compile()
+
+    # 在预算内上传后台解码完成的贴图
+    soup3D.upload.process()
+
+    # 更新相机统一缓冲区
+    soup3D.camera.upload()
+
+    # 收集本帧需要绘制的固定渲染物体与单帧渲染物体
+    models = []
     for shape_id in stable_shapes:
         model = stable_shapes[shape_id]
-        for shape in model.faces:
-            surface: soup3D.shader.Surface = shape.surface
-            if surface.is_dirty():
-                surface.update()
-        glCallList(model.list_id)
-
-    # 渲染单帧渲染物体
+        if _prepare_model(model):
+            models.append(model)
     for model in render_queue:
-        for shape in model.faces:
-            surface: soup3D.shader.Surface = shape.surface
-            if surface.is_dirty():
-                surface.update()
-        glCallList(model.list_id)
+        if _prepare_model(model):
+            models.append(model)
+
+    # 根据模型在屏幕上的尺寸流送贴图
+    soup3D.stream.update(models)
+
+    # 将所有模型的绘制数据写入环形缓冲区，并上传管线需要更新的数据
+    soup3D.ring.begin_frame(len(models))
+    for slot, model in enumerate(models):
+        soup3D.ring.write(slot, model.get_draw_data())
+        model.update_pipelines()
+    soup3D.ring.flush(len(models))
+
+    # 更新需要重新渲染的阴影贴图
+    soup3D.shadow.render(models)
+
+    # 渲染模型，每个模型只需绑定一次绘制数据；延迟渲染时模型写入G缓冲区，之后统一计算光照
+    if soup3D.deferred.enabled:
+        soup3D.deferred.begin_geometry()
+    for slot, model in enumerate(models):
+        soup3D.ring.bind(slot)
+        soup3D.state.call_list(model.list_id)
+    if soup3D.deferred.enabled:
+        soup3D.deferred.light_pass()
+    soup3D.ring.end_frame()
 
     # 清空渲染队列
     render_queue = []
@@ -916,9 +1132,10 @@ def open_mtl(mtl: str,
             if args[0] == "map_Kd":
                 base_dir = os.path.dirname(mtl)
                 tex_path = (os.path.join(base_dir, args[1]))
+                # 尺寸只从文件头读取，贴图在生成纹理时才解码，可以在后台加载
+                texture = soup3D.texture.load(tex_path)
                 try:
-                    img = imageio.imread(tex_path)
-                    height, width = img.shape[:2]
+                    width, height = texture.get_size()
                 except:
                     width, height = 1, 1
                 if data_only:
@@ -926,7 +1143,6 @@ def open_mtl(mtl: str,
                     G = ("channel", tex_path, 1)
                     B = ("channel", tex_path, 2)
                 else:
-                    texture = soup3D.shader.Texture(tex_path)
                     R = soup3D.shader.Channel(texture, 0)
                     G = soup3D.shader.Channel(texture, 1)
                     B = soup3D.shader.Channel(texture, 2)
@@ -936,7 +1152,7 @@ def open_mtl(mtl: str,
                 if data_only:
                     A = ("channel", tex_path, 3)
                 else:
-                    texture = soup3D.shader.Texture(tex_path)
+                    texture = soup3D.texture.load(tex_path)
                     A = soup3D.shader.Channel(texture, 3)
             if args[0] == "map_Ke":
                 base_dir = os.path.dirname(mtl)
@@ -944,7 +1160,7 @@ def open_mtl(mtl: str,
                 if data_only:
                     emission = ("texture", tex_path)
                 else:
-                    emission = soup3D.shader.Texture(tex_path)
+                    emission = soup3D.texture.load(tex_path)
             if args[0] == "map_Bump":
                 tex_path = None
                 arg_name = None
@@ -961,7 +1177,7 @@ def open_mtl(mtl: str,
                 if data_only:
                     bump_texture = ("texture", tex_path)
                 else:
-                    bump_texture = soup3D.shader.Texture(tex_path)
+                    bump_texture = soup3D.texture.load(tex_path)
 
     # 添加最后一个材质
     if now_mtl is not None:
@@ -989,7 +1205,9 @@ def open_obj(obj: str,
              roll_funk=None,
              encoding: str = "utf-8",
              max_light_count: int = 8,
-             data_only: bool = False) -> "Model | Data":
+             data_only: bool = False,
+             atlas: bool = False,
+             texture_array: bool = False) -> "Model | Data":
     """
     从obj文件导入模型
     :param obj:             *.obj模型文件路径
@@ -1000,6 +1218,10 @@ def open_obj(obj: str,
     :param max_light_count: 该模型出现时会同时出现的最多的光源数量，大了会导致性能问题
     :param data_only:       是否只创建模型数据结构，当为True时，则返回模型相关的数据，而不是模型本身。当需要用一个文件创建多个独立的模型时，
                             则将该值设为True。
+    :param atlas:           是否将材质的小尺寸主要颜色贴图装入共享的图集，只有贴图不同的材质会合并为同一个材质。data_only为True
+                            时忽略该参数
+    :param texture_array:   是否将尺寸相同的材质贴图放入纹理数组，只有贴图不同的材质会合并为同一个材质，并在顶点中记录层序号。
+                            data_only为True时忽略该参数
     :return: 生成出来的模型数据(Model类)，当data_only为True时返回Data对象
     """
     # 处理mtl文件
@@ -1205,16 +1427,25 @@ def open_obj(obj: str,
         }
         return Data("obj", obj_data)
 
+    groups = [
+        (face_data['material'], face_data['vertices'])
+        for face_data in faces_by_material.values()
+        if face_data['vertices']  # 只有当有顶点数据时才创建面
+    ]
+    if atlas:
+        groups = soup3D.atlas.build(groups)
+    if texture_array:
+        groups = soup3D.texarray.build(groups)
+
     # 创建面对象，每个材质对应一个面
     faces = []
-    for material_id, face_data in faces_by_material.items():
-        if face_data['vertices']:  # 只有当有顶点数据时才创建面
-            face = Face(
-                shape_type="triangle_b",  # 分离的三角形
-                surface=face_data['material'],
-                vertex=face_data['vertices']
-            )
-            faces.append(face)
+    for material, vertices in groups:
+        face = Face(
+            shape_type="triangle_b",  # 分离的三角形
+            surface=material,
+            vertex=vertices
+        )
+        faces.append(face)
 
     # 创建模型对象（原点设置为0,0,0）
     model = Model(0, 0, 0, *faces)
@@ -1331,10 +1562,10 @@ def _gltf_load_materials(gltf_data: dict, base_dir: str, double_side: bool, max_
         if uri.startswith("data:"):
             split_idx = uri.index(",")
             img_bytes = base64.b64decode(uri[split_idx + 1:])
-            img_array = imageio.imread(img_bytes)
+            img_array, _ = soup3D.diskcache.imread(img_bytes)
         else:
             img_path = os.path.join(base_dir, uri)
-            img_array = imageio.imread(img_path)
+            img_array, _ = soup3D.diskcache.imread(img_path)
         loaded_images.append(img_array)
 
     for mat_idx, mat_info in enumerate(materials_data):
@@ -1363,7 +1594,7 @@ def _gltf_load_materials(gltf_data: dict, base_dir: str, double_side: bool, max_
                     if data_only:
                         base_color_data = ("textured", img_bytes, w, h, fmt, has_alpha)
                     else:
-                        tex = soup3D.shader.Texture(img_bytes, width=w, height=h, format=fmt)
+                        tex = soup3D.texture.from_bytes(img_bytes, w, h, fmt)
                         r_ch = soup3D.shader.Channel(tex, 0)
                         g_ch = soup3D.shader.Channel(tex, 1)
                         b_ch = soup3D.shader.Channel(tex, 2)
@@ -1385,7 +1616,7 @@ def _gltf_load_materials(gltf_data: dict, base_dir: str, double_side: bool, max_
                     if data_only:
                         emission = ("image", img_bytes, w, h, fmt)
                     else:
-                        tex = soup3D.shader.Texture(img_bytes, width=w, height=h, format=fmt)
+                        tex = soup3D.texture.from_bytes(img_bytes, w, h, fmt)
                         emission = tex
 
         if data_only:
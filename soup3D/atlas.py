@@ -0,0 +1,312 @@
+"""
+调用：soup3D.atlas
+贴图图集，在加载模型时将多个材质的小尺寸主要颜色贴图按天际线算法装入共享的图集页，并重新映射面的uv坐标。只有贴图不同、其它参数
+都相同的材质会合并为同一个材质，使用这些材质的面也会合并为同一个面，从而减少纹理绑定与绘制次数。
+每张贴图四周用边缘像素填充，并按对齐单位摆放，避免线性过滤与前几级mipmap混入相邻贴图的颜色。
+"""
+import numpy as np
+
+import soup3D.shader
+
+__all__ : list[str] = [
+    "build", "get_stats",
+]
+
+PAGE_SIZE = 2048       # 图集页的最大边长
+MAX_TILE = 256         # 装入图集的贴图的最大边长，更大的贴图保持独立
+PADDING = 4            # 每张贴图四周填充的像素数
+ALIGN = 4              # 贴图在图集页中的对齐单位，保证前log2(ALIGN)级mipmap不跨越贴图边界
+UV_EPSILON = 1e-4      # 判断uv坐标是否超出单个贴图范围时的容差
+
+page_count = 0         # 已生成的图集页数量
+tile_count = 0         # 已装入图集的贴图数量
+
+
+def _align(value: int) -> int:
+    """
+    向上对齐到对齐单位
+    :param value: 像素数
+    :return: 对齐后的像素数
+    """
+    return (value + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _next_power(value: int) -> int:
+    """
+    获取不小于value的最小的2的幂
+    :param value: 正整数
+    :return: 2的幂
+    """
+    power = 1
+    while power < value:
+        power *= 2
+    return power
+
+
+def _skyline_fit(skyline: list, index: int, width: int, page_size: int) -> int:
+    """
+    计算贴图左边缘对齐天际线第index段时，贴图底部所在的高度
+    :param skyline:   天际线，每段为[x, y, 宽度]
+    :param index:     天际线段的序号
+    :param width:     贴图宽度
+    :param page_size: 图集页边长
+    :return: 贴图底部的高度，超出图集页宽度时返回-1
+    """
+    x = skyline[index][0]
+    if x + width > page_size:
+        return -1
+    y = 0
+    remaining = width
+    while remaining > 0:
+        _, segment_y, segment_width = skyline[index]
+        y = max(y, segment_y)
+        remaining -= segment_width
+        index += 1
+    return y
+
+
+def _skyline_insert(skyline: list, width: int, height: int, page_size: int) -> tuple[int, int] | None:
+    """
+    按最低顶部优先的原则在天际线上放置贴图，并更新天际线
+    :param skyline:   天际线，每段为[x, y, 宽度]
+    :param width:     贴图宽度
+    :param height:    贴图高度
+    :param page_size: 图集页边长
+    :return: 贴图左上角的位置(x, y)，放不下时返回None
+    """
+    best = None  # (顶部高度, x, 天际线段的序号)
+    for index in range(len(skyline)):
+        y = _skyline_fit(skyline, index, width, page_size)
+        if y < 0 or y + height > page_size:
+            continue
+        candidate = (y + height, skyline[index][0], index)
+        if best is None or candidate < best:
+            best = candidate
+    if best is None:
+        return None
+
+    top, x, index = best
+    skyline.insert(index, [x, top, width])
+
+    # 裁剪被新段覆盖的天际线段
+    i = index + 1
+    while i < len(skyline):
+        end = skyline[i - 1][0] + skyline[i - 1][2]
+        segment_x, segment_y, segment_width = skyline[i]
+        if segment_x >= end:
+            break
+        shrink = end - segment_x
+        if segment_width <= shrink:
+            del skyline[i]
+            continue
+        skyline[i] = [segment_x + shrink, segment_y, segment_width - shrink]
+        break
+
+    # 合并高度相同的相邻段
+    i = 0
+    while i < len(skyline) - 1:
+        if skyline[i][1] == skyline[i + 1][1]:
+            skyline[i][2] += skyline[i + 1][2]
+            del skyline[i + 1]
+        else:
+            i += 1
+
+    return x, top - height
+
+
+def _uv_shift(vertices: np.ndarray) -> tuple[float, float] | None:
+    """
+    判断面的uv坐标是否都落在同一个贴图范围内，图集中的贴图无法重复平铺
+    :param vertices: 顶点数组，第4、5列为uv坐标
+    :return: 需要减去的整数偏移(u, v)，超出单个贴图范围时返回None
+    """
+    # 顶点拆分时存入1 - v，顶点着色器再翻转回来，着色器实际在(u, v)采样
+    u = vertices[:, 3]
+    v = vertices[:, 4]
+    shift_u = np.floor(u.min() + UV_EPSILON)
+    shift_v = np.floor(v.min() + UV_EPSILON)
+    if u.max() - shift_u > 1 + UV_EPSILON or v.max() - shift_v > 1 + UV_EPSILON:
+        return None
+    return float(shift_u), float(shift_v)
+
+
+def is_compressed(image) -> bool:
+    """
+    判断贴图是否使用了无法在CPU端读取像素的压缩贴图
+    :param image: 贴图或混合通道贴图
+    :return: 是否使用了压缩贴图
+    """
+    if isinstance(image, soup3D.shader.Texture):
+        return image.is_compressed()
+    return any(
+        isinstance(source, soup3D.shader.Channel) and is_compressed(source.texture)
+        for source in (image.R, image.G, image.B, image.A)
+    )
+
+
+def _candidate(material, vertex_lists: list, max_tile: int) -> np.ndarray | None:
+    """
+    判断材质能否装入图集
+    :param material:     材质
+    :param vertex_lists: 使用该材质的所有面的顶点
+    :param max_tile:     装入图集的贴图的最大边长
+    :return: 材质主要颜色的像素数组，不能装入图集时返回None
+    """
+    if type(material) is not soup3D.shader.AutoSP:
+        return None
+    if not isinstance(material.normal, (list, tuple)) or not isinstance(material.emission, (list, tuple)):
+        return None
+    if material.lightmap is not None:
+        return None
+    base_color = material.base_color
+    if isinstance(base_color, soup3D.shader.MixChannel) and base_color.get_constant() is not None:
+        return None
+    if is_compressed(base_color):
+        return None
+    width, height = base_color.get_size() if isinstance(base_color, soup3D.shader.Texture) else base_color.resize
+    if width > max_tile or height > max_tile:
+        return None
+    for vertices in vertex_lists:
+        if len(vertices) == 0 or len(vertices[0]) < 5:
+            return None
+        if _uv_shift(np.asarray(vertices, dtype=np.float64)) is None:
+            return None
+
+    if isinstance(base_color, soup3D.shader.Texture):
+        # 统一转换为RGBA，缺少的通道按混合通道贴图的规则补全
+        channels = [soup3D.shader.Channel(base_color, i) for i in range(4)]
+        base_color = soup3D.shader.MixChannel((width, height), *channels)
+    return base_color.get_array()
+
+
+def _remap(vertices: list, rect: tuple[int, int, int, int], page_width: int, page_height: int) -> list:
+    """
+    将面的uv坐标映射到图集页中贴图所在的区域
+    :param vertices:    面的顶点
+    :param rect:        贴图在图集页中的区域(x, y, 宽度, 高度)
+    :param page_width:  图集页宽度
+    :param page_height: 图集页高度
+    :return: 映射后的顶点
+    """
+    array = np.asarray(vertices, dtype=np.float64)
+    shift_u, shift_v = _uv_shift(array)
+    x, y, width, height = rect
+    array[:, 3] = (x + (array[:, 3] - shift_u) * width) / page_width
+    array[:, 4] = (y + (array[:, 4] - shift_v) * height) / page_height
+    return [tuple(row) for row in array.tolist()]
+
+
+def build(groups: list, max_tile: int = MAX_TILE, page_size: int = PAGE_SIZE) -> list:
+    """
+    将材质的小尺寸主要颜色贴图装入图集，并合并装入同一图集页、其它参数相同的材质。只处理法线与自发光为常数、没有光照贴图的AutoSP材
+    质，且使用该材质的面的uv坐标不能跨越多个贴图范围。
+    :param groups:    [(材质, 顶点列表), ...]，顶点按不相连三角形排列，同一个材质可以出现多次
+    :param max_tile:  装入图集的贴图的最大边长
+    :param page_size: 图集页的最大边长
+    :return: 替换材质与uv坐标后的[(材质, 顶点列表), ...]，每个材质只出现一次，不能装入图集的材质保持不变
+    """
+    global page_count, tile_count
+
+    # 按材质收集顶点
+    materials = {}
+    for material, vertices in groups:
+        materials.setdefault(id(material), (material, []))[1].append(vertices)
+
+    tiles = []  # (材质id, 带填充的像素数组, 原始宽度, 原始高度)
+    for material_id, (material, vertex_lists) in materials.items():
+        array = _candidate(material, vertex_lists, max_tile)
+        if array is None:
+            continue
+        height, width = array.shape[:2]
+        padded_width = _align(width + 2 * PADDING)
+        padded_height = _align(height + 2 * PADDING)
+        padded = np.pad(
+            array,
+            ((PADDING, padded_height - height - PADDING), (PADDING, padded_width - width - PADDING), (0, 0)),
+            mode="edge"
+        )
+        tiles.append((material_id, padded, width, height))
+    if len(tiles) < 2:
+        return groups
+
+    # 从高到低装入图集页
+    tiles.sort(key=_tile_order, reverse=True)
+    skylines = []
+    placements = {}  # 材质id -> (图集页序号, x, y)
+    for material_id, padded, width, height in tiles:
+        for page, skyline in enumerate(skylines):
+            position = _skyline_insert(skyline, padded.shape[1], padded.shape[0], page_size)
+            if position is not None:
+                break
+        else:
+            skylines.append([[0, 0, page_size]])
+            page = len(skylines) - 1
+            position = _skyline_insert(skylines[page], padded.shape[1], padded.shape[0], page_size)
+        placements[material_id] = (page, *position)
+
+    # 生成图集页
+    page_sizes = [[ALIGN, ALIGN] for _ in skylines]
+    for material_id, padded, width, height in tiles:
+        page, x, y = placements[material_id]
+        page_sizes[page][0] = max(page_sizes[page][0], x + padded.shape[1])
+        page_sizes[page][1] = max(page_sizes[page][1], y + padded.shape[0])
+    page_sizes = [(_next_power(width), _next_power(height)) for width, height in page_sizes]
+    page_arrays = [np.zeros((height, width, 4), dtype=np.uint8) for width, height in page_sizes]
+    rects = {}  # 材质id -> (图集页序号, 贴图区域)
+    for material_id, padded, width, height in tiles:
+        page, x, y = placements[material_id]
+        page_arrays[page][y:y + padded.shape[0], x:x + padded.shape[1]] = padded
+        rects[material_id] = (page, (x + PADDING, y + PADDING, width, height))
+    pages = [
+        soup3D.shader.Texture(array.tobytes(), width, height, 'RGBA')
+        for array, (width, height) in zip(page_arrays, page_sizes)
+    ]
+
+    # 替换材质，参数相同的材质合并，使用同一材质的顶点合并为同一组
+    merged = {}  # 材质参数 -> 合并后的材质
+    result = {}  # 材质id -> (材质, 顶点列表)
+    for material, vertices in groups:
+        entry = rects.get(id(material))
+        if entry is None:
+            result.setdefault(id(material), (material, []))[1].extend(vertices)
+            continue
+        page, rect = entry
+        key = (
+            page, tuple(material.normal), tuple(material.emission), material.double_side,
+            material.max_light_count, material.alpha_test, material.unlit
+        )
+        atlas_material = merged.get(key)
+        if atlas_material is None:
+            atlas_material = soup3D.shader.AutoSP(
+                base_color=pages[page],
+                normal=material.normal,
+                emission=material.emission,
+                double_side=material.double_side,
+                max_light_count=material.max_light_count,
+                alpha_test=material.alpha_test,
+                unlit=material.unlit,
+            )
+            merged[key] = atlas_material
+        width, height = page_sizes[page]
+        result.setdefault(id(atlas_material), (atlas_material, []))[1].extend(_remap(vertices, rect, width, height))
+
+    page_count += len(pages)
+    tile_count += len(tiles)
+    return list(result.values())
+
+
+def _tile_order(tile: tuple) -> tuple[int, int]:
+    """
+    贴图的装入顺序，先装入较高的贴图
+    :param tile: (材质id, 带填充的像素数组, 原始宽度, 原始高度)
+    :return: 排序键
+    """
+    return tile[1].shape[0], tile[1].shape[1]
+
+
+def get_stats() -> dict:
+    """
+    获取图集统计
+    :return: {"pages": 已生成的图集页数量, "tiles": 已装入图集的贴图数量}
+    """
+    return {"pages": page_count, "tiles": tile_count}
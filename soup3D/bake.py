@@ -0,0 +1,390 @@
+"""
+调用：soup3D.bake
+离线光照烘焙，用于静态场景。在CPU上对场景中的三角形进行光线求交，计算每个纹素受到的环境光与直接光照(含阴影)，写入光照贴图，烘
+焙后的材质不再逐片段计算光源。光线求交使用NumPy向量化，并通过进程池并行计算；设置缓存路径后，烘焙结果会保存在资源旁边，场景与光
+源不变时直接读取。
+光照贴图与主要颜色共用同一套uv坐标，因此烘焙的材质需要只被一个模型使用，且uv坐标位于[0, 1]范围内、互不重叠。
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+import hashlib
+import numpy as np
+import imageio.v2 as imageio
+
+import soup3D
+import soup3D.light
+import soup3D.ring
+import soup3D.shader
+
+__all__ : list[str] = [
+    "bake", "bake_lightmap", "scene_triangles",
+]
+
+RAY_EPSILON = 1e-3      # 阴影光线起点沿法线的偏移，避免与自身相交
+POINT_CHUNK = 4096      # 每个并行任务计算的纹素数量
+TRIANGLE_CHUNK = 64     # 每次与一批光线求交的三角形数量
+DILATE_STEPS = 4        # 向未覆盖纹素扩展的次数，避免贴图过滤时在接缝处采样到黑色
+
+worker_scene = None     # 进程池中每个进程共享的(三角形, 光源, 环境光)
+
+
+def _face_triangles(face) -> list:
+    """
+    将面拆分为三角形
+    :param face: 面
+    :return: [(顶点序号, 顶点序号, 顶点序号), ...]，线段返回空列表
+    """
+    count = len(face.vertex)
+    if face.shape_type == "triangle_b":
+        return [(i, i + 1, i + 2) for i in range(0, count - 2, 3)]
+    if face.shape_type == "triangle_s":
+        return [(i, i + 1, i + 2) if i % 2 == 0 else (i + 1, i, i + 2) for i in range(count - 2)]
+    if face.shape_type == "triangle_l":
+        return [(0, i, i + 1) for i in range(1, count - 1)]
+    return []
+
+
+def _face_arrays(face) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    按AutoSP的顶点格式拆分出位置、uv坐标与法线，没有法线的顶点使用前三个顶点计算的面法线
+    :param face: 面
+    :return: (位置数组, uv坐标数组, 法线数组)
+    """
+    positions = np.array([v[0:3] for v in face.vertex], dtype=np.float64)
+    uvs = np.array([v[3:5] if len(v) >= 5 else (0.0, 0.0) for v in face.vertex], dtype=np.float64)
+
+    normal = np.array((0.0, 0.0, 1.0))
+    if len(positions) >= 3:
+        cross = np.cross(positions[1] - positions[0], positions[2] - positions[0])
+        length = np.linalg.norm(cross)
+        if length > 0:
+            normal = cross / length
+    normals = np.array([v[5:8] if len(v) >= 8 else normal for v in face.vertex], dtype=np.float64)
+    return positions, uvs, normals
+
+
+def _model_matrices(model) -> tuple[np.ndarray, np.ndarray]:
+    """
+    获取模型矩阵与法线矩阵
+    :param model: 模型
+    :return: (4x4模型矩阵, 3x3法线矩阵)
+    """
+    matrix = soup3D.ring.pack_mat4(model.model_mat).reshape(4, 4).T.astype(np.float64)
+    normal_matrix = np.linalg.inv(matrix[:3, :3]).T
+    return matrix, normal_matrix
+
+
+def _is_static_face(face) -> bool:
+    """
+    判断面是否可以参与烘焙，带骨骼权重的顶点会随骨骼运动，不参与烘焙
+    :param face: 面
+    :return: 是否可以参与烘焙
+    """
+    return len(face.vertex) > 0 and not isinstance(face.vertex[0][0], dict)
+
+
+def scene_triangles(models: list) -> np.ndarray:
+    """
+    收集模型中所有三角形的世界坐标，作为烘焙时的遮挡物
+    :param models: 模型列表
+    :return: 形状为(三角形数量, 3, 3)的数组
+    """
+    triangles = []
+    for model in models:
+        matrix, normal_matrix = _model_matrices(model)
+        for face in model.faces:
+            if not _is_static_face(face):
+                continue
+            indices = _face_triangles(face)
+            if not indices:
+                continue
+            positions, uvs, normals = _face_arrays(face)
+            world = positions @ matrix[:3, :3].T + matrix[:3, 3]
+            triangles.append(world[np.array(indices)])
+    if not triangles:
+        return np.zeros((0, 3, 3), dtype=np.float64)
+    return np.concatenate(triangles)
+
+
+def _occluded(origins: np.ndarray, directions: np.ndarray, max_distance: np.ndarray,
+              triangles: np.ndarray) -> np.ndarray:
+    """
+    使用Möller–Trumbore算法判断光线在到达最大距离前是否被三角形遮挡，光线与三角形分批求交
+    :param origins:      光线起点数组，形状为(光线数量, 3)
+    :param directions:   归一化的光线方向数组
+    :param max_distance: 光线最大距离数组
+    :param triangles:    三角形数组，形状为(三角形数量, 3, 3)
+    :return: 每条光线是否被遮挡
+    """
+    hit = np.zeros(len(origins), dtype=bool)
+    for start in range(0, len(triangles), TRIANGLE_CHUNK):
+        active = np.nonzero(~hit)[0]
+        if len(active) == 0:
+            break
+        tri = triangles[start:start + TRIANGLE_CHUNK]
+        v0 = tri[:, 0]
+        edge1 = tri[:, 1] - v0
+        edge2 = tri[:, 2] - v0
+
+        o = origins[active][:, None, :]
+        d = directions[active][:, None, :]
+        p = np.cross(d, edge2[None])
+        det = (p * edge1[None]).sum(axis=2)
+        valid = np.abs(det) > 1e-12
+        inv_det = np.where(valid, 1.0 / np.where(valid, det, 1.0), 0.0)
+
+        s = o - v0[None]
+        u = (s * p).sum(axis=2) * inv_det
+        q = np.cross(s, edge1[None])
+        v = (d * q).sum(axis=2) * inv_det
+        t = (q * edge2[None]).sum(axis=2) * inv_det
+
+        inside = valid & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > 0) & (t < max_distance[active][:, None])
+        hit[active] |= inside.any(axis=1)
+    return hit
+
+
+def _init_worker(triangles: np.ndarray, lights: np.ndarray, ambient: tuple) -> None:
+    """
+    进程池初始化函数，在每个进程中保存一份场景数据，避免每个任务重复传输
+    :param triangles: 场景三角形
+    :param lights:    由soup3D.light.pack_lights打包的光源
+    :param ambient:   环境光颜色
+    :return: None
+    """
+    global worker_scene
+    worker_scene = (triangles, lights, ambient)
+
+
+def _irradiance(points: np.ndarray, normals: np.ndarray, triangles: np.ndarray, lights: np.ndarray,
+                ambient: tuple) -> np.ndarray:
+    """
+    计算每个点受到的环境光与直接光照，光照公式与内置表面着色器相同，并额外追踪阴影光线
+    :param points:    世界坐标数组，形状为(点数量, 3)
+    :param normals:   归一化的法线数组
+    :param triangles: 场景三角形
+    :param lights:    由soup3D.light.pack_lights打包的光源
+    :param ambient:   环境光颜色
+    :return: 形状为(点数量, 3)的光照数组
+    """
+    result = np.tile(np.asarray(ambient, dtype=np.float64), (len(points), 1))
+    origins = points + normals * RAY_EPSILON
+
+    for light in lights:
+        position = light["position"].astype(np.float64)
+        direction = light["direction"].astype(np.float64)
+        color = light["color"].astype(np.float64)
+
+        if position[3] < 0.5:
+            # 锥形光线
+            offset = position[:3] - points
+            distance = np.linalg.norm(offset, axis=1)
+            to_light = offset / np.maximum(distance, 1e-12)[:, None]
+            attenuation = 1.0 / (1.0 + direction[3] * distance)
+
+            spot_dir = -direction[:3] / max(np.linalg.norm(direction[:3]), 1e-12)
+            cos_theta = to_light @ spot_dir
+            cos_angle = color[3]
+            epsilon = cos_angle - cos_angle * 0.9
+            spot = np.clip((cos_theta - cos_angle) / (epsilon if epsilon != 0 else 1e-6), 0.0, 1.0)
+            attenuation *= np.where(cos_theta > cos_angle, spot, 0.0)
+        else:
+            # 方向光
+            distance = np.full(len(points), np.inf)
+            to_light = np.tile(direction[:3] / max(np.linalg.norm(direction[:3]), 1e-12), (len(points), 1))
+            attenuation = np.ones(len(points))
+
+        diffuse = np.maximum(np.einsum("ij,ij->i", normals, to_light), 0.0) * attenuation
+        lit = np.nonzero(diffuse > 0)[0]
+        if len(lit) == 0:
+            continue
+        blocked = _occluded(origins[lit], to_light[lit], distance[lit], triangles)
+        lit = lit[~blocked]
+        result[lit] += color[:3] * diffuse[lit][:, None]
+    return result
+
+
+def _trace_chunk(chunk: tuple) -> np.ndarray:
+    """
+    进程池任务，计算一批纹素的光照
+    :param chunk: (世界坐标数组, 法线数组)
+    :return: 光照数组
+    """
+    points, normals = chunk
+    triangles, lights, ambient = worker_scene
+    return _irradiance(points, normals, triangles, lights, ambient)
+
+
+def _rasterize(model, faces: list, size: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    在uv空间中光栅化面，求出每个被覆盖纹素中心对应的世界坐标与法线
+    :param model: 面所属的模型
+    :param faces: 使用同一材质的面
+    :param size:  光照贴图尺寸
+    :return: (纹素序号数组, 世界坐标数组, 法线数组)
+    """
+    matrix, normal_matrix = _model_matrices(model)
+    texels, points, normals = [], [], []
+    for face in faces:
+        if not _is_static_face(face):
+            continue
+        indices = _face_triangles(face)
+        if not indices:
+            continue
+        positions, uvs, vertex_normals = _face_arrays(face)
+        positions = positions @ matrix[:3, :3].T + matrix[:3, 3]
+        vertex_normals = vertex_normals @ normal_matrix.T
+
+        for i0, i1, i2 in indices:
+            a, b, c = uvs[i0] * size, uvs[i1] * size, uvs[i2] * size
+            area = (b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1])
+            if abs(area) < 1e-12:
+                continue
+
+            # 三角形包围盒内的纹素中心
+            x0 = max(int(np.floor(min(a[0], b[0], c[0]))), 0)
+            x1 = min(int(np.ceil(max(a[0], b[0], c[0]))), size)
+            y0 = max(int(np.floor(min(a[1], b[1], c[1]))), 0)
+            y1 = min(int(np.ceil(max(a[1], b[1], c[1]))), size)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            xs, ys = np.meshgrid(np.arange(x0, x1) + 0.5, np.arange(y0, y1) + 0.5)
+            xs, ys = xs.ravel(), ys.ravel()
+
+            # 重心坐标，保留少量容差以覆盖三角形边缘的纹素
+            w1 = ((xs - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (ys - a[1])) / area
+            w2 = ((b[0] - a[0]) * (ys - a[1]) - (xs - a[0]) * (b[1] - a[1])) / area
+            w0 = 1.0 - w1 - w2
+            inside = (w0 >= -1e-3) & (w1 >= -1e-3) & (w2 >= -1e-3)
+            if not inside.any():
+                continue
+            weights = np.stack([w0[inside], w1[inside], w2[inside]], axis=1)
+
+            texels.append(ys[inside].astype(np.int64) * size + xs[inside].astype(np.int64))
+            points.append(weights @ positions[[i0, i1, i2]])
+            normal = weights @ vertex_normals[[i0, i1, i2]]
+            normals.append(normal / np.maximum(np.linalg.norm(normal, axis=1), 1e-12)[:, None])
+
+    if not texels:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 3)), np.zeros((0, 3))
+    return np.concatenate(texels), np.concatenate(points), np.concatenate(normals)
+
+
+def _dilate(image: np.ndarray, mask: np.ndarray, steps: int) -> np.ndarray:
+    """
+    用相邻纹素的平均值填充未覆盖的纹素
+    :param image: 形状为(高度, 宽度, 3)的光照贴图
+    :param mask:  已覆盖的纹素
+    :param steps: 扩展次数
+    :return: 填充后的光照贴图
+    """
+    image = image.copy()
+    mask = mask.copy()
+    for _ in range(steps):
+        total = np.zeros_like(image)
+        count = np.zeros(mask.shape)
+        for axis, shift in ((0, 1), (0, -1), (1, 1), (1, -1)):
+            total += np.roll(image * mask[..., None], shift, axis=axis)
+            count += np.roll(mask, shift, axis=axis)
+        fill = ~mask & (count > 0)
+        image[fill] = total[fill] / count[fill][:, None]
+        mask |= fill
+    return image
+
+
+def bake_lightmap(model, faces: list, occluders: list | None = None, size: int = 256,
+                  workers: int | None = None) -> np.ndarray:
+    """
+    烘焙一组面的光照贴图，光源取自当前点亮的soup3D.light光源与环境光
+    :param model:     面所属的模型
+    :param faces:     使用同一材质的面
+    :param occluders: 投射阴影的模型，None表示只使用该模型
+    :param size:      光照贴图尺寸
+    :param workers:   并行计算的进程数量，None表示使用CPU核心数，1表示在当前进程中计算
+    :return: 形状为(size, size, 3)的光照数组，行号对应v坐标
+    """
+    triangles = scene_triangles(occluders if occluders is not None else [model])
+    lights = soup3D.light.pack_lights()
+    ambient = tuple(soup3D.light.environment.get_ambient())
+
+    texels, points, normals = _rasterize(model, faces, size)
+    chunks = [
+        (points[i:i + POINT_CHUNK], normals[i:i + POINT_CHUNK])
+        for i in range(0, len(points), POINT_CHUNK)
+    ]
+
+    if workers == 1 or len(chunks) <= 1:
+        results = [_irradiance(p, n, triangles, lights, ambient) for p, n in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(triangles, lights, ambient)) as pool:
+            results = list(pool.map(_trace_chunk, chunks))
+
+    image = np.zeros((size * size, 3))
+    mask = np.zeros(size * size, dtype=bool)
+    if results:
+        image[texels] = np.concatenate(results)
+        mask[texels] = True
+    return _dilate(image.reshape(size, size, 3), mask.reshape(size, size), DILATE_STEPS)
+
+
+def _bake_key(model, faces: list, occluders: list, size: int) -> str:
+    """
+    计算烘焙结果的缓存键，场景三角形、面、光源、环境光或贴图尺寸变化时会改变
+    :param model:     面所属的模型
+    :param faces:     使用同一材质的面
+    :param occluders: 投射阴影的模型
+    :param size:      光照贴图尺寸
+    :return: 十六进制摘要
+    """
+    digest = hashlib.sha1()
+    digest.update(scene_triangles(occluders).tobytes())
+    matrix, normal_matrix = _model_matrices(model)
+    digest.update(matrix.tobytes())
+    for face in faces:
+        digest.update(repr(face.vertex).encode())
+    digest.update(soup3D.light.pack_lights().tobytes())
+    digest.update(repr((tuple(soup3D.light.environment.get_ambient()), size)).encode())
+    return digest.hexdigest()
+
+
+def bake(model, size: int = 256, occluders: list | None = None, workers: int | None = None,
+         cache: str | None = None) -> dict:
+    """
+    烘焙模型中所有使用内置表面着色器的材质，并为材质设置光照贴图。跳过不受光照的材质与骨骼蒙皮材质。
+    :param model:     需要烘焙的模型
+    :param size:      光照贴图尺寸
+    :param occluders: 投射阴影的模型，None表示只使用该模型
+    :param workers:   并行计算的进程数量，None表示使用CPU核心数，1表示在当前进程中计算
+    :param cache:     缓存路径前缀，通常填写模型文件路径，光照贴图会保存为“<前缀>.lightmap<序号>.<摘要>.png”；None表示不缓存
+    :return: {表面着色器id: 光照贴图}
+    """
+    occluders = occluders if occluders is not None else [model]
+    lightmaps = {}
+    for index, surface_id in enumerate(model.surfaces):
+        surface = model.surfaces[surface_id]
+        if not isinstance(surface, soup3D.shader.AutoSP) or isinstance(surface, soup3D.shader.BoneBinderSP):
+            continue
+        if surface.unlit:
+            continue
+        faces = model.face_groups[surface_id]
+
+        path = None
+        if cache is not None:
+            key = _bake_key(model, faces, occluders, size)
+            path = f"{cache}.lightmap{index}.{key[:16]}.png"
+
+        if path is not None and os.path.exists(path):
+            lightmap = soup3D.shader.Texture(path)
+        else:
+            image = bake_lightmap(model, faces, occluders, size, workers)
+            pixels = np.empty((size, size, 4), dtype=np.uint8)
+            pixels[..., :3] = np.clip(image * 255 + 0.5, 0, 255).astype(np.uint8)
+            pixels[..., 3] = 255
+            if path is not None:
+                imageio.imwrite(path, pixels)
+            lightmap = soup3D.shader.Texture(pixels.tobytes(), size, size, "RGBA")
+
+        surface.set_lightmap(lightmap)
+        lightmaps[surface_id] = lightmap
+    return lightmaps
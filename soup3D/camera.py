@@ -6,6 +6,8 @@ from OpenGL.GL import *
 from OpenGL.GLU import *
 from pyglm import glm
 from math import *
+import ctypes
+import numpy as np
 
 import soup3D.shader
 
@@ -23,6 +25,10 @@ YAW : int | float = 0.0
 PITCH : int | float = 0.0
 ROLL : int | float = 0.0
 
+ubo = None        # 相机统一缓冲区
+ubo_dirty = True  # 相机统一缓冲区是否需要更新
+version = 0       # 相机版本，相机或透视矩阵每次变化时递增
+
 
 def goto(x: int | float, y: int | float, z: int | float) -> None:
     """
@@ -75,10 +81,52 @@ def update() -> None:
 
     gluLookAt(X, Y, Z, centerX+X, centerY+Y, centerZ+Z, upX, upY, upZ)
 
-    for surface_id in soup3D.shader.set_mat_queue:
-        surface = soup3D.shader.set_mat_queue[surface_id]
-        if hasattr(surface, "set_view_mat"):
-            surface.set_view_mat(get_view_mat())
+    mark_dirty()
+
+
+def mark_dirty() -> None:
+    """
+    标记相机统一缓冲区需要更新，在相机或透视矩阵变化时自动调用
+    :return: None
+    """
+    global ubo_dirty, version
+    ubo_dirty = True
+    version += 1
+
+
+def upload() -> None:
+    """
+    自动调用函数，无需手动调用。将相机矩阵、透视矩阵与相机位置按std140布局上传到相机统一缓冲区，每帧最多上传一次，相机未变化时跳
+    过。
+    :return: None
+    """
+    global ubo, ubo_dirty
+
+    if ubo is None:
+        ubo = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, ubo)
+        glBufferData(GL_UNIFORM_BUFFER, 144, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        ubo_dirty = True
+
+    # 每帧重新绑定，避免外部代码修改绑定点
+    glBindBufferBase(GL_UNIFORM_BUFFER, soup3D.shader.CAMERA_BINDING, ubo)
+
+    if not ubo_dirty:
+        return
+
+    view = get_view_mat()
+    projection = soup3D.get_projection_mat()
+    data = (
+        ctypes.string_at(glm.value_ptr(view), 64) +
+        ctypes.string_at(glm.value_ptr(projection), 64) +
+        np.array([X, Y, Z, 1.0], dtype=np.float32).tobytes()
+    )
+
+    glBindBuffer(GL_UNIFORM_BUFFER, ubo)
+    glBufferSubData(GL_UNIFORM_BUFFER, 0, len(data), data)
+    glBindBuffer(GL_UNIFORM_BUFFER, 0)
+    ubo_dirty = False
 
 
 def get_view_mat() -> glm.mat4x4:
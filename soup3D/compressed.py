@@ -0,0 +1,293 @@
+"""
+调用：soup3D.compressed
+GPU压缩贴图，读取DDS与KTX2容器中的BC1/BC3/BC4/BC5/BC7数据，由贴图(Texture)通过glCompressedTexImage2D直接上传，包括预先生成的各
+级mipmap，无需在CPU端解码。
+同时提供基于NumPy的BC1/BC4离线编码器，可将已有的PNG/JPEG资源转换为DDS文件。
+"""
+import struct
+import numpy as np
+
+import soup3D.name
+import soup3D.shader
+
+__all__ : list[str] = [
+    "is_container", "load", "encode_bc1", "encode_bc4", "save_dds",
+]
+
+# 压缩格式 -> OpenGL内部格式。BC1按不透明RGB上传，sRGB变体按线性格式上传，与未压缩贴图保持一致
+GL_FORMATS = {
+    'BC1': 0x83F0,  # GL_COMPRESSED_RGB_S3TC_DXT1_EXT
+    'BC3': 0x83F3,  # GL_COMPRESSED_RGBA_S3TC_DXT5_EXT
+    'BC4': 0x8DBB,  # GL_COMPRESSED_RED_RGTC1
+    'BC5': 0x8DBD,  # GL_COMPRESSED_RG_RGTC2
+    'BC7': 0x8E8C,  # GL_COMPRESSED_RGBA_BPTC_UNORM
+}
+
+# 压缩格式 -> 每个4x4像素块的字节数
+BLOCK_BYTES = {'BC1': 8, 'BC3': 16, 'BC4': 8, 'BC5': 16, 'BC7': 16}
+
+DDS_MAGIC = b"DDS "
+KTX2_MAGIC = b"\xabKTX 20\xbb\r\n\x1a\n"
+
+# DDS FourCC -> 压缩格式
+DDS_FOURCC = {
+    b"DXT1": 'BC1', b"DXT5": 'BC3',
+    b"ATI1": 'BC4', b"BC4U": 'BC4',
+    b"ATI2": 'BC5', b"BC5U": 'BC5',
+}
+
+# DXGI_FORMAT -> 压缩格式，用于带DX10扩展头的DDS
+DXGI_FORMATS = {
+    71: 'BC1', 72: 'BC1',
+    77: 'BC3', 78: 'BC3',
+    80: 'BC4',
+    83: 'BC5',
+    98: 'BC7', 99: 'BC7',
+}
+
+# VkFormat -> 压缩格式，用于KTX2
+VK_FORMATS = {
+    131: 'BC1', 132: 'BC1', 133: 'BC1', 134: 'BC1',
+    137: 'BC3', 138: 'BC3',
+    139: 'BC4',
+    141: 'BC5',
+    145: 'BC7', 146: 'BC7',
+}
+
+
+def is_container(path: str) -> bool:
+    """
+    根据扩展名判断文件是否为压缩贴图容器
+    :param path: 文件路径
+    :return: 是否为DDS或KTX2文件
+    """
+    return path.lower().endswith((".dds", ".ktx2"))
+
+
+def _level_size(format: str, width: int, height: int) -> int:
+    """
+    计算一级mipmap的字节数
+    :param format: 压缩格式
+    :param width:  该级宽度
+    :param height: 该级高度
+    :return: 字节数
+    """
+    return max(1, (width + 3) // 4) * max(1, (height + 3) // 4) * BLOCK_BYTES[format]
+
+
+def _load_dds(data: bytes) -> tuple[str, int, int, list]:
+    """
+    解析DDS文件
+    :param data: 文件内容
+    :return: (压缩格式, 宽度, 高度, [(宽度, 高度, 数据), ...])
+    """
+    height, width = struct.unpack_from("<II", data, 12)
+    mip_count = max(1, struct.unpack_from("<I", data, 28)[0])
+    fourcc = data[84:88]
+    offset = 128
+    if fourcc == b"DX10":
+        dxgi_format = struct.unpack_from("<I", data, 128)[0]
+        format = DXGI_FORMATS.get(dxgi_format)
+        offset += 20
+        if format is None:
+            raise ValueError(f"Unsupported DXGI format in DDS: {dxgi_format}")
+    else:
+        format = DDS_FOURCC.get(fourcc)
+        if format is None:
+            raise ValueError(f"Unsupported DDS FourCC: {fourcc!r}")
+
+    levels = []
+    level_width, level_height = width, height
+    for _ in range(mip_count):
+        size = _level_size(format, level_width, level_height)
+        if offset + size > len(data):
+            break
+        levels.append((level_width, level_height, data[offset:offset + size]))
+        offset += size
+        level_width, level_height = max(1, level_width // 2), max(1, level_height // 2)
+    return format, width, height, levels
+
+
+def _load_ktx2(data: bytes) -> tuple[str, int, int, list]:
+    """
+    解析KTX2文件，不支持超压缩
+    :param data: 文件内容
+    :return: (压缩格式, 宽度, 高度, [(宽度, 高度, 数据), ...])
+    """
+    vk_format, _, width, height, _, _, _, level_count, supercompression = struct.unpack_from("<9I", data, 12)
+    format = VK_FORMATS.get(vk_format)
+    if format is None:
+        raise ValueError(f"Unsupported VkFormat in KTX2: {vk_format}")
+    if supercompression != 0:
+        raise ValueError(f"Supercompressed KTX2 is not supported: scheme {supercompression}")
+
+    levels = []
+    for level in range(max(1, level_count)):
+        offset, length, _ = struct.unpack_from("<3Q", data, 80 + level * 24)
+        levels.append((max(1, width >> level), max(1, height >> level), data[offset:offset + length]))
+    return format, width, height, levels
+
+
+def load(path: str) -> tuple[str, int, int, list]:
+    """
+    读取DDS或KTX2文件，只解析容器，不解码像素
+    :param path: 文件路径
+    :return: (压缩格式, 宽度, 高度, [(宽度, 高度, 数据), ...])，第0项为最大的一级
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    if data[:4] == DDS_MAGIC:
+        return _load_dds(data)
+    if data[:12] == KTX2_MAGIC:
+        return _load_ktx2(data)
+    raise ValueError(f"Unknown compressed texture container: {path}")
+
+
+def _blocks(array: np.ndarray) -> tuple[np.ndarray, int, int]:
+    """
+    将图像按4x4像素块重新排列，尺寸不是4的倍数时用边缘像素补齐
+    :param array: 形状为(高, 宽, 通道数)的数组
+    :return: (形状为(块数, 16, 通道数)的数组, 横向块数, 纵向块数)
+    """
+    height, width, channels = array.shape
+    blocks_x, blocks_y = (width + 3) // 4, (height + 3) // 4
+    padded = np.pad(array, ((0, blocks_y * 4 - height), (0, blocks_x * 4 - width), (0, 0)), mode="edge")
+    blocks = padded.reshape(blocks_y, 4, blocks_x, 4, channels).transpose(0, 2, 1, 3, 4)
+    return blocks.reshape(blocks_x * blocks_y, 16, channels), blocks_x, blocks_y
+
+
+def _to_565(colors: np.ndarray) -> np.ndarray:
+    """
+    将RGB颜色量化为RGB565
+    :param colors: 形状为(块数, 3)的0~255颜色
+    :return: uint16数组
+    """
+    r = np.clip(np.rint(colors[:, 0] * 31 / 255), 0, 31).astype(np.uint16)
+    g = np.clip(np.rint(colors[:, 1] * 63 / 255), 0, 63).astype(np.uint16)
+    b = np.clip(np.rint(colors[:, 2] * 31 / 255), 0, 31).astype(np.uint16)
+    return (r << 11) | (g << 5) | b
+
+
+def _from_565(values: np.ndarray) -> np.ndarray:
+    """
+    将RGB565展开为0~255的RGB颜色
+    :param values: uint16数组
+    :return: 形状为(块数, 3)的float32数组
+    """
+    r = (values >> 11) & 31
+    g = (values >> 5) & 63
+    b = values & 31
+    return np.stack([r * 255 / 31, g * 255 / 63, b * 255 / 31], axis=1).astype(np.float32)
+
+
+def encode_bc1(array: np.ndarray) -> bytes:
+    """
+    将图像编码为BC1(不透明)。每个像素块沿颜色主轴选取端点，所有像素块通过NumPy一次算出。
+    :param array: 形状为(高, 宽, 3或4)的uint8数组，透明度通道会被忽略
+    :return: BC1数据
+    """
+    blocks, _, _ = _blocks(array[:, :, :3])
+    pixels = blocks.astype(np.float32)
+
+    # 用幂迭代求出每个像素块颜色分布的主轴
+    mean = pixels.mean(axis=1, keepdims=True)
+    centered = pixels - mean
+    covariance = np.einsum("nki,nkj->nij", centered, centered)
+    axis = pixels.max(axis=1) - pixels.min(axis=1) + 1e-3
+    for _ in range(4):
+        axis = np.einsum("nij,nj->ni", covariance, axis)
+        axis /= np.maximum(np.linalg.norm(axis, axis=1, keepdims=True), 1e-6)
+
+    projection = np.einsum("nki,ni->nk", centered, axis)
+    rows = np.arange(len(pixels))
+    color0 = _to_565(pixels[rows, projection.argmax(axis=1)])
+    color1 = _to_565(pixels[rows, projection.argmin(axis=1)])
+
+    # 4色模式要求color0 > color1
+    swap = color0 < color1
+    color0, color1 = np.where(swap, color1, color0), np.where(swap, color0, color1)
+
+    end0, end1 = _from_565(color0), _from_565(color1)
+    palette = np.stack([end0, end1, (2 * end0 + end1) / 3, (end0 + 2 * end1) / 3], axis=1)
+    distance = ((pixels[:, :, None, :] - palette[:, None, :, :]) ** 2).sum(axis=3)
+    indices = distance.argmin(axis=2).astype(np.uint32)
+    # 两个端点相同时只能使用3色模式，全部使用端点0
+    indices[color0 == color1] = 0
+
+    packed = (indices << (np.arange(16, dtype=np.uint32) * 2)).sum(axis=1, dtype=np.uint32)
+    result = np.zeros(len(pixels), dtype=[("color0", "<u2"), ("color1", "<u2"), ("indices", "<u4")])
+    result["color0"] = color0
+    result["color1"] = color1
+    result["indices"] = packed
+    return result.tobytes()
+
+
+def encode_bc4(array: np.ndarray) -> bytes:
+    """
+    将单通道图像编码为BC4，每个像素块使用最大值与最小值作为端点的8级模式
+    :param array: 形状为(高, 宽)或(高, 宽, 通道数)的uint8数组，多通道时只使用第一个通道
+    :return: BC4数据
+    """
+    if array.ndim == 2:
+        array = array[:, :, None]
+    blocks, _, _ = _blocks(array[:, :, :1])
+    values = blocks[:, :, 0].astype(np.float32)
+
+    high = values.max(axis=1)
+    low = values.min(axis=1)
+    span = np.maximum(high - low, 1e-6)
+    level = np.rint((values - low[:, None]) / span[:, None] * 7).astype(np.uint64)
+    # 等级7对应端点0，等级0对应端点1，其余等级i对应索引8-i
+    indices = np.where(level == 7, 0, np.where(level == 0, 1, 8 - level)).astype(np.uint64)
+    indices[high == low] = 0
+
+    packed = (indices << (np.arange(16, dtype=np.uint64) * 3)).sum(axis=1, dtype=np.uint64)
+    result = np.zeros((len(values), 8), dtype=np.uint8)
+    result[:, 0] = high.astype(np.uint8)
+    result[:, 1] = low.astype(np.uint8)
+    for i in range(6):
+        result[:, 2 + i] = (packed >> np.uint64(8 * i)) & np.uint64(0xFF)
+    return result.tobytes()
+
+
+def save_dds(path: str, array: np.ndarray, format: str = 'BC1', mipmaps: bool = True) -> None:
+    """
+    将图像编码为BC1或BC4并保存为DDS文件，可在离线转换资源时使用
+    :param path:    保存路径
+    :param array:   形状为(高, 宽, 通道数)或(高, 宽)的uint8数组
+    :param format:  压缩格式，'BC1'或'BC4'
+    :param mipmaps: 是否生成并保存完整的mipmap链
+    :return: None
+    """
+    if format == 'BC1':
+        encoder, fourcc = encode_bc1, b"DXT1"
+    elif format == 'BC4':
+        encoder, fourcc = encode_bc4, b"ATI1"
+    else:
+        raise ValueError(f"Only BC1 and BC4 can be encoded: {format}")
+    if array.ndim == 2:
+        array = array[:, :, None]
+    if format == 'BC1' and array.shape[2] < 3:
+        array = np.repeat(array[:, :, :1], 3, axis=2)
+
+    height, width = array.shape[:2]
+    levels = [encoder(array)]
+    level = array
+    while mipmaps and max(level.shape[:2]) > 1:
+        size = (max(1, level.shape[1] // 2), max(1, level.shape[0] // 2))
+        level = soup3D.shader.resize_image(level, size, soup3D.name.BOX)
+        levels.append(encoder(level))
+
+    flags = 0x1 | 0x2 | 0x4 | 0x1000 | 0x80000  # CAPS | HEIGHT | WIDTH | PIXELFORMAT | LINEARSIZE
+    caps = 0x1000  # TEXTURE
+    if len(levels) > 1:
+        flags |= 0x20000  # MIPMAPCOUNT
+        caps |= 0x400008  # MIPMAP | COMPLEX
+    header = struct.pack("<4s7I44x", DDS_MAGIC, 124, flags, height, width, len(levels[0]), 0, len(levels))
+    pixel_format = struct.pack("<2I4s5I", 32, 0x4, fourcc, 0, 0, 0, 0, 0)
+    header += pixel_format + struct.pack("<5I", caps, 0, 0, 0, 0)
+
+    with open(path, "wb") as file:
+        file.write(header)
+        for data in levels:
+            file.write(data)
@@ -0,0 +1,173 @@
+"""
+调用：soup3D.deferred
+延迟渲染，几何阶段将所有模型的基础颜色、法线、自发光与深度写入G缓冲区，光照阶段再通过一个覆盖全屏的三角形逐像素计算光照，光照开
+销只与像素数量和光源数量有关，不受重叠绘制影响。开启分簇光照时，光照阶段每个像素只计算所在簇的光源。
+延迟渲染不支持半透明混合，所有表面都按不透明绘制，开启alpha_test的材质仍会丢弃不透明度低于0.5的片段。
+"""
+from OpenGL.GL import *
+from pyglm import glm
+
+import soup3D
+import soup3D.shader
+import soup3D.state
+
+__all__ : list[str] = [
+    "use_deferred", "get_stats",
+]
+
+enabled = False        # 是否使用延迟渲染，由soup3D.init设置
+
+# G缓冲区
+ALBEDO_UNIT = 0        # 光照阶段读取基础颜色的纹理单元
+NORMAL_UNIT = 1        # 光照阶段读取法线的纹理单元
+EMISSION_UNIT = 2      # 光照阶段读取自发光的纹理单元
+DEPTH_UNIT = 3         # 光照阶段读取深度的纹理单元
+
+fbo = None             # G缓冲区帧缓冲
+textures = None        # [基础颜色, 法线, 自发光, 深度]纹理
+size = (0, 0)          # G缓冲区尺寸
+
+# 光照阶段
+programs = {}          # 是否使用分簇光照 -> 光照阶段的着色器程序
+vao = None             # 绘制全屏三角形使用的空顶点数组对象
+
+light_pass_count = 0   # 执行光照阶段的次数
+
+
+def use_deferred(enable: bool = True) -> None:
+    """
+    开启或关闭延迟渲染，由soup3D.init根据renderer参数调用。需在创建材质前调用，已创建的材质会保持原有的着色器变体。
+    :param enable: 是否开启延迟渲染
+    :return: None
+    """
+    global enabled
+    enabled = enable
+
+
+def _allocate(width: int, height: int) -> None:
+    """
+    创建或按窗口尺寸重建G缓冲区
+    :param width:  G缓冲区宽度
+    :param height: G缓冲区高度
+    :return: None
+    """
+    global fbo, textures, size
+
+    if fbo is not None:
+        soup3D.state.delete_textures(textures)
+        glDeleteFramebuffers(1, [fbo])
+
+    # (内部格式, 格式, 数据类型, 附着点)
+    layouts = (
+        (GL_RGBA8, GL_RGBA, GL_UNSIGNED_BYTE, GL_COLOR_ATTACHMENT0),
+        (GL_RGBA16F, GL_RGBA, GL_FLOAT, GL_COLOR_ATTACHMENT1),
+        (GL_RGBA16F, GL_RGBA, GL_FLOAT, GL_COLOR_ATTACHMENT2),
+        (GL_DEPTH_COMPONENT24, GL_DEPTH_COMPONENT, GL_FLOAT, GL_DEPTH_ATTACHMENT),
+    )
+
+    fbo = glGenFramebuffers(1)
+    glBindFramebuffer(GL_FRAMEBUFFER, fbo)
+    textures = list(glGenTextures(len(layouts)))
+    for texture, (internal_format, pixel_format, data_type, attachment) in zip(textures, layouts):
+        soup3D.state.bind_texture(ALBEDO_UNIT, GL_TEXTURE_2D, texture)
+        glTexImage2D(GL_TEXTURE_2D, 0, internal_format, width, height, 0, pixel_format, data_type, None)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, attachment, GL_TEXTURE_2D, texture, 0)
+
+    glDrawBuffers(3, [GL_COLOR_ATTACHMENT0, GL_COLOR_ATTACHMENT1, GL_COLOR_ATTACHMENT2])
+    status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+    glBindFramebuffer(GL_FRAMEBUFFER, 0)
+    if status != GL_FRAMEBUFFER_COMPLETE:
+        raise Exception(f"G-buffer framebuffer incomplete: {status}")
+
+    size = (width, height)
+
+
+def _get_program(clustered: bool) -> soup3D.shader.ShaderProgram:
+    """
+    获取光照阶段的着色器程序，分簇与不分簇各编译一次
+    :param clustered: 是否使用分簇光照
+    :return: 着色器程序
+    """
+    program = programs.get(clustered)
+    if program is not None:
+        return program
+
+    defines = [f"#define MAX_LIGHTS {soup3D.shader.MAX_LIGHT_CAPACITY}"]
+    if clustered:
+        defines.append("#define CLUSTERED")
+    header = "#version 330 core\n" + "\n".join(defines) + "\n"
+    program = soup3D.shader.ShaderProgram(
+        soup3D.shader.DEFERRED_VERTEX_SHADER,
+        header + soup3D.shader.DEFERRED_FRAGMENT_SHADER
+    )
+    program.uniform("gAlbedo", soup3D.INT_VEC1, ALBEDO_UNIT)
+    program.uniform("gNormal", soup3D.INT_VEC1, NORMAL_UNIT)
+    program.uniform("gEmission", soup3D.INT_VEC1, EMISSION_UNIT)
+    program.uniform("gDepth", soup3D.INT_VEC1, DEPTH_UNIT)
+    if clustered:
+        program.uniform("lightData", soup3D.INT_VEC1, soup3D.light.LIGHT_DATA_UNIT)
+        program.uniform("clusterRanges", soup3D.INT_VEC1, soup3D.light.CLUSTER_RANGES_UNIT)
+        program.uniform("clusterLights", soup3D.INT_VEC1, soup3D.light.CLUSTER_LIGHTS_UNIT)
+    program.uniform("shadowMaps", soup3D.INT_VEC1, soup3D.shadow.SHADOW_UNIT)
+    programs[clustered] = program
+    return program
+
+
+def begin_geometry() -> None:
+    """
+    自动调用函数，无需手动调用。开始几何阶段，绑定并清空G缓冲区，窗口尺寸变化时重建G缓冲区。
+    :return: None
+    """
+    width, height = int(soup3D.proj_width), int(soup3D.proj_height)
+    if fbo is None or size != (width, height):
+        _allocate(width, height)
+
+    glBindFramebuffer(GL_FRAMEBUFFER, fbo)
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+    # G缓冲区中的法线与自发光不能参与混合
+    soup3D.state.disable(GL_BLEND)
+
+
+def light_pass() -> None:
+    """
+    自动调用函数，无需手动调用。结束几何阶段，切换回默认帧缓冲，读取G缓冲区并计算光照
+    :return: None
+    """
+    global vao, light_pass_count
+
+    glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+    program = _get_program(soup3D.light.clustered)
+    view_proj = soup3D.get_projection_mat() * soup3D.camera.get_view_mat()
+    program.uniform("invViewProj", soup3D.ARRAY_MATRIX_VEC4, 1, GL_FALSE, glm.value_ptr(glm.inverse(view_proj)))
+    program.use()
+    program.update()
+
+    for unit, texture in zip((ALBEDO_UNIT, NORMAL_UNIT, EMISSION_UNIT, DEPTH_UNIT), textures):
+        soup3D.state.bind_texture(unit, GL_TEXTURE_2D, texture)
+
+    if vao is None:
+        vao = glGenVertexArrays(1)
+    soup3D.state.bind_vertex_array(vao)
+
+    soup3D.state.disable(GL_DEPTH_TEST)
+    glDrawArrays(GL_TRIANGLES, 0, 3)
+    soup3D.state.enable(GL_DEPTH_TEST)
+    soup3D.state.enable(GL_BLEND)
+
+    soup3D.state.bind_vertex_array(0)
+    program.unuse()
+    light_pass_count += 1
+
+
+def get_stats() -> dict:
+    """
+    获取延迟渲染统计
+    :return: {"enabled": 是否使用延迟渲染, "size": G缓冲区尺寸, "light_passes": 执行光照阶段的次数}
+    """
+    return {"enabled": enabled, "size": size, "light_passes": light_pass_count}
@@ -0,0 +1,245 @@
+"""
+调用：soup3D.diskcache
+解码结果的磁盘缓存。设置缓存目录后，从文件或内存解码的图像与混合通道贴图的混合结果，连同逐级缩小一半生成的mipmap，按原始数据的摘要
+与参数保存为未压缩的数组文件。之后的运行直接通过np.memmap映射缓存文件，不再解码图像，纹理也直接从映射上传。
+每条缓存由“<摘要>.bin”(所有级别的像素依次排列)与“<摘要>.json”(各级数组形状)组成，写入时先写临时文件再替换，json最后写入，中断的写
+入不会被读取。
+"""
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+import imageio.v2 as imageio
+
+import soup3D.name
+import soup3D.shader
+
+__all__ : list[str] = [
+    "set_cache_dir", "imread", "clear", "get_stats",
+]
+
+CACHE_VERSION = 1      # 缓存格式版本，格式或mipmap生成方式改变时递增，旧缓存会被忽略
+
+cache_dir = None       # 缓存目录，None表示不使用磁盘缓存
+enabled = False        # 是否使用磁盘缓存
+file_keys = {}         # (文件路径, 修改时间, 文件大小) -> 文件内容摘要，避免同一次运行中重复读取文件
+key_locks = {}         # 缓存键 -> 写入该缓存时持有的锁，多个解码线程可能同时写入同一条缓存
+lock = threading.Lock()  # 保护key_locks与统计计数，解码线程与主线程都会访问
+
+hit_count = 0          # 从缓存映射的次数
+miss_count = 0         # 缓存不存在的次数
+store_count = 0        # 写入缓存的次数
+store_bytes = 0        # 写入缓存的总字节数
+
+
+def set_cache_dir(path: str | None) -> None:
+    """
+    设置缓存目录，目录不存在时自动创建
+    :param path: 缓存目录，None表示不使用磁盘缓存
+    :return: None
+    """
+    global cache_dir, enabled
+
+    if path is not None:
+        os.makedirs(path, exist_ok=True)
+    cache_dir = path
+    enabled = path is not None
+
+
+def _digest(*parts: bytes) -> str:
+    """
+    计算缓存键
+    :param parts: 参与计算的数据
+    :return: 摘要字符串
+    """
+    digest = hashlib.sha1(f"soup3D-diskcache-{CACHE_VERSION}".encode())
+    for part in parts:
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def file_key(path: str) -> str:
+    """
+    获取文件内容对应的缓存键，同一次运行中文件未修改时只读取一次
+    :param path: 文件路径
+    :return: 缓存键
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    stamp = (path, stat.st_mtime_ns, stat.st_size)
+    key = file_keys.get(stamp)
+    if key is None:
+        with open(path, "rb") as f:
+            key = _digest(b"file", f.read())
+        file_keys[stamp] = key
+    return key
+
+
+def source_key(image: "soup3D.shader.Img") -> str:
+    """
+    获取贴图或混合通道贴图的缓存键，混合通道贴图的键由各通道来源的键与缩放参数组成，不需要解码来源贴图
+    :param image: 贴图或混合通道贴图
+    :return: 缓存键
+    """
+    if isinstance(image, soup3D.shader.Texture):
+        if image.image_path:
+            return file_key(image.image_path)
+        header = f"bytes|{image.width}|{image.height}|{image.format}|".encode()
+        return _digest(header, bytes(image.image_data))
+
+    parts = ["mix", f"{image.resize[0]}x{image.resize[1]}", image.resample]
+    for source in (image.R, image.G, image.B, image.A):
+        if isinstance(source, soup3D.shader.Channel):
+            parts.append(f"{source_key(source.texture)}:{source.channelID}")
+        else:
+            parts.append(repr(float(source)))
+    return _digest("|".join(parts).encode())
+
+
+def _paths(key: str) -> tuple[str, str]:
+    """
+    获取缓存文件路径
+    :param key: 缓存键
+    :return: (像素文件路径, 形状文件路径)
+    """
+    return os.path.join(cache_dir, key + ".bin"), os.path.join(cache_dir, key + ".json")
+
+
+def load(key: str) -> list[np.ndarray] | None:
+    """
+    映射缓存文件，不读取像素数据
+    :param key: 缓存键
+    :return: 各级mipmap的只读数组，第0级为原图；缓存不存在时返回None
+    """
+    global hit_count, miss_count
+
+    data_path, header_path = _paths(key)
+    try:
+        with open(header_path, "r", encoding="utf-8") as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        with lock:
+            miss_count += 1
+        return None
+    if header.get("version") != CACHE_VERSION:
+        with lock:
+            miss_count += 1
+        return None
+
+    mapping = np.memmap(data_path, dtype=np.uint8, mode="r")
+    levels = []
+    offset = 0
+    for shape in header["levels"]:
+        size = int(np.prod(shape))
+        levels.append(mapping[offset:offset + size].reshape(shape))
+        offset += size
+    with lock:
+        hit_count += 1
+    return levels
+
+
+def _key_lock(key: str) -> threading.Lock:
+    """
+    获取写入某条缓存时持有的锁
+    :param key: 缓存键
+    :return: 锁
+    """
+    with lock:
+        return key_locks.setdefault(key, threading.Lock())
+
+
+def store(key: str, array: np.ndarray) -> list[np.ndarray]:
+    """
+    生成mipmap并写入缓存，之后返回缓存文件的映射
+    :param key:   缓存键
+    :param array: 形状为(高, 宽)或(高, 宽, 通道数)的uint8数组
+    :return: 各级mipmap的只读数组，第0级为原图
+    """
+    global store_count, store_bytes
+
+    header_path = _paths(key)[1]
+    with _key_lock(key):
+        # 其它线程可能已写入这条缓存，并且其像素文件可能正被映射，不再替换
+        if os.path.exists(header_path):
+            levels = load(key)
+            if levels is not None:
+                return levels
+        size = _write(key, array)
+
+    with lock:
+        store_count += 1
+        store_bytes += size
+    return load(key)
+
+
+def _write(key: str, array: np.ndarray) -> int:
+    """
+    生成mipmap并写入缓存文件，调用时需持有该缓存键的锁
+    :param key:   缓存键
+    :param array: 形状为(高, 宽)或(高, 宽, 通道数)的uint8数组
+    :return: 写入的字节数
+    """
+    levels = [np.ascontiguousarray(array)]
+    while max(levels[-1].shape[:2]) > 1:
+        height, width = levels[-1].shape[:2]
+        levels.append(soup3D.shader.resize_image(
+            levels[-1], (max(1, width // 2), max(1, height // 2)), soup3D.name.BOX
+        ))
+    header = {"version": CACHE_VERSION, "levels": [list(level.shape) for level in levels]}
+
+    # 临时文件按进程与线程区分，多个进程可能共用同一个缓存目录
+    data_path, header_path = _paths(key)
+    suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(data_path + suffix, "wb") as f:
+        for level in levels:
+            f.write(np.ascontiguousarray(level).tobytes())
+    os.replace(data_path + suffix, data_path)
+    with open(header_path + suffix, "w", encoding="utf-8") as f:
+        json.dump(header, f)
+    os.replace(header_path + suffix, header_path)
+    return sum(level.nbytes for level in levels)
+
+
+def imread(source: str | bytes) -> tuple[np.ndarray, list[np.ndarray] | None]:
+    """
+    解码图像文件或内存中的图像，使用磁盘缓存时优先映射缓存文件
+    :param source: 文件路径或图像文件的二进制数据
+    :return: (像素数组, 各级mipmap)，不使用磁盘缓存或图像不是8位时各级mipmap为None
+    """
+    if not enabled:
+        return imageio.imread(source), None
+
+    key = file_key(source) if isinstance(source, str) else _digest(b"file", source)
+    levels = load(key)
+    if levels is None:
+        array = imageio.imread(source)
+        if array.dtype != np.uint8:
+            return array, None
+        levels = store(key, array)
+    return levels[0], levels
+
+
+def clear() -> None:
+    """
+    删除缓存目录中的所有缓存文件
+    :return: None
+    """
+    if cache_dir is None:
+        return
+    for name in os.listdir(cache_dir):
+        if name.endswith((".bin", ".json")):
+            os.remove(os.path.join(cache_dir, name))
+
+
+def get_stats() -> dict:
+    """
+    获取磁盘缓存统计
+    :return: {"hits": 从缓存映射的次数, "misses": 缓存不存在的次数, "stores": 写入缓存的次数, "bytes": 写入缓存的总字节数}
+    """
+    return {
+        "hits": hit_count,
+        "misses": miss_count,
+        "stores": store_count,
+        "bytes": store_bytes,
+    }
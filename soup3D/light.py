@@ -4,12 +4,13 @@
 """
 from OpenGL.GL import *
 from math import *
+import numpy as np
 
 import soup3D
 
 
 __all__ : list[str] = [
-    "Cone", "Direct", "ambient"
+    "LightEnv", "Cone", "Direct", "ambient", "use_clustered", "get_stats"
 ]
 
 dirty = False
@@ -17,13 +18,116 @@ EAU = []
 
 light_queue = {}
 
+# 光源统一缓冲区的std140布局：头部为环境光与光源数量，之后每个光源占4个vec4
+HEADER_DTYPE = np.dtype([
+    ("ambient", np.float32, 3),
+    ("count", np.int32),
+    ("grid", np.int32, 4),      # xyz: 分簇网格尺寸
+    ("params", np.float32, 4),  # x: 近裁剪面，y: 远裁剪面，z: 视口宽度，w: 视口高度
+])
+LIGHT_DTYPE = np.dtype([
+    ("position", np.float32, 4),   # xyz: 光源位置，w: 光源类型(0: 锥形光线, 1: 方向光)
+    ("direction", np.float32, 4),  # xyz: 光源朝向，w: 线性衰减率
+    ("color", np.float32, 4),      # rgb: 光源颜色，w: 锥角一半的余弦值
+    ("shadow", np.float32, 4),     # x: 首个阴影层，y: 阴影层数量(0表示不投射阴影)
+])
+
+ubo = None  # 光源统一缓冲区
+
+# 分簇光照
+clustered = False           # 是否使用分簇光照
+cluster_grid = (16, 9, 24)  # 分簇网格尺寸(x, y, z)，z方向按视图空间深度指数划分
+LIGHT_CUTOFF = 255.0        # 锥形光线衰减到1/(1+LIGHT_CUTOFF)以下时视为无影响，用于计算光源影响半径
+
+LIGHT_DATA_UNIT = 5         # 所有光源数据所在的纹理单元
+CLUSTER_RANGES_UNIT = 6     # 每个簇的光源范围所在的纹理单元
+CLUSTER_LIGHTS_UNIT = 7     # 按簇排列的光源索引所在的纹理单元
+
+cluster_buffers = None      # [光源数据, 簇范围, 簇光源索引]的纹理缓冲区
+cluster_textures = None     # 对应的缓冲区纹理
+camera_version = -1         # 上次分簇时的相机版本
+
+# 逐模型光源选择
+MODEL_LIGHT_COUNT = 8       # 每个模型最多使用的光源数量
+packed_all = np.zeros(0, dtype=LIGHT_DTYPE)     # 所有点亮的光源
+packed_lights = np.zeros(0, dtype=LIGHT_DTYPE)  # 光源统一缓冲区中的光源
+
+ambient_uploaded = -1       # 光源统一缓冲区中环境光对应的环境光版本
+params_uploaded = None      # 光源统一缓冲区头部的(近裁剪面, 远裁剪面, 视口宽度, 视口高度)
+
+# 逐光源变化追踪
+slots = {}                  # 光源id -> 光源在packed_all中的序号
+changed_lights = {}         # 光源id -> 自上次上传后变化的光源
+changed_moved = False       # 变化的光源中是否有光源移动或转向
+recolored = {}              # 光源在packed_all中的序号 -> 自上次布局变化后只改变颜色的光源的光源版本
+color_version = 0           # 颜色版本，有光源只改变颜色时递增
+full_uploads = 0            # 重新打包所有光源的次数
+row_uploads = 0             # 只上传单个光源的次数
+
+
+class LightEnv:
+    def __init__(self, lights: dict):
+        """
+        光照环境，在CPU端保存环境光、所有光源与版本号。着色器使用的光照数据全部由它打包上传，帧循环中不通过glGet读取GL状态，也不
+        依赖核心模式下不可用的固定管线光照状态。
+        :param lights: 光源id -> 光源的字典
+        """
+        self.ambient = (0.2, 0.2, 0.2)  # 环境光颜色
+        self.lights = lights            # 所有光源，包括熄灭的光源
+        self.ambient_version = 0        # 环境光版本，环境光每次变化时递增
+        self.version = 0                # 光源布局版本，光源位置、朝向或数量变化时递增，只改变颜色时不变
+
+    def set_ambient(self, R: int | float, G: int | float, B: int | float) -> None:
+        """
+        更改环境光颜色
+        :param R: 红色环境光
+        :param G: 绿色环境光
+        :param B: 蓝色环境光
+        :return: None
+        """
+        self.ambient = (R, G, B)
+        self.ambient_version += 1
+
+    def get_ambient(self) -> tuple[int | float, int | float, int | float]:
+        """
+        获取环境光颜色
+        :return: 环境光颜色(R, G, B)
+        """
+        return self.ambient
+
+    def get_lights(self) -> list:
+        """
+        获取所有点亮的光源，顺序与打包后的光源数组相同
+        :return: 光源列表
+        """
+        return [light for light in self.lights.values() if light.on]
+
+    def get_versions(self) -> tuple[int, int]:
+        """
+        获取环境光版本与光源布局版本，可用于判断缓存的光照结果是否过期
+        :return: (环境光版本, 光源布局版本)
+        """
+        return self.ambient_version, self.version
+
+    def bump(self) -> None:
+        """
+        递增光源布局版本，在光源位置、朝向或数量变化后调用
+        :return: None
+        """
+        self.version += 1
+        recolored.clear()
+
+
+environment = LightEnv(light_queue)  # 当前场景的光照环境
+
 
 class Cone:
     def __init__(self,
                  place: tuple[int | float, int | float, int | float],
                  toward: tuple[int | float, int | float, int | float],
                  color: tuple[int | float, int | float, int | float],
-                 attenuation: float, angle=180):
+                 attenuation: float, angle=180,
+                 shadow: bool = False):
         """
         锥形光线，类似灯泡光线
         :param place:        光源位置(x, y, z)
@@ -31,15 +135,18 @@ class Cone:
         :param color:        光源颜色(red, green, blue)
         :param attenuation:  线性衰减率
         :param angle:        锥形光线锥角
+        :param shadow:       是否投射阴影，使用一张透视阴影贴图，锥角超过170度时阴影只覆盖中间170度
         """
         global dirty
 
         self.on = False
+        self.version = 0  # 光源版本，光源每次变化时递增
         self.place = place
         self.toward = toward
         self.color = color
         self.attenuation = attenuation
         self.angle = angle
+        self.shadow = shadow
 
         light_queue[id(self)] = self
         if not dirty:
@@ -67,11 +174,8 @@ class Cone:
         :param z: 光源z坐标
         :return: None
         """
-        global dirty
-
         self.place = (x, y, z)
-        if not dirty:
-            dirty = True
+        _changed(self, True)
 
     def turn(self, yaw : int | float, pitch : int | float, roll : int | float) -> None:
         """
@@ -81,11 +185,8 @@ class Cone:
         :param roll:  光线横滚角度
         :return: None
         """
-        global dirty
-
         self.toward = (yaw, pitch, roll)
-        if not dirty:
-            dirty = True
+        _changed(self, True)
 
     def dye(self, r : int | float, g : int | float, b : int | float) -> None:
         """
@@ -95,11 +196,8 @@ class Cone:
         :param b: 蓝色
         :return: None
         """
-        global dirty
-
         self.color = (r, g, b)
-        if not dirty:
-            dirty = True
+        _changed(self, False)
 
     def turn_off(self) -> None:
         """
@@ -123,6 +221,18 @@ class Cone:
         if not dirty:
             dirty = True
 
+    def set_shadow(self, enable: bool = True) -> None:
+        """
+        开启或关闭该光源的阴影
+        :param enable: 是否投射阴影
+        :return: None
+        """
+        global dirty
+
+        self.shadow = enable
+        if not dirty:
+            dirty = True
+
     def destroy(self) -> None:
         """
         摧毁光源，并归还光源编号
@@ -131,6 +241,7 @@ class Cone:
         global dirty
 
         del light_queue[id(self)]
+        soup3D.shadow.forget(self)
         if not dirty:
             dirty = True
 
@@ -138,17 +249,21 @@ class Cone:
 class Direct:
     def __init__(self,
                  toward: tuple[int | float, int | float, int | float],
-                 color: tuple[int | float, int | float, int | float]) -> None:
+                 color: tuple[int | float, int | float, int | float],
+                 shadow: bool = False) -> None:
         """
         方向光线，类似太阳光线
         :param toward: 光源朝向(yaw, pitch, roll)
         :param color:  光源颜色(red, green, blue)
+        :param shadow: 是否投射阴影，使用按视锥划分的多级阴影贴图
         """
         global dirty
 
         self.on = False
+        self.version = 0  # 光源版本，光源每次变化时递增
         self.toward = toward
         self.color = color
+        self.shadow = shadow
 
         light_queue[id(self)] = self
         if not dirty:
@@ -174,11 +289,8 @@ class Direct:
         :param roll:  光线横滚角度
         :return: None
         """
-        global dirty
-
         self.toward = (yaw, pitch, roll)
-        if not dirty:
-            dirty = True
+        _changed(self, True)
 
     def dye(self, r : int | float, g : int | float, b : int | float) -> None:
         """
@@ -188,11 +300,8 @@ class Direct:
         :param b: 蓝色
         :return: None
         """
-        global dirty
-
         self.color = (r, g, b)
-        if not dirty:
-            dirty = True
+        _changed(self, False)
 
     def turn_off(self) -> None:
         """
@@ -216,6 +325,18 @@ class Direct:
         if not dirty:
             dirty = True
 
+    def set_shadow(self, enable: bool = True) -> None:
+        """
+        开启或关闭该光源的阴影
+        :param enable: 是否投射阴影
+        :return: None
+        """
+        global dirty
+
+        self.shadow = enable
+        if not dirty:
+            dirty = True
+
     def destroy(self) -> None:
         """
         摧毁光源，并归还光源编号
@@ -224,37 +345,470 @@ class Direct:
         global dirty
 
         del light_queue[id(self)]
+        soup3D.shadow.forget(self)
         if not dirty:
             dirty = True
 
 
+def _changed(light, moved: bool) -> None:
+    """
+    记录单个光源的变化，下一帧只重新上传变化的光源。光源的点亮、熄灭、创建与摧毁会改变光源序号，仍会重新打包所有光源。
+    :param light: 变化的光源
+    :param moved: 光源是否移动或转向，为False时表示只改变了颜色
+    :return: None
+    """
+    global changed_moved
+
+    light.version += 1
+    changed_lights[id(light)] = light
+    if moved:
+        changed_moved = True
+
+
 def ambient(R: int | float, G: int | float, B: int | float) -> None:
     """
-    更改环境光亮度
+    更改环境光亮度，只修改CPU端的光照环境，下一帧只重新写入光源统一缓冲区头部的环境光
     :param R: 红色环境光
     :param G: 绿色环境光
     :param B: 蓝色环境光
     :return: None
     """
-    global dirty
+    environment.set_ambient(R, G, B)
+
 
-    glLightModelfv(GL_LIGHT_MODEL_AMBIENT, (R, G, B, 1))
+def use_clustered(enable: bool = True, grid: tuple[int, int, int] = (16, 9, 24)) -> None:
+    """
+    开启或关闭分簇光照。开启后每帧按视锥网格对光源分簇，每个片段只计算所在簇的光源，光源数量不再受材质的最多光源数量限制。需在创
+    建材质前调用，已创建的材质会保持原有的着色器变体。
+    :param enable: 是否开启分簇光照
+    :param grid:   分簇网格尺寸(x, y, z)
+    :return: None
+    """
+    global clustered, cluster_grid, dirty
+
+    clustered = enable
+    cluster_grid = tuple(grid)
     dirty = True
 
 
+def upload() -> None:
+    """
+    自动调用函数，无需手动调用。每帧绑定光源统一缓冲区，有光源变动时重新打包并上传光源数据。开启分簇光照时，相机变化后也会重新分
+    簇。
+    :return: None
+    """
+    global ubo
+
+    if ubo is None:
+        ubo = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, ubo)
+        size = HEADER_DTYPE.itemsize + LIGHT_DTYPE.itemsize * soup3D.shader.MAX_LIGHT_CAPACITY
+        glBufferData(GL_UNIFORM_BUFFER, size, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        set_surface_light()
+
+    # 每帧重新绑定，避免外部代码修改绑定点
+    glBindBufferBase(GL_UNIFORM_BUFFER, soup3D.shader.LIGHT_BINDING, ubo)
+
+    if dirty:
+        set_surface_light()
+    else:
+        if changed_lights:
+            upload_changed()
+        if ambient_uploaded != environment.ambient_version:
+            _upload_ambient()
+        if params_uploaded != _cluster_params():
+            _upload_params()
+        if clustered and camera_version != soup3D.camera.version:
+            _update_clusters()
+
+    if clustered and cluster_textures is not None:
+        soup3D.state.bind_texture(LIGHT_DATA_UNIT, GL_TEXTURE_BUFFER, cluster_textures[0])
+        soup3D.state.bind_texture(CLUSTER_RANGES_UNIT, GL_TEXTURE_BUFFER, cluster_textures[1])
+        soup3D.state.bind_texture(CLUSTER_LIGHTS_UNIT, GL_TEXTURE_BUFFER, cluster_textures[2])
+
+
+def _upload_ambient() -> None:
+    """
+    只将环境光写入光源统一缓冲区的头部，环境光变化时不重新打包光源
+    :return: None
+    """
+    global ambient_uploaded
+
+    data = np.asarray(environment.ambient, dtype=np.float32).tobytes()
+    glBindBuffer(GL_UNIFORM_BUFFER, ubo)
+    glBufferSubData(GL_UNIFORM_BUFFER, HEADER_DTYPE.fields["ambient"][1], len(data), data)
+    glBindBuffer(GL_UNIFORM_BUFFER, 0)
+    ambient_uploaded = environment.ambient_version
+
+
+def _cluster_params() -> tuple[float, float, float, float]:
+    """
+    获取当前的分簇参数
+    :return: (近裁剪面, 远裁剪面, 视口宽度, 视口高度)
+    """
+    return soup3D.proj_near, soup3D.proj_far, soup3D.proj_width, soup3D.proj_height
+
+
+def _upload_params() -> None:
+    """
+    只将分簇参数写入光源统一缓冲区的头部，窗口尺寸或透视参数变化后片段才能落入正确的簇
+    :return: None
+    """
+    global params_uploaded
+
+    params_uploaded = _cluster_params()
+    data = np.asarray(params_uploaded, dtype=np.float32).tobytes()
+    glBindBuffer(GL_UNIFORM_BUFFER, ubo)
+    glBufferSubData(GL_UNIFORM_BUFFER, HEADER_DTYPE.fields["params"][1], len(data), data)
+    glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+
+def _pack_row(packed: np.ndarray, i: int, light) -> None:
+    """
+    将单个光源的位置、朝向与颜色写入打包后的光源数组，阴影层保持不变
+    :param packed: 光源数组，数据类型为LIGHT_DTYPE
+    :param i:      光源序号
+    :param light:  光源
+    :return: None
+    """
+    direction = light._calc_direction()
+    if isinstance(light, Cone):
+        # 锥形光线
+        packed[i]["position"] = (*light.place, 0.0)
+        packed[i]["direction"] = (*direction, light.attenuation)
+        packed[i]["color"] = (*light.color, cos(radians(light.angle / 2)))
+    else:
+        # 方向光
+        packed[i]["position"] = (0.0, 0.0, 0.0, 1.0)
+        packed[i]["direction"] = (*direction, 0.0)
+        packed[i]["color"] = (*light.color, 0.0)
+
+
+def pack_lights(limit: int | None = None) -> np.ndarray:
+    """
+    将点亮的光源打包为std140布局的结构化数组
+    :param limit: 最多打包的光源数量，None表示不限制
+    :return: 光源数组，数据类型为LIGHT_DTYPE
+    """
+    lights = environment.get_lights()
+    if limit is not None:
+        lights = lights[:limit]
+    packed = np.zeros(len(lights), dtype=LIGHT_DTYPE)
+    packed["shadow"][:, :2] = soup3D.shadow.assign_layers(lights)
+    for i, light in enumerate(lights):
+        _pack_row(packed, i, light)
+    return packed
+
+
 def set_surface_light():
     """
-    自动调用函数，无需手动调用。在有光源变动时让所有着色器响应。
+    自动调用函数，无需手动调用。在有光源变动时打包所有光源，并通过一次缓冲区更新上传到光源统一缓冲区。开启分簇光照时同时上传所有
+    光源与分簇结果。
     :return: None
     """
-    global dirty
+    global dirty, packed_all, packed_lights, slots, changed_moved, full_uploads, ambient_uploaded, params_uploaded
 
     soup3D.shader.light_queue = light_queue
-    for surface_id in soup3D.shader.set_mat_queue:
-        surface = soup3D.shader.set_mat_queue[surface_id]
-        if hasattr(surface, "set_light"):
-            surface.set_light()
+
+    slots = {id(light): i for i, light in enumerate(environment.get_lights())}
+    packed_all = pack_lights()
+    packed_lights = packed_all[:soup3D.shader.MAX_LIGHT_CAPACITY]
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header[0]["ambient"] = environment.ambient
+    header[0]["count"] = len(packed_lights)
+    header[0]["grid"] = (*cluster_grid, 0)
+    params_uploaded = _cluster_params()
+    header[0]["params"] = params_uploaded
+    data = header.tobytes() + packed_lights.tobytes()
+
+    glBindBuffer(GL_UNIFORM_BUFFER, ubo)
+    glBufferSubData(GL_UNIFORM_BUFFER, 0, len(data), data)
+    glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+    if clustered:
+        _update_clusters()
+
+    environment.bump()
+    ambient_uploaded = environment.ambient_version
     dirty = False
+    changed_lights.clear()
+    changed_moved = False
+    full_uploads += 1
+
+
+def upload_changed() -> None:
+    """
+    自动调用函数，无需手动调用。只重新打包并上传自上次上传后变化的光源，每个光源通过一次缓冲区更新写入光源统一缓冲区；开启分簇光照
+    时同时更新光源纹理缓冲区，只有光源移动或转向时才重新分簇。
+    :return: None
+    """
+    global changed_moved, row_uploads
+
+    stride = LIGHT_DTYPE.itemsize
+    for light_id, light in changed_lights.items():
+        i = slots.get(light_id)
+        if i is None:
+            continue
+        _pack_row(packed_all, i, light)
+        data = packed_all[i:i + 1].tobytes()
+
+        if i < soup3D.shader.MAX_LIGHT_CAPACITY:
+            glBindBuffer(GL_UNIFORM_BUFFER, ubo)
+            glBufferSubData(GL_UNIFORM_BUFFER, HEADER_DTYPE.itemsize + i * stride, stride, data)
+            glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        if clustered and cluster_buffers is not None:
+            glBindBuffer(GL_TEXTURE_BUFFER, cluster_buffers[0])
+            glBufferSubData(GL_TEXTURE_BUFFER, i * stride, stride, data)
+            glBindBuffer(GL_TEXTURE_BUFFER, 0)
+        row_uploads += 1
+
+    if changed_moved:
+        environment.bump()
+        if clustered:
+            _update_clusters()
+    else:
+        # 只改变颜色时光源序号不变，由各模型的LightSelection判断排名是否变化
+        _record_colors()
+
+    changed_lights.clear()
+    changed_moved = False
+
+
+def _update_clusters() -> None:
+    """
+    重新分簇并上传分簇结果，在光源或相机变化时自动调用
+    :return: None
+    """
+    global camera_version
+
+    ranges, indices = bin_lights(packed_all)
+    _upload_clusters(packed_all, ranges, indices)
+    camera_version = soup3D.camera.version
+
+
+def _record_colors() -> None:
+    """
+    记录只改变颜色的光源及其光源版本，在upload_changed中自动调用
+    :return: None
+    """
+    global color_version
+
+    for light_id, light in changed_lights.items():
+        i = slots.get(light_id)
+        if i is not None and i < len(packed_lights):
+            recolored[i] = light.version
+    color_version += 1
+
+
+class LightSelection:
+    def __init__(self):
+        """
+        模型的光源选择缓存，由Model自动创建。记录选出的光源、它们的贡献与未选出的光源中最大的贡献；只改变颜色时只重新计算变化的光源
+        的贡献，排名不变时沿用原来的选择。
+        """
+        self.indices = np.zeros(0, dtype=np.int32)  # 选出的光源在光源统一缓冲区中的索引
+        self.scores = np.zeros(0, dtype=np.float32)  # 选出的光源的贡献
+        self.runner_up = 0.0   # 未选出的光源中最大的贡献
+        self.count = 0         # 最多选出的光源数量
+        self.color = -1        # 选择时的颜色版本
+        self.seen = {}         # 光源序号 -> 已计算过贡献的光源版本
+
+    def select(self, center: np.ndarray, radius: float, count: int) -> np.ndarray:
+        """
+        重新计算所有光源的贡献并选出贡献最大的光源
+        :param center: 包围球球心的世界坐标(x, y, z)
+        :param radius: 包围球半径
+        :param count:  最多选出的光源数量
+        :return: 光源在光源统一缓冲区中的索引，按贡献从高到低排列
+        """
+        score = score_lights(center, radius, packed_lights)
+        order = np.argsort(-score, kind="stable")[:count]
+        order = order[score[order] > 0]
+        rest = np.ones(len(score), dtype=bool)
+        rest[order] = False
+
+        self.indices = order.astype(np.int32)
+        self.scores = score[order]
+        self.runner_up = float(score[rest].max()) if rest.any() else 0.0
+        self.count = count
+        self.color = color_version
+        self.seen = dict(recolored)
+        return self.indices
+
+    def is_current(self, center: np.ndarray, radius: float) -> bool:
+        """
+        判断只改变颜色的光源是否改变了选择。只重新计算自上次判断后变化的光源的贡献：选出的光源贡献不低于未选出的光源时选择不变。
+        :param center: 包围球球心的世界坐标(x, y, z)
+        :param radius: 包围球半径
+        :return: 选择是否仍然有效
+        """
+        if self.color == color_version:
+            return True
+        for i, version in recolored.items():
+            if self.seen.get(i) == version:
+                continue
+            self.seen[i] = version
+            score = float(score_lights(center, radius, packed_lights[i:i + 1])[0])
+            hit = np.nonzero(self.indices == i)[0]
+            if len(hit):
+                self.scores[hit[0]] = score
+            else:
+                # 之前的次大贡献可能已经变小，保留较大值只会多重新选择一次
+                self.runner_up = max(self.runner_up, score)
+        self.color = color_version
+
+        if len(self.scores) and self.scores.min() <= 0:
+            return False
+        floor = self.scores.min() if len(self.indices) == self.count else 0.0
+        return self.runner_up <= floor
+
+
+def select_lights(center: np.ndarray, radius: float, count: int = MODEL_LIGHT_COUNT) -> np.ndarray:
+    """
+    选出对包围球贡献最大的光源
+    :param center: 包围球球心的世界坐标(x, y, z)
+    :param radius: 包围球半径
+    :param count:  最多选出的光源数量
+    :return: 光源在光源统一缓冲区中的索引，按贡献从高到低排列
+    """
+    score = score_lights(center, radius, packed_lights)
+    order = np.argsort(-score, kind="stable")[:count]
+    return order[score[order] > 0].astype(np.int32)
+
+
+def score_lights(center: np.ndarray, radius: float, lights: np.ndarray) -> np.ndarray:
+    """
+    估算光源对包围球的贡献。锥形光线按亮度、衰减率与到包围球的距离估算贡献，包围球完全位于锥角外时没有贡献；方向光按亮度估算贡
+    献。所有光源的贡献通过NumPy一次算出。
+    :param center: 包围球球心的世界坐标(x, y, z)
+    :param radius: 包围球半径
+    :param lights: 光源数组，数据类型为LIGHT_DTYPE
+    :return: 每个光源的贡献
+    """
+    if len(lights) == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    luminance = lights["color"][:, :3] @ np.array((0.2126, 0.7152, 0.0722), dtype=np.float32)
+    is_cone = lights["position"][:, 3] < 0.5
+    attenuation = lights["direction"][:, 3]
+    direction = lights["direction"][:, :3]
+    cos_half = lights["color"][:, 3]
+
+    offset = np.asarray(center, dtype=np.float32) - lights["position"][:, :3]
+    distance = np.linalg.norm(offset, axis=1)
+    gap = np.maximum(distance - radius, 0.0)
+    score = np.where(is_cone, luminance / (1.0 + attenuation * gap), luminance)
+
+    # 包围球完全位于锥角外的锥形光线没有贡献
+    safe_distance = np.maximum(distance, 1e-6)
+    cos_center = np.einsum("ij,ij->i", offset, direction) / safe_distance
+    center_angle = np.arccos(np.clip(cos_center, -1.0, 1.0))
+    spread = np.arcsin(np.clip(radius / safe_distance, 0.0, 1.0))
+    half_angle = np.arccos(np.clip(cos_half, -1.0, 1.0))
+    outside = is_cone & (distance > radius) & (center_angle - spread > half_angle)
+    score[outside] = 0.0
+    return score
+
+
+def bin_lights(packed: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    按视锥网格对光源分簇。每个锥形光线根据衰减求出影响半径，在视图空间中求出包围球覆盖的簇范围；方向光与不衰减的锥形光线影响所有
+    簇，会被放入最后一个簇。
+    :param packed: 由pack_lights打包的光源数组
+    :return: (每个簇的(光源索引起点, 光源数量)数组, 按簇排列的光源索引数组)
+    """
+    gx, gy, gz = cluster_grid
+    cluster_count = gx * gy * gz
+    near, far = float(soup3D.proj_near), float(soup3D.proj_far)
+    tan_y = tan(radians(soup3D.proj_fov) / 2)
+    tan_x = tan_y * soup3D.proj_width / soup3D.proj_height
+
+    # 计算光源影响半径，方向光与不衰减的锥形光线影响所有簇
+    is_cone = packed["position"][:, 3] < 0.5
+    attenuation = packed["direction"][:, 3]
+    local = is_cone & (attenuation > 0)
+    global_ids = np.nonzero(~local)[0].astype(np.uint32)
+    local_ids = np.nonzero(local)[0]
+    radius = LIGHT_CUTOFF / attenuation[local_ids]
+
+    # 变换到视图空间
+    view = soup3D.ring.pack_mat4(soup3D.camera.get_view_mat()).reshape(4, 4)
+    positions = np.ones((len(local_ids), 4), dtype=np.float32)
+    positions[:, :3] = packed["position"][local_ids, :3]
+    positions = positions @ view
+    x, y, depth = positions[:, 0], positions[:, 1], -positions[:, 2]
+
+    # 剔除视锥外的光源
+    d_min = np.maximum(depth - radius, near)
+    d_max = np.minimum(depth + radius, far)
+    x0 = np.minimum((x - radius) / (d_min * tan_x), (x - radius) / (d_max * tan_x))
+    x1 = np.maximum((x + radius) / (d_min * tan_x), (x + radius) / (d_max * tan_x))
+    y0 = np.minimum((y - radius) / (d_min * tan_y), (y - radius) / (d_max * tan_y))
+    y1 = np.maximum((y + radius) / (d_min * tan_y), (y + radius) / (d_max * tan_y))
+    visible = (d_max > d_min) & (x1 > -1) & (x0 < 1) & (y1 > -1) & (y0 < 1)
+    local_ids, d_min, d_max = local_ids[visible], d_min[visible], d_max[visible]
+    x0, x1, y0, y1 = x0[visible], x1[visible], y0[visible], y1[visible]
+
+    # 求出覆盖的簇范围，z方向按深度指数划分
+    log_range = log(far / near)
+    ix0 = np.clip(np.floor((x0 + 1) / 2 * gx), 0, gx - 1).astype(np.int64)
+    ix1 = np.clip(np.floor((x1 + 1) / 2 * gx), 0, gx - 1).astype(np.int64)
+    iy0 = np.clip(np.floor((y0 + 1) / 2 * gy), 0, gy - 1).astype(np.int64)
+    iy1 = np.clip(np.floor((y1 + 1) / 2 * gy), 0, gy - 1).astype(np.int64)
+    iz0 = np.clip(np.floor(np.log(d_min / near) / log_range * gz), 0, gz - 1).astype(np.int64)
+    iz1 = np.clip(np.floor(np.log(d_max / near) / log_range * gz), 0, gz - 1).astype(np.int64)
+
+    # 展开为(簇, 光源)对
+    nx, ny, nz = ix1 - ix0 + 1, iy1 - iy0 + 1, iz1 - iz0 + 1
+    counts = nx * ny * nz
+    owner = np.repeat(np.arange(len(local_ids)), counts)
+    local_index = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cx = ix0[owner] + local_index % nx[owner]
+    cy = iy0[owner] + local_index // nx[owner] % ny[owner]
+    cz = iz0[owner] + local_index // (nx[owner] * ny[owner])
+    cluster = (cz * gy + cy) * gx + cx
+
+    # 按簇排序
+    order = np.argsort(cluster, kind="stable")
+    indices = np.concatenate([local_ids[owner[order]].astype(np.uint32), global_ids])
+
+    cluster_sizes = np.bincount(cluster, minlength=cluster_count)
+    ranges = np.zeros((cluster_count + 1, 2), dtype=np.uint32)
+    ranges[:cluster_count, 0] = np.cumsum(cluster_sizes) - cluster_sizes
+    ranges[:cluster_count, 1] = cluster_sizes
+    ranges[cluster_count] = (len(indices) - len(global_ids), len(global_ids))
+    return ranges, indices
+
+
+def _upload_clusters(packed: np.ndarray, ranges: np.ndarray, indices: np.ndarray) -> None:
+    """
+    将所有光源与分簇结果上传到纹理缓冲区
+    :param packed:  由pack_lights打包的光源数组
+    :param ranges:  每个簇的(光源索引起点, 光源数量)数组
+    :param indices: 按簇排列的光源索引数组
+    :return: None
+    """
+    global cluster_buffers, cluster_textures
+
+    if cluster_buffers is None:
+        cluster_buffers = list(glGenBuffers(3))
+        cluster_textures = list(glGenTextures(3))
+        formats = (GL_RGBA32F, GL_RG32UI, GL_R32UI)
+        for buffer, texture, internal_format in zip(cluster_buffers, cluster_textures, formats):
+            glBindBuffer(GL_TEXTURE_BUFFER, buffer)
+            glBufferData(GL_TEXTURE_BUFFER, 16, None, GL_STREAM_DRAW)
+            soup3D.state.bind_texture(LIGHT_DATA_UNIT, GL_TEXTURE_BUFFER, texture)
+            glTexBuffer(GL_TEXTURE_BUFFER, internal_format, buffer)
+
+    for buffer, data in zip(cluster_buffers, (packed, ranges, indices)):
+        raw = data.tobytes()
+        if not raw:
+            # 空缓冲区无法绑定到纹理，保留一个元素
+            raw = bytes(16)
+        glBindBuffer(GL_TEXTURE_BUFFER, buffer)
+        glBufferData(GL_TEXTURE_BUFFER, len(raw), raw, GL_STREAM_DRAW)
+    glBindBuffer(GL_TEXTURE_BUFFER, 0)
 
 
 def rotated(Xa: int | float, Ya: int | float,
@@ -273,3 +827,11 @@ def rotated(Xa: int | float, Ya: int | float,
     outx = (Xa - Xb) * cos(degree) - (Ya - Yb) * sin(degree) + Xb
     outy = (Xa - Xb) * sin(degree) + (Ya - Yb) * cos(degree) + Yb
     return outx, outy
+
+
+def get_stats() -> dict:
+    """
+    获取光源上传统计，可用于确认只改变部分光源时没有重新上传所有光源
+    :return: {"full": 重新打包所有光源的次数, "rows": 只上传单个光源的次数}
+    """
+    return {"full": full_uploads, "rows": row_uploads}
@@ -61,3 +61,12 @@ REPEAT = "repeat"      # 超出边缘后重复
 MIRRORED = "mirrored"  # 超出边缘后镜像
 EDGE = "edge"          # 超出边缘后延伸边缘颜色
 BORDER = "border"      # 超出边缘后
+
+# renderer
+FORWARD = "forward"    # 前向渲染
+DEFERRED = "deferred"  # 延迟渲染
+
+# resample
+NEAREST = "nearest"    # 最近邻缩放
+BILINEAR = "bilinear"  # 双线性缩放
+BOX = "box"            # 按覆盖区域取平均值缩放，适合缩小
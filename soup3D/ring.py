@@ -0,0 +1,174 @@
+"""
+调用：soup3D.ring
+绘制数据环形缓冲区，每帧将所有模型的绘制数据(模型矩阵)写入同一个统一缓冲区，绘制每个模型前只需绑定该模型对应的缓冲区范围。
+驱动支持GL_ARB_buffer_storage时使用持久映射的三重缓冲区，并通过栅栏同步避免覆盖GPU仍在读取的数据；否则每帧通过一次
+glBufferSubData上传。
+"""
+from OpenGL.GL import *
+from OpenGL.extensions import hasGLExtension
+from pyglm import glm
+import ctypes
+import numpy as np
+
+import soup3D.shader
+
+__all__ : list[str] = [
+    "pack_mat4", "get_stats",
+]
+
+FRAME_COUNT = 3        # 环形缓冲区的帧数
+DRAW_BLOCK_SIZE = 112  # 单次绘制数据的字节数：mat4 model, ivec4 drawLightCount, ivec4 drawLights[2]
+FENCE_TIMEOUT = 1000000000  # 等待栅栏的最长时间(纳秒)
+
+buffer = None          # 统一缓冲区
+persistent = None      # 是否使用持久映射，None表示尚未检测
+slot_size = 0          # 单次绘制数据在缓冲区中占用的字节数，按GL_UNIFORM_BUFFER_OFFSET_ALIGNMENT对齐
+capacity = 0           # 每帧最多容纳的绘制次数
+frame = 0              # 当前使用的帧编号
+fences = [None] * FRAME_COUNT  # 每帧的栅栏
+
+mapped = None          # 持久映射的整个缓冲区，形状为(FRAME_COUNT, capacity, slot_size // 4)
+staging = None         # 不支持持久映射时使用的CPU端缓冲区，形状为(capacity, slot_size // 4)
+
+wait_count = 0         # 等待栅栏的次数
+
+
+def pack_mat4(mat: glm.mat4) -> np.ndarray:
+    """
+    将矩阵打包为按列主序排列的float32数组，可直接写入环形缓冲区
+    :param mat: 4x4矩阵
+    :return: 长度为16的数组
+    """
+    return np.frombuffer(ctypes.string_at(glm.value_ptr(mat), 64), dtype=np.float32).copy()
+
+
+def _allocate(count: int) -> None:
+    """
+    创建或扩容环形缓冲区，扩容前会等待所有帧的栅栏
+    :param count: 每帧需要容纳的绘制次数
+    :return: None
+    """
+    global buffer, persistent, slot_size, capacity, mapped, staging
+
+    if persistent is None:
+        persistent = bool(hasGLExtension("GL_ARB_buffer_storage"))
+        alignment = int(glGetIntegerv(GL_UNIFORM_BUFFER_OFFSET_ALIGNMENT))
+        slot_size = (DRAW_BLOCK_SIZE + alignment - 1) // alignment * alignment
+
+    # 扩容时保留余量，避免模型数量缓慢增长时频繁扩容
+    new_capacity = max(64, capacity)
+    while new_capacity < count:
+        new_capacity *= 2
+
+    if buffer is not None:
+        for i in range(FRAME_COUNT):
+            _wait_fence(i)
+        if persistent:
+            glBindBuffer(GL_UNIFORM_BUFFER, buffer)
+            glUnmapBuffer(GL_UNIFORM_BUFFER)
+        glDeleteBuffers(1, [buffer])
+        mapped = None
+        staging = None
+
+    capacity = new_capacity
+    buffer = glGenBuffers(1)
+    glBindBuffer(GL_UNIFORM_BUFFER, buffer)
+    if persistent:
+        size = FRAME_COUNT * capacity * slot_size
+        flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+        glBufferStorage(GL_UNIFORM_BUFFER, size, None, flags)
+        ptr = glMapBufferRange(GL_UNIFORM_BUFFER, 0, size, flags)
+        floats = ctypes.cast(ptr, ctypes.POINTER(ctypes.c_float))
+        mapped = np.ctypeslib.as_array(floats, shape=(FRAME_COUNT, capacity, slot_size // 4))
+    else:
+        glBufferData(GL_UNIFORM_BUFFER, capacity * slot_size, None, GL_STREAM_DRAW)
+        staging = np.zeros((capacity, slot_size // 4), dtype=np.float32)
+    glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+
+def _wait_fence(index: int) -> None:
+    """
+    等待指定帧的栅栏，确保GPU不再读取该帧的数据
+    :param index: 帧编号
+    :return: None
+    """
+    global wait_count
+
+    fence = fences[index]
+    if fence is None:
+        return
+    glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, FENCE_TIMEOUT)
+    glDeleteSync(fence)
+    fences[index] = None
+    wait_count += 1
+
+
+def begin_frame(count: int) -> None:
+    """
+    自动调用函数，无需手动调用。开始新的一帧，切换到下一帧的缓冲区范围，必要时等待GPU读取完该范围或扩容缓冲区。
+    :param count: 本帧的绘制次数
+    :return: None
+    """
+    global frame
+
+    if buffer is None or count > capacity:
+        _allocate(count)
+
+    if persistent:
+        frame = (frame + 1) % FRAME_COUNT
+        _wait_fence(frame)
+
+
+def write(slot: int, data: np.ndarray) -> None:
+    """
+    自动调用函数，无需手动调用。将单次绘制数据写入本帧的指定位置
+    :param slot: 本帧中的绘制序号
+    :param data: 绘制数据，按std140布局排列的float32数组
+    :return: None
+    """
+    if persistent:
+        mapped[frame, slot, :len(data)] = data
+    else:
+        staging[slot, :len(data)] = data
+
+
+def flush(count: int) -> None:
+    """
+    自动调用函数，无需手动调用。在绘制前提交本帧写入的数据，持久映射的缓冲区无需提交
+    :param count: 本帧的绘制次数
+    :return: None
+    """
+    if persistent or count == 0:
+        return
+    glBindBuffer(GL_UNIFORM_BUFFER, buffer)
+    glBufferSubData(GL_UNIFORM_BUFFER, 0, count * slot_size, staging[:count])
+    glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+
+def bind(slot: int) -> None:
+    """
+    自动调用函数，无需手动调用。在绘制模型前将该模型的绘制数据绑定到绘制数据统一缓冲区的绑定点
+    :param slot: 本帧中的绘制序号
+    :return: None
+    """
+    offset = slot * slot_size
+    if persistent:
+        offset += frame * capacity * slot_size
+    glBindBufferRange(GL_UNIFORM_BUFFER, soup3D.shader.DRAW_BINDING, buffer, offset, DRAW_BLOCK_SIZE)
+
+
+def end_frame() -> None:
+    """
+    自动调用函数，无需手动调用。结束本帧，为本帧的缓冲区范围插入栅栏
+    :return: None
+    """
+    if persistent:
+        fences[frame] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+
+def get_stats() -> dict:
+    """
+    获取环形缓冲区统计
+    :return: {"persistent": 是否使用持久映射, "capacity": 每帧容量, "waits": 等待栅栏的次数}
+    """
+    return {"persistent": bool(persistent), "capacity": capacity, "waits": wait_count}
@@ -2,23 +2,38 @@
 处理soup3D中的着色系统
 """
 from OpenGL.GL import *
-from OpenGL.GL.shaders import compileShader, compileProgram
+from OpenGL.GL.shaders import ShaderCompilationError, ShaderLinkError
+from OpenGL.extensions import hasGLExtension
 import numpy as np
 from pyglm import glm
-import math
+import ctypes
+import struct
 import weakref
 import traceback
 import sys
-import imageio.v2 as imageio
+import warnings
 
 import soup3D.name
 import soup3D.skeleton
+import soup3D.state
+
+
+try:
+    from OpenGL.GL.KHR.parallel_shader_compile import glMaxShaderCompilerThreadsKHR
+except ImportError:
+    glMaxShaderCompilerThreadsKHR = None
 
 
 set_mat_queue = weakref.WeakValueDictionary()
 
 light_queue = {}
 
+compile_queue = weakref.WeakValueDictionary()  # 尚未完成编译的着色器程序
+
+parallel_compile = None  # 是否支持并行编译，None 表示尚未检测
+
+GL_COMPLETION_STATUS_KHR = 0x91B1
+
 
 type_map = {
     soup3D.name.FLOAT_VEC1: glUniform1f,
@@ -53,6 +68,476 @@ type_map = {
     soup3D.name.FIXED: GL_FIXED
 }
 
+# 数组与矩阵类型uniform中单个元素的字节数，用于比较上传的数据
+uniform_size = {
+    soup3D.name.ARRAY_FLOAT_VEC1: 4,
+    soup3D.name.ARRAY_FLOAT_VEC2: 8,
+    soup3D.name.ARRAY_FLOAT_VEC3: 12,
+    soup3D.name.ARRAY_FLOAT_VEC4: 16,
+    soup3D.name.ARRAY_INT_VEC1: 4,
+    soup3D.name.ARRAY_INT_VEC2: 8,
+    soup3D.name.ARRAY_INT_VEC3: 12,
+    soup3D.name.ARRAY_INT_VEC4: 16,
+    soup3D.name.ARRAY_MATRIX_VEC2: 16,
+    soup3D.name.ARRAY_MATRIX_VEC3: 36,
+    soup3D.name.ARRAY_MATRIX_VEC4: 64,
+}
+
+# 统一缓冲区绑定点，着色器程序链接后会将同名的uniform块绑定到对应的绑定点
+CAMERA_BINDING = 0
+LIGHT_BINDING = 1
+DRAW_BINDING = 2
+SHADOW_BINDING = 3
+uniform_blocks = {
+    "Camera": CAMERA_BINDING,
+    "Lights": LIGHT_BINDING,
+    "Draw": DRAW_BINDING,
+    "Shadows": SHADOW_BINDING,
+}
+
+MAX_LIGHT_CAPACITY = 128  # 光源统一缓冲区最多容纳的光源数量
+MAX_SHADOW_LAYERS = 8     # 阴影贴图数组的层数，所有投射阴影的光源共享
+
+uniform_uploads = 0  # 实际上传的uniform数量
+uniform_skips = 0    # 与上次上传的值相同而跳过的uniform数量
+
+shader_cache = {}   # (着色器类型, 着色器代码) -> 已发起编译的着色器对象
+variant_cache = {}  # 变体特性 -> (顶点着色器代码, 片段着色器代码)
+pipeline_cache = weakref.WeakValueDictionary()  # (着色器代码, 顶点列表类型, 骨架id) -> 共享的管线
+
+# 图像格式 -> 每个像素依次保存的通道编号(0: 红, 1: 绿, 2: 蓝, 3: 透明度)
+FORMAT_CHANNELS = {
+    'RGBA': (0, 1, 2, 3),
+    'RGB': (0, 1, 2),
+    'L': (0,),
+    'A': (3,),
+    'BC1': (0, 1, 2),
+    'BC3': (0, 1, 2, 3),
+    'BC4': (0,),
+    'BC5': (0, 1),
+    'BC7': (0, 1, 2, 3),
+}
+
+# 未压缩的图像格式 -> (OpenGL 内部格式, 数据格式)
+PIXEL_FORMATS = {
+    'RGBA': (GL_RGBA, GL_RGBA),
+    'RGB': (GL_RGB, GL_RGB),
+    'L': (GL_RED, GL_RED),  # 灰度图使用 RED 通道
+    'A': (GL_ALPHA, GL_ALPHA),
+}
+
+# 内置表面着色器的顶点着色器，通过 #define 开启不同特性
+AUTO_VERTEX_SHADER = """
+layout(location = 0) in vec3 VertPos;
+#ifdef TEXTURE_ARRAY
+layout(location = 1) in vec3 VertUV;  // z: 材质贴图在纹理数组中的层
+#else
+layout(location = 1) in vec2 VertUV;
+#endif
+layout(location = 2) in vec3 VertNormal;
+#ifdef SKINNED
+layout(location = 3) in uvec4 BoneIDs;
+layout(location = 4) in vec4 BoneWeights;
+#endif
+#ifdef INSTANCED
+layout(location = 5) in mat4 InstanceModel;
+#endif
+
+#ifdef TEXTURE_ARRAY
+out vec3 TexCoord;
+#else
+out vec2 TexCoord;
+#endif
+out vec3 FragPos;
+out vec3 Normal;
+
+// 绘制数据统一缓冲区，每次绘制前绑定该模型在环形缓冲区中的范围
+layout(std140) uniform Draw {
+    mat4 model;            // 模型矩阵
+    ivec4 drawLightCount;  // x: 影响该模型的光源数量
+    ivec4 drawLights[2];   // 影响该模型的光源在lights中的索引，按相关度从高到低排列
+};
+
+// 相机统一缓冲区，由所有着色器共享，每帧最多更新一次
+layout(std140) uniform Camera {
+    mat4 view;        // 相机矩阵
+    mat4 projection;  // 透视矩阵
+    vec4 cameraPos;   // 相机位置
+};
+#ifdef SKINNED
+uniform mat4 boneMatrices[MAX_BONES];
+#endif
+
+void main()
+{
+#ifdef INSTANCED
+    mat4 modelMat = model * InstanceModel;
+#else
+    mat4 modelMat = model;
+#endif
+    vec4 localPos = vec4(VertPos, 1.0);
+    mat4 normalSource = modelMat;
+
+#ifdef SKINNED
+    // 计算骨骼蒙皮变换矩阵
+    mat4 skinMatrix = mat4(0.0);
+    float totalWeight = 0.0;
+    for (int i = 0; i < 4; i++) {
+        skinMatrix += BoneWeights[i] * boneMatrices[int(BoneIDs[i])];
+        totalWeight += BoneWeights[i];
+    }
+
+    // 无骨骼绑定时使用单位矩阵，避免顶点被移动到原点
+    if (totalWeight < 0.001) {
+        skinMatrix = mat4(1.0);
+    }
+    localPos = skinMatrix * localPos;
+    normalSource = modelMat * skinMatrix;
+#endif
+
+    FragPos = vec3(modelMat * localPos);
+    mat3 normalMatrix = transpose(inverse(mat3(normalSource)));
+    Normal = normalMatrix * VertNormal;
+
+    gl_Position = projection * view * vec4(FragPos, 1.0);
+#ifdef TEXTURE_ARRAY
+    TexCoord = vec3(VertUV.x, 1.0 - VertUV.y, VertUV.z);
+#else
+    TexCoord = vec2(VertUV.x, 1.0 - VertUV.y);
+#endif
+}
+"""
+
+# 光照计算的公共代码，由内置表面着色器与延迟渲染的光照阶段共享，开启CLUSTERED时包含分簇光照
+LIGHT_SHADER = """
+#define MAX_SHADOW_LAYERS """ + str(MAX_SHADOW_LAYERS) + """
+#define MAX_LIGHT_CAPACITY """ + str(MAX_LIGHT_CAPACITY) + """
+#define SHADOW_BIAS 0.0005
+
+// 光照属性，按std140布局每个光源占4个vec4
+struct Light {
+    vec4 position;   // xyz: 光源位置，w: 光源类型(0: 锥形光线, 1: 方向光)
+    vec4 direction;  // xyz: 光源朝向，w: 线性衰减率
+    vec4 color;      // rgb: 光源颜色，w: 锥角一半的余弦值
+    vec4 shadow;     // x: 首个阴影层，y: 阴影层数量(0表示不投射阴影)
+};
+
+// 光源统一缓冲区，由所有着色器共享，每帧最多更新一次
+layout(std140) uniform Lights {
+    vec3 ambient;        // 环境光
+    int lightCount;      // 光源数量
+    ivec4 clusterGrid;   // xyz: 分簇网格尺寸
+    vec4 clusterParams;  // x: 近裁剪面，y: 远裁剪面，z: 视口宽度，w: 视口高度
+    Light lights[MAX_LIGHT_CAPACITY];  // 按缓冲区容量声明，逐模型选出的光源索引可以超过MAX_LIGHTS
+};
+
+#ifdef CLUSTERED
+// 相机统一缓冲区，用于计算片段所在的簇
+layout(std140) uniform Camera {
+    mat4 view;        // 相机矩阵
+    mat4 projection;  // 透视矩阵
+    vec4 cameraPos;   // 相机位置
+};
+
+uniform samplerBuffer lightData;       // 所有光源，每个光源占4个texel，布局与Light相同
+uniform usamplerBuffer clusterRanges;  // 每个簇的(光源索引起点, 光源数量)，最后一项为影响所有簇的光源
+uniform usamplerBuffer clusterLights;  // 按簇排列的光源索引
+#endif
+
+// 阴影统一缓冲区，每层阴影贴图对应一个矩阵
+layout(std140) uniform Shadows {
+    mat4 shadowMatrices[MAX_SHADOW_LAYERS];  // 世界坐标到阴影贴图纹理坐标与深度的矩阵
+};
+uniform sampler2DArrayShadow shadowMaps;
+
+// 计算光源的阴影系数，方向光的多个级联按从近到远排列，使用第一个包含该片段的级联
+float shadowFactor(vec4 shadow, vec3 fragPos)
+{
+    int first = int(shadow.x);
+    int count = int(shadow.y);
+    for (int i = 0; i < count; i++) {
+        int layer = first + i;
+        vec4 coord = shadowMatrices[layer] * vec4(fragPos, 1.0);
+        coord.xyz /= coord.w;
+        if (all(greaterThan(coord.xyz, vec3(0.0))) && all(lessThan(coord.xyz, vec3(1.0)))) {
+            return texture(shadowMaps, vec4(coord.xy, float(layer), coord.z - SHADOW_BIAS));
+        }
+    }
+    return 1.0;
+}
+
+// 计算单个光源的漫反射贡献
+vec3 shadeLight(vec4 position, vec4 direction, vec4 color, vec4 shadow, vec3 norm, vec3 fragPos)
+{
+    vec3 lightDir;
+    float attenuation = 1.0;
+    float spotFactor = 1.0;
+
+    vec3 lightPos = position.xyz;
+    vec3 lightDirection = direction.xyz;
+    float lightAttenuation = direction.w;
+    float cosAngle = color.w;
+
+    if (position.w < 0.5) {
+        lightDir = normalize(lightPos - fragPos);
+
+        // 计算衰减
+        float distance = length(lightPos - fragPos);
+        attenuation = 1.0 / (1.0 + lightAttenuation * distance);
+
+        // 计算聚光灯效果
+        vec3 spotDir = normalize(-lightDirection);
+        float cosTheta = dot(lightDir, spotDir);
+
+        // 检查是否在聚光灯锥角内
+        if (cosTheta > cosAngle) {
+            // 计算聚光灯衰减（边缘平滑过渡）
+            float epsilon = cosAngle - cosAngle * 0.9;
+            spotFactor = clamp((cosTheta - cosAngle) / epsilon, 0.0, 1.0);
+        } else {
+            spotFactor = 0.0;
+        }
+        attenuation *= spotFactor;
+    } else { // 方向光
+        lightDir = normalize(lightDirection);
+    }
+
+    // 漫反射计算
+    float diff = max(dot(norm, lightDir), 0.0);
+    if (diff > 0.0 && shadow.y > 0.5) {
+        attenuation *= shadowFactor(shadow, fragPos);
+    }
+    return color.rgb * diff * attenuation;
+}
+
+#ifdef CLUSTERED
+// 计算片段所在簇的光源与影响所有簇的光源的漫反射贡献
+vec3 clusterLighting(vec3 fragPos, vec3 norm)
+{
+    vec3 diffuse = vec3(0.0);
+
+    // 根据屏幕位置与视图空间深度（指数划分）确定片段所在的簇
+    float depth = -(view * vec4(fragPos, 1.0)).z;
+    float slice = log(max(depth, clusterParams.x) / clusterParams.x) / log(clusterParams.y / clusterParams.x);
+    ivec3 cell = ivec3(
+        gl_FragCoord.xy / clusterParams.zw * vec2(clusterGrid.xy),
+        slice * float(clusterGrid.z)
+    );
+    cell = clamp(cell, ivec3(0), clusterGrid.xyz - 1);
+    int cluster = (cell.z * clusterGrid.y + cell.y) * clusterGrid.x + cell.x;
+    int globalCluster = clusterGrid.x * clusterGrid.y * clusterGrid.z;
+
+    for (int c = 0; c < 2; c++) {
+        uvec2 range = texelFetch(clusterRanges, c == 0 ? cluster : globalCluster).xy;
+        for (uint k = 0u; k < range.y; k++) {
+            int index = int(texelFetch(clusterLights, int(range.x + k)).r) * 4;
+            diffuse += shadeLight(
+                texelFetch(lightData, index),
+                texelFetch(lightData, index + 1),
+                texelFetch(lightData, index + 2),
+                texelFetch(lightData, index + 3),
+                norm, fragPos
+            );
+        }
+    }
+    return diffuse;
+}
+#endif
+"""
+
+# 内置表面着色器的片段着色器，通过 #define 开启不同特性
+AUTO_FRAGMENT_SHADER = """
+#ifdef TEXTURE_ARRAY
+// 材质贴图来自纹理数组，纹理坐标的z为层
+#define MATERIAL_SAMPLER sampler2DArray
+in vec3 TexCoord;
+#else
+#define MATERIAL_SAMPLER sampler2D
+in vec2 TexCoord;
+#endif
+in vec3 FragPos;
+in vec3 Normal;
+#ifdef DEFERRED
+// 延迟渲染时写入G缓冲区
+layout(location = 0) out vec4 FragColor;     // 基础颜色
+layout(location = 1) out vec4 FragNormal;    // xyz: 世界空间法线，w: 是否参与光照
+layout(location = 2) out vec4 FragEmission;  // 自发光
+#else
+out vec4 FragColor;
+#endif
+
+// 材质属性
+uniform MATERIAL_SAMPLER baseColor;
+#ifdef NORMAL_MAP
+uniform MATERIAL_SAMPLER normal;
+#else
+uniform vec3 normalConst;
+#endif
+#ifdef HAS_EMISSION
+#ifdef EMISSION_MAP
+uniform MATERIAL_SAMPLER emission;
+#else
+uniform vec3 emissionConst;
+#endif
+#endif
+#ifdef LIGHTMAP
+uniform sampler2D lightmap;  // 烘焙的光照，包含环境光与直接光照
+#endif
+
+#if !defined(UNLIT) && !defined(DEFERRED) && !defined(LIGHTMAP)
+""" + LIGHT_SHADER + """
+#ifndef CLUSTERED
+// 绘制数据统一缓冲区，每次绘制前绑定该模型在环形缓冲区中的范围
+layout(std140) uniform Draw {
+    mat4 model;            // 模型矩阵
+    ivec4 drawLightCount;  // x: 影响该模型的光源数量
+    ivec4 drawLights[2];   // 影响该模型的光源在lights中的索引，按相关度从高到低排列
+};
+#endif
+#endif
+
+void main()
+{
+    vec3 SideNormal = Normal;
+    if (!gl_FrontFacing) {
+#ifdef DOUBLE_SIDE
+        SideNormal = -Normal;
+#else
+        discard;
+#endif
+    }
+
+    // 基础颜色
+    vec4 base = texture(baseColor, TexCoord);
+#ifdef ALPHA_TEST
+    if (base.a < 0.5) {
+        discard;
+    }
+#endif
+
+#ifndef UNLIT
+    // 法线处理
+#ifdef NORMAL_MAP
+    vec3 norm_tex = texture(normal, TexCoord).rgb;
+#else
+    vec3 norm_tex = normalConst;
+#endif
+    vec3 norm = normalize(SideNormal) + vec3(norm_tex.rg*2-1, norm_tex.b-1);
+#endif
+
+    // 自发光
+#ifdef HAS_EMISSION
+#ifdef EMISSION_MAP
+    vec3 emi = texture(emission, TexCoord).rgb;
+#else
+    vec3 emi = emissionConst;
+#endif
+    vec3 emissive = base.rgb * emi;
+#else
+    vec3 emissive = vec3(0.0);
+#endif
+
+#ifdef LIGHTMAP
+    vec3 baked = texture(lightmap, TexCoord.xy).rgb;
+#endif
+
+#ifdef DEFERRED
+    // 光照在屏幕空间的光照阶段计算，烘焙光照的表面不再参与光照
+#if defined(LIGHTMAP)
+    FragColor = vec4(baked * base.rgb, 1.0);
+    FragNormal = vec4(0.0);
+#elif defined(UNLIT)
+    FragColor = vec4(base.rgb, 1.0);
+    FragNormal = vec4(0.0);
+#else
+    FragColor = vec4(base.rgb, 1.0);
+    FragNormal = vec4(norm, 1.0);
+#endif
+    FragEmission = vec4(emissive, 1.0);
+#else
+#if defined(UNLIT)
+    vec3 result = base.rgb;
+#elif defined(LIGHTMAP)
+    vec3 result = baked * base.rgb;
+#else
+    // 漫反射贡献
+    vec3 diffuse = vec3(0.0);
+#ifdef CLUSTERED
+    diffuse = clusterLighting(FragPos, norm);
+#else
+    // 遍历与该模型最相关的光源
+    for (int i = 0; i < drawLightCount.x && i < MAX_LIGHTS; i++) {
+        int index = drawLights[i / 4][i % 4];
+        Light light = lights[index];
+        diffuse += shadeLight(light.position, light.direction, light.color, light.shadow, norm, FragPos);
+    }
+#endif
+
+    // 最终颜色 = (环境光 + 漫反射) * 基础颜色 + 自发光
+    vec3 result = (ambient + diffuse) * base.rgb;
+#endif
+    FragColor = vec4(result + emissive, base.a);
+#endif
+}
+"""
+
+# 延迟渲染光照阶段的顶点着色器，通过gl_VertexID生成覆盖全屏的三角形
+DEFERRED_VERTEX_SHADER = """
+#version 330 core
+out vec2 ScreenUV;
+
+void main()
+{
+    vec2 pos = vec2((gl_VertexID << 1) & 2, gl_VertexID & 2);
+    ScreenUV = pos;
+    gl_Position = vec4(pos * 2.0 - 1.0, 0.0, 1.0);
+}
+"""
+
+# 延迟渲染光照阶段的片段着色器，从G缓冲区重建世界坐标后计算光照
+DEFERRED_FRAGMENT_SHADER = """
+in vec2 ScreenUV;
+out vec4 FragColor;
+
+uniform sampler2D gAlbedo;    // 基础颜色
+uniform sampler2D gNormal;    // xyz: 世界空间法线，w: 是否参与光照
+uniform sampler2D gEmission;  // 自发光
+uniform sampler2D gDepth;     // 深度
+uniform mat4 invViewProj;     // 透视矩阵与相机矩阵乘积的逆矩阵
+""" + LIGHT_SHADER + """
+void main()
+{
+    float depth = texture(gDepth, ScreenUV).r;
+    if (depth >= 1.0) {
+        discard;  // 没有几何体的像素保留背景颜色
+    }
+
+    vec3 albedo = texture(gAlbedo, ScreenUV).rgb;
+    vec4 normal = texture(gNormal, ScreenUV);
+    vec3 emissive = texture(gEmission, ScreenUV).rgb;
+    if (normal.w < 0.5) {
+        FragColor = vec4(albedo + emissive, 1.0);
+        return;
+    }
+
+    // 从深度重建世界坐标
+    vec4 world = invViewProj * vec4(ScreenUV * 2.0 - 1.0, depth * 2.0 - 1.0, 1.0);
+    vec3 fragPos = world.xyz / world.w;
+    vec3 norm = normal.xyz;
+
+    vec3 diffuse = vec3(0.0);
+#ifdef CLUSTERED
+    diffuse = clusterLighting(fragPos, norm);
+#else
+    for (int i = 0; i < lightCount && i < MAX_LIGHTS; i++) {
+        diffuse += shadeLight(lights[i].position, lights[i].direction, lights[i].color, lights[i].shadow, norm, fragPos);
+    }
+#endif
+
+    FragColor = vec4((ambient + diffuse) * albedo + emissive, 1.0);
+}
+"""
+
 
 class Texture:
     def __init__(self, image_data: bytes | str, width: int = None, height: int = None, format: str = 'RGBA'):
@@ -63,6 +548,7 @@ class Texture:
         通道 1: 绿色通道
         通道 2: 蓝色通道
         通道 3: 透明度 (如无该通道，则统一返回 1)
+        文件路径以.dds或.ktx2结尾时，直接读取其中的BC1/BC3/BC4/BC5/BC7压缩数据与各级mipmap，不在CPU端解码
         :param image_data: 二进制图像数据或文件路径字符串
         :param width: 图像宽度（当 image_data 为二进制数据时需要提供）
         :param height: 图像高度（当 image_data 为二进制数据时需要提供）
@@ -72,6 +558,9 @@ class Texture:
         self.height = height
         self.format = format
         self.texture_id = None
+        self.array = None  # 像素数组，由所有提取该贴图通道的混合通道贴图共享
+        self.levels = None  # 压缩贴图的各级mipmap[(宽度, 高度, 数据), ...]
+        self.mipmaps = None  # 磁盘缓存中预先生成的各级mipmap数组，第0级为原图
         
         # 如果传入的是文件路径，读取文件
         if isinstance(image_data, str):
@@ -90,28 +579,41 @@ class Texture:
         :return: None
         """
         # 激活指定纹理单元
-        glActiveTexture(GL_TEXTURE0 + texture_unit)
+        soup3D.state.active_texture(texture_unit)
+
+        # 已生成的纹理由所有使用该贴图的材质共享
+        if self.texture_id is not None:
+            soup3D.state.bind_texture(texture_unit, GL_TEXTURE_2D, self.texture_id)
+            return self.texture_id
+
+        # 后台加载时先使用占位纹理，解码完成后由soup3D.update上传到同一个纹理
+        if self.image_path and self.image_data is None and soup3D.upload.enabled:
+            self.texture_id = soup3D.upload.request(self, texture_unit)
+            return self.texture_id
 
         # 加载图像数据（如果还未加载）
         if self.image_path and self.image_data is None:
             self._load_image()
+        elif self.image_path:
+            soup3D.texture.touch(self)
+
+        # 纹理流送时先上传低分辨率的mipmap，之后按屏幕尺寸逐级提高分辨率
+        if soup3D.stream.enabled and soup3D.stream.is_streamable(self):
+            self.texture_id = soup3D.stream.create(self, texture_unit)
+            return self.texture_id
+
+        if self.levels is not None:
+            return self._upload_compressed(texture_unit)
 
         # 确定图像模式和对应的 OpenGL 格式
-        format_map = {
-            'RGBA': (GL_RGBA, GL_RGBA),
-            'RGB': (GL_RGB, GL_RGB),
-            'L': (GL_RED, GL_RED),  # 灰度图使用 RED 通道
-            'A': (GL_ALPHA, GL_ALPHA)
-        }
-        
-        internal_format, data_format = format_map.get(self.format, (GL_RGBA, GL_RGBA))
+        internal_format, data_format = PIXEL_FORMATS.get(self.format, (GL_RGBA, GL_RGBA))
         
         # 获取图像尺寸
         width, height = self.width, self.height
 
         # 创建或绑定纹理
         texture_id = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, texture_id)
+        soup3D.state.bind_texture(texture_unit, GL_TEXTURE_2D, texture_id)
 
         # 设置纹理参数
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
@@ -119,11 +621,39 @@ class Texture:
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
 
-        # 上传纹理数据
-        glTexImage2D(GL_TEXTURE_2D, 0, internal_format, width, height, 0, data_format, GL_UNSIGNED_BYTE, self.image_data)
+        if self.mipmaps is not None:
+            # 直接从磁盘缓存的映射上传各级mipmap
+            upload_mipmaps(self.mipmaps, internal_format, data_format)
+        else:
+            # 上传纹理数据
+            glTexImage2D(GL_TEXTURE_2D, 0, internal_format, width, height, 0, data_format, GL_UNSIGNED_BYTE, self.image_data)
 
-        # 生成 mipmap（提高纹理在远距离的渲染质量）
-        glGenerateMipmap(GL_TEXTURE_2D)
+            # 生成 mipmap（提高纹理在远距离的渲染质量）
+            glGenerateMipmap(GL_TEXTURE_2D)
+
+        self.texture_id = texture_id
+        return texture_id
+
+    def _upload_compressed(self, texture_unit: int):
+        """
+        通过glCompressedTexImage2D上传压缩贴图的各级mipmap
+        :param texture_unit: 纹理单元编号
+        :return: 纹理 id
+        """
+        texture_id = glGenTextures(1)
+        soup3D.state.bind_texture(texture_unit, GL_TEXTURE_2D, texture_id)
+
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        # 压缩格式无法通过glGenerateMipmap生成mipmap，只使用文件中的各级
+        min_filter = GL_LINEAR_MIPMAP_LINEAR if len(self.levels) > 1 else GL_LINEAR
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, min_filter)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, len(self.levels) - 1)
+
+        internal_format = soup3D.compressed.GL_FORMATS[self.format]
+        for level, (width, height, data) in enumerate(self.levels):
+            glCompressedTexImage2D(GL_TEXTURE_2D, level, internal_format, width, height, 0, len(data), data)
 
         self.texture_id = texture_id
         return texture_id
@@ -137,18 +667,91 @@ class Texture:
         if not self.image_path:
             return
 
-        img = imageio.imread(self.image_path)
-        self.height, self.width = img.shape[:2]
+        self.set_image(read_image(self.image_path))
+
+    def set_image(self, image: tuple):
+        """
+        设置从文件解码的图像，由_load_image或后台加载调用
+        :param image: read_image的返回值(格式, 宽度, 高度, 像素数据, 压缩贴图的各级mipmap, 磁盘缓存的各级mipmap)
+        :return: None
+        """
+        self.format, self.width, self.height, self.image_data, self.levels, self.mipmaps = image
+        self.array = None
+
+        soup3D.texture.touch(self)
+
+    def get_array(self) -> np.ndarray:
+        """
+        获取像素数组，文件只解码一次，数组直接引用图像数据而不复制
+        :return: 形状为(高, 宽, 通道数)的uint8数组
+        """
+        if self.image_path:
+            if self.image_data is None:
+                self._load_image()
+            else:
+                soup3D.texture.touch(self)
+        if self.is_compressed():
+            raise ValueError(f"Compressed texture can not be used as a channel source: {self.image_path}")
+        if self.array is None:
+            self.array = image_array(self.format, self.width, self.height, self.image_data)
+        return self.array
+
+    def _read_header(self) -> bool:
+        """
+        从文件头读取尺寸与格式，不解码图像
+        :return: 是否无需解码即可得到尺寸与格式，压缩贴图与无法识别的文件格式返回False
+        """
+        if self.width is None:
+            header = read_image_header(self.image_path)
+            if header is None:
+                return False
+            self.format, self.width, self.height = header
+        return self.format not in soup3D.compressed.GL_FORMATS
+
+    def get_size(self) -> tuple[int, int]:
+        """
+        获取图像尺寸，从文件读取的PNG与JPEG贴图只读取文件头，其它贴图会先解码
+        :return: (宽度, 高度)
+        """
+        if self.image_path and self.image_data is None and not self._read_header():
+            self._load_image()
+        return self.width, self.height
 
-        if len(img.shape) == 2:  # 灰度图
-            self.format = 'L'
-            self.image_data = img.tobytes()
-        elif img.shape[2] == 3:  # RGB
-            self.format = 'RGB'
-            self.image_data = img.tobytes()
-        elif img.shape[2] == 4:  # RGBA
-            self.format = 'RGBA'
-            self.image_data = img.tobytes()
+    def get_cpu_bytes(self) -> int:
+        """
+        获取像素数据在内存中占用的字节数
+        :return: 字节数，像素数据未加载时为0
+        """
+        if self.levels is not None:
+            return sum(len(data) for _, _, data in self.levels)
+        return 0 if self.image_data is None else len(self.image_data)
+
+    def is_compressed(self) -> bool:
+        """
+        判断贴图是否为GPU压缩格式，压缩贴图无法在CPU端提取通道
+        :return: 是否为压缩贴图
+        """
+        return self.get_format() in soup3D.compressed.GL_FORMATS
+
+    def unload(self):
+        """
+        释放从文件解码的像素数据，需要时会重新解码。直接使用二进制数据创建的贴图无法重新解码，不会被释放。
+        :return: None
+        """
+        if self.image_path:
+            self.image_data = None
+            self.array = None
+            self.levels = None
+            self.mipmaps = None
+
+    def get_format(self) -> str:
+        """
+        获取图像格式，从文件读取的PNG与JPEG贴图只读取文件头，其它贴图会先解码
+        :return: 图像格式
+        """
+        if self.image_path and self.image_data is None and not self._read_header():
+            self._load_image()
+        return self.format
 
     def get_texture_id(self):
         """
@@ -161,7 +764,7 @@ class Texture:
 
     def __del__(self):
         if self.texture_id is not None:
-            glDeleteTextures([self.texture_id])
+            soup3D.state.delete_textures([self.texture_id])
             self.texture_id = None
 
 
@@ -182,113 +785,207 @@ class MixChannel:
                  R: "int | float | GrayImg",
                  G: "int | float | GrayImg",
                  B: "int | float | GrayImg",
-                 A: "int | float | GrayImg" = 1.0):
+                 A: "int | float | GrayImg" = 1.0,
+                 resample: str = soup3D.name.NEAREST):
         """
         混合通道成为一个贴图
         混合通道贴图 (MixChannel) 可通过类似贴图 (Texture) 的方式提取通道
-        :param resize: 重新定义图像尺寸，不同的通道可能来自不同尺寸的贴图，为实现合并，需将所有通道转换为同一尺寸的图像
-        :param R: 红色通道，可直接通过 0.0~1.0 的小数定义通道亮度，也可以引入 Channel 通道实现引入贴图通道
-        :param G: 绿色通道，可直接通过 0.0~1.0 的小数定义通道亮度，也可以引入 Channel 通道实现引入贴图通道
-        :param B: 蓝色通道，可直接通过 0.0~1.0 的小数定义通道亮度，也可以引入 Channel 通道实现引入贴图通道
-        :param A: 透明度通道，可直接通过 0.0~1.0 的小数定义通道亮度，也可以引入 Channel 通道实现引入贴图通道
+        :param resize:   重新定义图像尺寸，不同的通道可能来自不同尺寸的贴图，为实现合并，需将所有通道转换为同一尺寸的图像
+        :param R:        红色通道，可直接通过 0.0~1.0 的小数定义通道亮度，也可以引入 Channel 通道实现引入贴图通道
+        :param G:        绿色通道，可直接通过 0.0~1.0 的小数定义通道亮度，也可以引入 Channel 通道实现引入贴图通道
+        :param B:        蓝色通道，可直接通过 0.0~1.0 的小数定义通道亮度，也可以引入 Channel 通道实现引入贴图通道
+        :param A:        透明度通道，可直接通过 0.0~1.0 的小数定义通道亮度，也可以引入 Channel 通道实现引入贴图通道
+        :param resample: 通道尺寸与resize不同时的缩放方式，可以是soup3D.NEAREST、soup3D.BILINEAR或soup3D.BOX
         """
         self.resize = resize
         self.R = R
         self.G = G
         self.B = B
         self.A = A
+        self.resample = resample
+        self.width, self.height = resize
+        self.format = 'RGBA'
+        self.array = None      # 混合后的(高, 宽, 4)数组
+        self.mipmaps = None    # 磁盘缓存中预先生成的各级mipmap数组，第0级为混合结果
+        self.shared = False    # 纹理是否直接使用来源贴图的纹理
         self.texture_id = None
 
+    def _passthrough_source(self, arrays: dict | None = None) -> "Texture | None":
+        """
+        判断四个通道是否按原顺序来自同一张贴图，此时无需逐通道混合
+        :param arrays: 贴图id -> (格式, 像素数组)，由后台加载预先解码的来源贴图，None表示从来源贴图读取
+        :return: 来源贴图，不满足条件时返回None
+        """
+        if not all(isinstance(source, Channel) for source in (self.R, self.G, self.B)):
+            return None
+        texture = self.R.texture
+        if not isinstance(texture, Texture):
+            return None
+        if any(source.texture is not texture for source in (self.G, self.B)):
+            return None
+        if (self.R.channelID, self.G.channelID, self.B.channelID) != (0, 1, 2):
+            return None
+
+        if arrays is None:
+            format, compressed = texture.get_format(), texture.is_compressed()
+        else:
+            # 后台线程中不读取来源贴图，预先解码的贴图都不是压缩贴图
+            format, compressed = arrays[id(texture)][0], False
+        layout = FORMAT_CHANNELS.get(format, FORMAT_CHANNELS['RGBA'])
+        if layout[:3] != (0, 1, 2):
+            return None
+        if isinstance(self.A, Channel):
+            if self.A.texture is not texture or self.A.channelID != 3 or 3 not in layout:
+                return None
+        elif (3 in layout and not compressed) or self.A < 1:
+            # 来源贴图带有透明度通道，或透明度常数小于1。压缩贴图无法在CPU端混合，直接使用其透明度通道
+            return None
+        return texture
+
+    def get_array(self) -> np.ndarray:
+        """
+        获取混合后的像素数组，只在首次调用时混合。使用磁盘缓存时，缓存存在则直接映射缓存文件，不解码来源贴图。
+        :return: 形状为(高, 宽, 4)的uint8数组
+        """
+        if self.array is None:
+            self.set_array(*self.build_array())
+        return self.array
+
+    def build_array(self) -> tuple[np.ndarray, list[np.ndarray] | None]:
+        """
+        混合各通道，使用磁盘缓存时优先映射缓存文件，不修改混合通道贴图
+        :return: (形状为(高, 宽, 4)的uint8数组, 磁盘缓存的各级mipmap或None)
+        """
+        key = None
+        if soup3D.diskcache.enabled and self.get_constant() is None:
+            key = soup3D.diskcache.source_key(self)
+            mipmaps = soup3D.diskcache.load(key)
+            if mipmaps is not None:
+                return mipmaps[0], mipmaps
+
+        array = self._composite()
+        if key is not None:
+            mipmaps = soup3D.diskcache.store(key, array)
+            return mipmaps[0], mipmaps
+        return array, None
+
+    def set_array(self, array: np.ndarray, mipmaps: list[np.ndarray] | None) -> None:
+        """
+        设置混合结果，由get_array或后台加载调用
+        :param array:   形状为(高, 宽, 4)的uint8数组
+        :param mipmaps: 磁盘缓存的各级mipmap，没有时为None
+        :return: None
+        """
+        self.array = array
+        self.mipmaps = mipmaps
+
+    def _composite(self, arrays: dict | None = None) -> np.ndarray:
+        """
+        混合各通道，来自同一张贴图的通道共享该贴图的解码结果，并且只缩放一次
+        :param arrays: 贴图id -> (格式, 像素数组)，预先解码的来源贴图，None表示从来源贴图读取
+        :return: 形状为(高, 宽, 4)的uint8数组
+        """
+        width, height = self.resize
+        resized = {}  # 贴图id -> 缩放到目标尺寸的像素数组
+        source = self._passthrough_source(arrays)
+        if source is not None:
+            array = resize_image(_source_array(source, arrays)[1], (width, height), self.resample)
+            if array.shape[2] == 4:
+                return array
+            resized[id(source)] = array
+
+        rgba = np.empty((height, width, 4), dtype=np.uint8)
+        for i, source in enumerate((self.R, self.G, self.B, self.A)):
+            if isinstance(source, Channel):
+                texture = source.texture
+                format, array = _source_array(texture, arrays)
+                if id(texture) in resized:
+                    array = resized[id(texture)]
+                else:
+                    array = resize_image(array, (width, height), self.resample)
+                    resized[id(texture)] = array
+                rgba[:, :, i] = _extract_channel(array, format, source.channelID)
+            else:
+                rgba[:, :, i] = max(0, min(255, int(source * 255)))
+
+        return rgba
+
+    def get_format(self) -> str:
+        """
+        获取图像格式，混合通道贴图总是'RGBA'
+        :return: 图像格式
+        """
+        return self.format
+
     def gen_gl_texture(self, texture_unit: int = 0):
         """
-        生成 OpenGL 纹理
+        生成 OpenGL 纹理。四个通道按原顺序来自同一张尺寸相同的贴图时，直接使用该贴图的纹理。
         :param texture_unit: 纹理单元编号（0 表示 GL_TEXTURE0，1 表示 GL_TEXTURE1 等）
         :return: None
         """
         # 激活指定纹理单元
-        glActiveTexture(GL_TEXTURE0 + texture_unit)
+        soup3D.state.active_texture(texture_unit)
 
-        # 生成混合通道的二进制数据
+        # 已生成的纹理由所有使用该贴图的材质共享
+        if self.texture_id is not None:
+            soup3D.state.bind_texture(texture_unit, GL_TEXTURE_2D, self.texture_id)
+            return self.texture_id
+
+        # 只读取来源贴图的文件头，后台加载时来源贴图仍在解码
+        source = self._passthrough_source()
+        if source is not None and source.get_size() == tuple(self.resize):
+            texture_id = source.get_texture_id()
+            soup3D.state.bind_texture(texture_unit, GL_TEXTURE_2D, texture_id)
+            self.shared = True
+            self.texture_id = texture_id
+            return texture_id
+
+        values = self.get_constant()
+        if values is not None:
+            # 四个通道都是常数，使用共享的1x1纹理
+            texture_id = soup3D.texture.constant(values)
+            soup3D.state.bind_texture(texture_unit, GL_TEXTURE_2D, texture_id)
+            self.shared = True
+            self.texture_id = texture_id
+            return texture_id
+
+        # 后台加载时先使用占位纹理，来源贴图的解码与混合在线程池中完成
+        if soup3D.upload.enabled and self.array is None:
+            sources = soup3D.upload.mix_sources(self)
+            if sources is not None:
+                self.shared = False
+                self.texture_id = soup3D.upload.request_mix(self, sources, texture_unit)
+                return self.texture_id
+
+        return self.upload(texture_unit)
+
+    def get_constant(self) -> tuple[int, int, int, int] | None:
+        """
+        判断四个通道是否都是常数
+        :return: 量化为0~255的(R, G, B, A)，存在贴图通道时返回None
+        """
+        sources = (self.R, self.G, self.B, self.A)
+        if not all(isinstance(source, (float, int)) for source in sources):
+            return None
+        return tuple(max(0, min(255, int(source * 255))) for source in sources)
+
+    def upload(self, texture_unit: int = 0):
+        """
+        混合通道并上传为新的 OpenGL 纹理，不复用其它贴图的纹理
+        :param texture_unit: 纹理单元编号（0 表示 GL_TEXTURE0，1 表示 GL_TEXTURE1 等）
+        :return: 纹理 id
+        """
         width, height = self.resize
-        total_pixels = width * height
-        
-        # 初始化四个通道的数组
-        r_data = np.zeros(total_pixels, dtype=np.uint8)
-        g_data = np.zeros(total_pixels, dtype=np.uint8)
-        b_data = np.zeros(total_pixels, dtype=np.uint8)
-        a_data = np.full(total_pixels, 255, dtype=np.uint8)  # 默认不透明
-        
-        # 处理每个通道
-        for i, (channel_name, source) in enumerate([('R', self.R), ('G', self.G), 
-                                                      ('B', self.B), ('A', self.A)]):
-            if isinstance(source, (float, int)):  # 浮点常数
-                value = max(0, min(255, int(source * 255)))
-                if channel_name == 'R':
-                    r_data.fill(value)
-                elif channel_name == 'G':
-                    g_data.fill(value)
-                elif channel_name == 'B':
-                    b_data.fill(value)
-                elif channel_name == 'A':
-                    a_data.fill(value)
-                    
-            elif isinstance(source, Channel):  # Channel 对象
-                # 从源纹理获取数据
-                src_texture = source.texture
-                if src_texture.image_path and src_texture.image_data is None:
-                    src_texture._load_image()
-                
-                src_width = src_texture.width
-                src_height = src_texture.height
-                src_format = src_texture.format
-                src_data = src_texture.image_data
-                
-                # 根据源格式解析数据
-                if src_format == 'RGBA':
-                    channels_per_pixel = 4
-                elif src_format == 'RGB':
-                    channels_per_pixel = 3
-                elif src_format == 'L':
-                    channels_per_pixel = 1
-                else:
-                    channels_per_pixel = 4
-                
-                # 提取指定通道
-                src_channel_idx = source.channelID
-                if src_channel_idx < channels_per_pixel:
-                    channel_bytes = src_data[src_channel_idx::channels_per_pixel]
-                    channel_array = np.frombuffer(channel_bytes, dtype=np.uint8)
-                else:
-                    channel_array = np.full(src_width * src_height, 255, dtype=np.uint8)
-                
-                # 调整尺寸（简单的最近邻插值）
-                if (src_width, src_height) != self.resize:
-                    channel_array = self._resize_channel(channel_array, 
-                                                         (src_width, src_height), 
-                                                         self.resize)
-                
-                # 填充到对应通道
-                if channel_name == 'R':
-                    r_data[:len(channel_array)] = channel_array
-                elif channel_name == 'G':
-                    g_data[:len(channel_array)] = channel_array
-                elif channel_name == 'B':
-                    b_data[:len(channel_array)] = channel_array
-                elif channel_name == 'A':
-                    a_data[:len(channel_array)] = channel_array
-        
-        # 合并为 RGBA 数据
-        rgba_data = np.zeros((total_pixels, 4), dtype=np.uint8)
-        rgba_data[:, 0] = r_data
-        rgba_data[:, 1] = g_data
-        rgba_data[:, 2] = b_data
-        rgba_data[:, 3] = a_data
-        
-        data = rgba_data.tobytes()
+        data = self.get_array()
+
+        if soup3D.stream.enabled and soup3D.stream.is_streamable(self):
+            self.shared = False
+            self.texture_id = soup3D.stream.create(self, texture_unit)
+            return self.texture_id
 
         # 创建或绑定纹理
         texture_id = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, texture_id)
+        soup3D.state.bind_texture(texture_unit, GL_TEXTURE_2D, texture_id)
 
         # 设置纹理参数
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
@@ -296,17 +993,22 @@ class MixChannel:
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
 
-        # 上传纹理数据
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, data)
+        if self.mipmaps is not None:
+            # 直接从磁盘缓存的映射上传各级mipmap
+            upload_mipmaps(self.mipmaps, GL_RGBA, GL_RGBA)
+        else:
+            # 上传纹理数据
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, data)
 
-        # 生成 mipmap
-        glGenerateMipmap(GL_TEXTURE_2D)
+            # 生成 mipmap
+            glGenerateMipmap(GL_TEXTURE_2D)
 
+        self.shared = False
         self.texture_id = texture_id
         return texture_id
-    
-    def _resize_channel(self, channel_array: np.ndarray, 
-                        src_size: tuple[int, int], 
+
+    def _resize_channel(self, channel_array: np.ndarray,
+                        src_size: tuple[int, int],
                         dst_size: tuple[int, int]) -> np.ndarray:
         """
         调整通道尺寸（最近邻插值）
@@ -316,26 +1018,97 @@ class MixChannel:
         :return: 调整后的通道数组
         """
         src_w, src_h = src_size
-        dst_w, dst_h = dst_size
-        
-        # 重塑为 2D
-        channel_2d = channel_array.reshape((src_h, src_w))
-        
-        # 创建目标数组
-        result = np.zeros((dst_h, dst_w), dtype=np.uint8)
-        
-        # 计算缩放比例
-        scale_x = src_w / dst_w
-        scale_y = src_h / dst_h
-        
-        # 最近邻插值
-        for y in range(dst_h):
-            for x in range(dst_w):
-                src_x = int(min(x * scale_x, src_w - 1))
-                src_y = int(min(y * scale_y, src_h - 1))
-                result[y, x] = channel_2d[src_y, src_x]
-        
-        return result.flatten()
+        return resize_image(channel_array.reshape((src_h, src_w)), dst_size, soup3D.name.NEAREST).flatten()
+
+    def get_texture_id(self):
+        """
+        获取纹理 id，若无纹理 id，则创建纹理 id。
+        :return: 纹理 id
+        """
+        if self.texture_id is None:
+            self.gen_gl_texture()
+        return self.texture_id
+
+    def __del__(self):
+        if self.texture_id is not None and not self.shared:
+            soup3D.state.delete_textures([self.texture_id])
+        self.texture_id = None
+
+
+class TextureArray:
+    def __init__(self, layers: list, resample: str = soup3D.name.BILINEAR):
+        """
+        纹理数组，将多张贴图作为GL_TEXTURE_2D_ARRAY的各层，尺寸与第一层不同的贴图会缩放到第一层的尺寸。由ArraySP材质使用，每个顶点
+        通过层序号选择贴图。
+        :param layers:   贴图或混合通道贴图的列表，不能使用压缩贴图
+        :param resample: 缩放方式，可以是soup3D.NEAREST、soup3D.BILINEAR或soup3D.BOX
+        """
+        if not layers:
+            raise ValueError("TextureArray needs at least one layer")
+        self.layers = list(layers)
+        self.resample = resample
+        self.width = None
+        self.height = None
+        self.texture_id = None
+
+    def _layer_array(self, image: "Img") -> np.ndarray:
+        """
+        获取单层贴图的RGBA像素数组，缺少的通道按混合通道贴图的规则补全
+        :param image: 贴图或混合通道贴图
+        :return: 形状为(高, 宽, 4)的uint8数组
+        """
+        if isinstance(image, Texture):
+            width, height = image.get_size()
+            image = MixChannel((width, height), *(Channel(image, channel_id) for channel_id in range(4)))
+        return image.get_array()
+
+    def get_array(self) -> np.ndarray:
+        """
+        获取所有层的像素数组
+        :return: 形状为(层数, 高, 宽, 4)的uint8数组
+        """
+        arrays = [self._layer_array(layer) for layer in self.layers]
+        height, width = arrays[0].shape[:2]
+        return np.stack([resize_image(array, (width, height), self.resample) for array in arrays])
+
+    def get_layer_count(self) -> int:
+        """
+        获取层数
+        :return: 层数
+        """
+        return len(self.layers)
+
+    def gen_gl_texture(self, texture_unit: int = 0):
+        """
+        生成 OpenGL 纹理数组
+        :param texture_unit: 纹理单元编号（0 表示 GL_TEXTURE0，1 表示 GL_TEXTURE1 等）
+        :return: 纹理 id
+        """
+        soup3D.state.active_texture(texture_unit)
+
+        if self.texture_id is not None:
+            soup3D.state.bind_texture(texture_unit, GL_TEXTURE_2D_ARRAY, self.texture_id)
+            return self.texture_id
+
+        data = self.get_array()
+        count, height, width = data.shape[:3]
+
+        texture_id = glGenTextures(1)
+        soup3D.state.bind_texture(texture_unit, GL_TEXTURE_2D_ARRAY, texture_id)
+
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_S, GL_REPEAT)
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_T, GL_REPEAT)
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
+
+        glTexImage3D(GL_TEXTURE_2D_ARRAY, 0, GL_RGBA, width, height, count, 0, GL_RGBA, GL_UNSIGNED_BYTE, data)
+
+        # 每一层分别生成 mipmap，层与层之间不会混合
+        glGenerateMipmap(GL_TEXTURE_2D_ARRAY)
+
+        self.width, self.height = width, height
+        self.texture_id = texture_id
+        return texture_id
 
     def get_texture_id(self):
         """
@@ -348,14 +1121,15 @@ class MixChannel:
 
     def __del__(self):
         if self.texture_id is not None:
-            glDeleteTextures([self.texture_id])
+            soup3D.state.delete_textures([self.texture_id])
             self.texture_id = None
 
 
 class ShaderProgram:
     def __init__(
             self, vertex: str, fragment: str,
-            vbo_type: str | list[str] | tuple[str] = "float"
+            vbo_type: str | list[str] | tuple[str] = "float",
+            lazy: bool = False
         ):
         """
         代码着色器，作为表面着色器渲染时使用的顶点列表格式：
@@ -379,15 +1153,18 @@ class ShaderProgram:
         :param vbo_type: 定义传入着色器程序的顶点列表(vbo)的数据类型。如每个定点列表数据类型相同，可通过填写一个字符串定义所有的定点列表的
                          数据类型；如果需要不同的数据类型，可通过填写一个列表来分别定义每个顶点列表的数据类型。在同一vbo下，所有vertex的
                          长度需一致，且长度范围在1-4个数据。
+        :param lazy:     是否延迟编译。为True时不会在创建时编译，而是在首次绘制或调用warm_up时发起编译，支持并行编译的驱动会在后台完成
+                         编译，编译完成前使用该着色器的模型不会被绘制。
         """
         self.vertex = vertex
         self.fragment = fragment
         self.vbo_type = vbo_type
 
-        self.vertex_shader = compileShader(self.vertex, GL_VERTEX_SHADER)
-        self.fragment_shader = compileShader(self.fragment, GL_FRAGMENT_SHADER)
-
-        self.shader = compileProgram(self.vertex_shader, self.fragment_shader)
+        self.vertex_shader = None
+        self.fragment_shader = None
+        self.shader = None      # 链接完成后的着色器程序
+        self._program = None    # 正在编译中的着色器程序
+        self.compiling = False
 
         self.uniform_loc = {}
         self.uniform_val = {}
@@ -395,14 +1172,103 @@ class ShaderProgram:
 
         self.texture_val = {}
 
+        self._loc_cache = {}
+        self._uploaded = {}  # {变量位置: 上次上传的值}，用于跳过未变化的值
+
         self.dirty = False
 
+        compile_queue[id(self)] = self
+        if not lazy:
+            self.wait()
+
+    def compile(self):
+        """
+        发起编译，驱动支持并行编译时该方法会立即返回，否则会等待编译完成
+        :return: None
+        """
+        if self.shader is not None or self.compiling:
+            return
+
+        _init_parallel_compile()
+
+        self.vertex_shader = _issue_shader(self.vertex, GL_VERTEX_SHADER)
+        self.fragment_shader = _issue_shader(self.fragment, GL_FRAGMENT_SHADER)
+
+        self._program = glCreateProgram()
+        glAttachShader(self._program, self.vertex_shader)
+        glAttachShader(self._program, self.fragment_shader)
+        glLinkProgram(self._program)
+        self.compiling = True
+
+        if not parallel_compile:
+            self._finish()
+
+    def is_ready(self) -> bool:
+        """
+        查询着色器是否已编译完成，尚未发起编译时会发起编译。支持并行编译时不会等待驱动。
+        :return: 是否可以使用该着色器绘制
+        """
+        if self.shader is not None:
+            return True
+        if not self.compiling:
+            self.compile()
+            if self.shader is not None:
+                return True
+        if parallel_compile and not glGetProgramiv(self._program, GL_COMPLETION_STATUS_KHR):
+            return False
+        self._finish()
+        return True
+
+    def wait(self):
+        """
+        立即完成编译，会阻塞直到驱动完成编译，可用于在加载界面中预热着色器
+        :return: None
+        """
+        if self.shader is not None:
+            return
+        self.compile()
+        if self.shader is None:
+            self._finish()
+
+    def _finish(self):
+        """检查编译结果，并将着色器程序标记为可用"""
+        program = self._program
+        for shader, source, shader_type in (
+                (self.vertex_shader, self.vertex, GL_VERTEX_SHADER),
+                (self.fragment_shader, self.fragment, GL_FRAGMENT_SHADER)):
+            if glGetShaderiv(shader, GL_COMPILE_STATUS) != GL_TRUE:
+                info = glGetShaderInfoLog(shader)
+                self.compiling = False
+                compile_queue.pop(id(self), None)
+                raise ShaderCompilationError(
+                    f"Shader compile failure ({glGetShaderiv(shader, GL_COMPILE_STATUS)}): {info}",
+                    [source], shader_type
+                )
+        if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+            info = glGetProgramInfoLog(program)
+            self.compiling = False
+            compile_queue.pop(id(self), None)
+            raise ShaderLinkError(f"Link failure: {info}")
+
+        # 将着色器中声明的共享uniform块绑定到固定的绑定点
+        for block_name, binding in uniform_blocks.items():
+            block_index = glGetUniformBlockIndex(program, block_name)
+            if block_index != GL_INVALID_INDEX:
+                glUniformBlockBinding(program, block_index, binding)
+
+        self.shader = program
+        self._program = None
+        self.compiling = False
+        compile_queue.pop(id(self), None)
+
     def use(self):
         """
         使用该着色器，会在应用时自动调用
         :return: None
         """
-        glUseProgram(self.shader)
+        if self.shader is None:
+            self.wait()
+        soup3D.state.use_program(self.shader)
 
     def rend(self, mode, vertex):
         """
@@ -421,10 +1287,7 @@ class ShaderProgram:
         for i in self.texture_val:
             value = self.texture_val[i]
             texture, texture_unit = value
-            glActiveTexture(GL_TEXTURE0 + texture_unit)
-            glBindTexture(GL_TEXTURE_2D, texture.get_texture_id())
-
-        glEnable(GL_DEPTH_TEST)
+            soup3D.state.bind_texture(texture_unit, GL_TEXTURE_2D, texture.get_texture_id())
 
         num_buffers = len(vertex)
         vbo_ids = glGenBuffers(num_buffers)
@@ -433,7 +1296,7 @@ class ShaderProgram:
             vbo_ids = [vbo_ids]  # 包装为列表
 
         vao = glGenVertexArrays(1)
-        glBindVertexArray(vao)
+        soup3D.state.bind_vertex_array(vao)
 
         _int_type_map = {
             GL_BYTE: np.int8, GL_UNSIGNED_BYTE: np.uint8,
@@ -463,7 +1326,6 @@ class ShaderProgram:
             glEnableVertexAttribArray(i)
 
         glBindBuffer(GL_ARRAY_BUFFER, 0)
-        glBindVertexArray(vao)
 
         # 使用第一个顶点组的长度作为顶点数量
         if vertex and vertex[0]:
@@ -474,7 +1336,7 @@ class ShaderProgram:
         glDrawArrays(mode, 0, total_vertices)
 
         # 清理资源
-        glBindVertexArray(0)
+        soup3D.state.bind_vertex_array(0)
         glDeleteVertexArrays(1, [vao])
         glDeleteBuffers(num_buffers, vbo_ids)
 
@@ -483,7 +1345,7 @@ class ShaderProgram:
         停用该着色器，会在结束应用时自动调用
         :return: None
         """
-        glUseProgram(0)
+        soup3D.state.use_program(0)
 
     def uniform(self, v_name: str, v_type: str, *value) -> bool:
         """
@@ -493,10 +1355,10 @@ class ShaderProgram:
         :param value:  其他填入glUniform方法的参数，当传入值为单独数据时(如v_name=soup3D.INT_VEC1),需在此项填写传入的数据，如果需传
                        入数组(如v_name=soup3D.ARRAY_INT_VEC1)，则需要在此项填入(数组长度, 数组)，如果为矩阵，则需填入
                        (矩阵数量, 是否转置矩阵, 传入的矩阵)
-        :return: 是否成功添加uniform
+        :return: 是否成功添加uniform，着色器尚未编译完成时无法确认变量是否存在，会先记录并返回True
         """
         # 获取统一变量位置
-        loc = glGetUniformLocation(self.shader, v_name)
+        loc = self._get_location(v_name)
         if loc == -1:
             return False
         self.uniform_loc[v_name] = loc
@@ -506,6 +1368,23 @@ class ShaderProgram:
         self.dirty_update()
         return True
 
+    def uniform_now(self, v_name: str, v_type: str, *value) -> bool:
+        """
+        立即向着色器传递数据，需要在着色器已启用时调用。生成显示列表时，该操作会被录制在显示列表中，可用于设置材质常量。
+        :param v_name: 在着色器内该数据对应的变量名
+        :param v_type: 指定数据类型
+        :param value:  其他填入glUniform方法的参数，格式与uniform方法相同
+        :return: 是否成功传递数据
+        """
+        loc = self._get_location(v_name)
+        if loc is None or loc == -1 or v_type not in type_map:
+            return False
+        type_map[v_type](loc, *value)
+
+        # 该值可能被显示列表再次修改，不能再作为比较依据
+        self._uploaded.pop(loc, None)
+        return True
+
     def uniform_tex(self, v_name: str, texture: "Img", texture_unit: int = 0) -> bool:
         """
         在下一帧向着色器传递纹理
@@ -515,8 +1394,7 @@ class ShaderProgram:
         :return: 是否成功添加文理
         """
         # 获取统一变量位置
-        prev_program = glGetIntegerv(GL_CURRENT_PROGRAM)
-        loc = glGetUniformLocation(self.shader, v_name)
+        loc = self._get_location(v_name)
         if loc == -1:
             return False
 
@@ -532,6 +1410,20 @@ class ShaderProgram:
 
         return True
 
+    def _get_location(self, v_name: str):
+        """
+        获取统一变量位置，结果会被缓存
+        :param v_name: 在着色器内该数据对应的变量名
+        :return: 变量位置，着色器尚未编译完成时返回None
+        """
+        if self.shader is None:
+            return None
+        loc = self._loc_cache.get(v_name)
+        if loc is None:
+            loc = glGetUniformLocation(self.shader, v_name)
+            self._loc_cache[v_name] = loc
+        return loc
+
     def is_dirty(self):
         return self.dirty
 
@@ -545,15 +1437,20 @@ class ShaderProgram:
 
     def update(self):
         """
-        更新着色器
+        更新着色器，与上次上传的值相同的uniform会被跳过
         :return: None
         """
-        prev_program = glGetIntegerv(GL_CURRENT_PROGRAM)
-        if prev_program != self.shader:
-            glUseProgram(self.shader)
+        global uniform_uploads, uniform_skips
+
+        if self.shader is None:
+            return
+
+        soup3D.state.use_program(self.shader)
 
         for key in self.uniform_loc:
             loc = self.uniform_loc.get(key, -1)
+            if loc is None:
+                loc = self._get_location(key)
             if loc == -1:
                 continue
 
@@ -563,12 +1460,24 @@ class ShaderProgram:
                 value = self.texture_val[key]
                 # 处理纹理类型的uniform
                 texture, texture_unit = value
+                data = ("texture", texture_unit)
+                if self._uploaded.get(loc) == data:
+                    uniform_skips += 1
+                    continue
                 glUniform1i(loc, texture_unit)
             else:
                 value = self.uniform_val[key]
                 # 处理其他类型的uniform
-                if v_type in type_map:
-                    type_map[v_type](loc, *value)
+                if v_type not in type_map:
+                    continue
+                data = _uniform_bytes(v_type, value)
+                if self._uploaded.get(loc) == data:
+                    uniform_skips += 1
+                    continue
+                type_map[v_type](loc, *value)
+
+            self._uploaded[loc] = data
+            uniform_uploads += 1
 
         self.uniform_loc = {}
         self.dirty = False
@@ -578,21 +1487,20 @@ class ShaderProgram:
         深度清理着色器，清理该着色器本身及所有该着色器用到的元素。在确定不再使用该着色器时可使用该方法释放内存。
         :return: None
         """
-        # 删除顶点着色器
-        if hasattr(self, 'vertex_shader') and self.vertex_shader:
-            glDeleteShader(self.vertex_shader)
-            self.vertex_shader = None
-
-        # 删除片段着色器
-        if hasattr(self, 'fragment_shader') and self.fragment_shader:
-            glDeleteShader(self.fragment_shader)
-            self.fragment_shader = None
+        # 顶点着色器和片段着色器由shader_cache共享，不在此处删除
+        self.vertex_shader = None
+        self.fragment_shader = None
 
         # 删除着色器程序
         if hasattr(self, 'shader') and self.shader:
-            glDeleteProgram(self.shader)
+            soup3D.state.delete_program(self.shader)
             self.shader = None
 
+        # 删除尚未编译完成的着色器程序
+        if hasattr(self, '_program') and self._program:
+            soup3D.state.delete_program(self._program)
+            self._program = None
+
         # 清空相关字典
         self.uniform_loc.clear()
         self.uniform_val.clear()
@@ -600,14 +1508,168 @@ class ShaderProgram:
         self.texture_val.clear()
 
 
+class Pipeline:
+    def __init__(self,
+                 features: dict,
+                 vbo_type: list | tuple,
+                 shader_program: ShaderProgram | None = None,
+                 skeleton: "soup3D.skeleton.Skeleton | dict | None" = None):
+        """
+        渲染管线，由着色器变体对应的着色器程序，以及该程序共享的骨骼数据组成。特性相同的材质(AutoSP)会共享同一个管线，材质之间只
+        切换纹理与材质常量。相机、光源与模型矩阵由所有管线共享的统一缓冲区提供。通常通过get_pipeline获取，不建议直接创建。
+        :param features:       传入shader_variant的特性参数
+        :param vbo_type:       定义传入着色器程序的顶点列表(vbo)的数据类型
+        :param shader_program: 管线使用的着色器程序，若为None，则根据特性参数生成着色器程序
+        :param skeleton:       骨骼蒙皮管线使用的骨架，一个Skeleton对象或包含多个骨头的字典
+        """
+        self.features = features
+        self.vbo_type = vbo_type
+        self.skinned = features.get("skinned", False)
+        self.skeleton = skeleton
+        self.skeleton_obj = None
+        self.max_bones = light_count_bucket(features.get("max_bones", 0)) if self.skinned else 0
+
+        # 生成着色器程序
+        self.shader_program = shader_program
+        if shader_program is None:
+            vertex_shader, fragment_shader = shader_variant(**features)
+            self.shader_program = ShaderProgram(
+                vertex_shader,
+                fragment_shader,
+                vbo_type=vbo_type,
+                lazy=True
+            )
+
+        # 纹理单元在所有材质间固定，只需设置一次
+        self.shader_program.uniform("baseColor", soup3D.INT_VEC1, 0)
+        self.shader_program.uniform("normal", soup3D.INT_VEC1, 1)
+        self.shader_program.uniform("emission", soup3D.INT_VEC1, 3)
+        self.shader_program.uniform("lightmap", soup3D.INT_VEC1, 2)
+        self.shader_program.uniform("lightData", soup3D.INT_VEC1, soup3D.light.LIGHT_DATA_UNIT)
+        self.shader_program.uniform("clusterRanges", soup3D.INT_VEC1, soup3D.light.CLUSTER_RANGES_UNIT)
+        self.shader_program.uniform("clusterLights", soup3D.INT_VEC1, soup3D.light.CLUSTER_LIGHTS_UNIT)
+        self.shader_program.uniform("shadowMaps", soup3D.INT_VEC1, soup3D.shadow.SHADOW_UNIT)
+
+        # 注册到矩阵更新队列
+        set_mat_queue[id(self)] = self
+
+        self.dirty = True
+        self.bones_dirty = self.skinned
+
+        # 将自身注册到所有骨骼的着色器通知列表
+        if self.skinned:
+            skeleton_obj = self._get_skeleton_obj()
+            for bone in skeleton_obj.bones.values():
+                bone._bound_shaders[id(self)] = self
+
+    def mark_bones_dirty(self):
+        """
+        标记骨骼需要更新，在骨骼变化时自动调用
+        :return: None
+        """
+        self.bones_dirty = True
+        self.dirty = True
+
+    def is_ready(self) -> bool:
+        """
+        查询着色器是否已编译完成，尚未发起编译时会发起编译
+        :return: 是否可以使用该管线绘制
+        """
+        return self.shader_program.is_ready()
+
+    def warm_up(self, wait: bool = False):
+        """
+        预热着色器，提前发起编译，避免首次绘制时等待
+        :param wait: 是否等待编译完成
+        :return: None
+        """
+        if wait:
+            self.shader_program.wait()
+        else:
+            self.shader_program.compile()
+
+    def use(self):
+        """
+        使用该管线，会在应用时自动调用
+        :return: None
+        """
+        self.shader_program.use()
+
+    def unuse(self):
+        """
+        停用该管线，会在结束应用时自动调用
+        :return: None
+        """
+        self.shader_program.unuse()
+
+    def is_dirty(self):
+        return self.shader_program.dirty or self.dirty
+
+    def update(self):
+        """
+        向着色器上传骨骼数据
+        :return: None
+        """
+        if self.dirty:
+            if self.bones_dirty:
+                self._update_bone_matrices()
+                self.bones_dirty = False
+        if self.shader_program.is_dirty():
+            self.shader_program.update()
+        self.dirty = False
+
+    def get_pose_key(self) -> tuple | None:
+        """
+        获取骨骼姿态的版本，可用于判断蒙皮后的顶点是否变化
+        :return: 所有骨骼的版本，非骨骼蒙皮管线返回None
+        """
+        if not self.skinned:
+            return None
+        return tuple(bone.version for bone in self._get_skeleton_obj().bones.values())
+
+    def _get_skeleton_obj(self) -> soup3D.skeleton.Skeleton:
+        """获取Skeleton对象，骨骼字典只会转换一次，以便复用骨架缓存的骨骼矩阵"""
+        if self.skeleton_obj is None:
+            self.skeleton_obj = _skeleton_obj(self.skeleton)
+        return self.skeleton_obj
+
+    def _update_bone_matrices(self):
+        """将骨骼矩阵打包为连续数组，通过一次glUniformMatrix4fv上传到着色器"""
+        palette = self._get_skeleton_obj().get_bone_palette(self.max_bones)
+        self.shader_program.uniform(
+            "boneMatrices",
+            soup3D.ARRAY_MATRIX_VEC4,
+            self.max_bones,
+            GL_FALSE,
+            palette
+        )
+
+    def __del__(self):
+        """
+        深度清理管线，从全局队列中移除该管线
+        :return: None
+        """
+        if id(self) in set_mat_queue:
+            del set_mat_queue[id(self)]
+
+        self.shader_program = None
+        self.skeleton = None
+        self.skeleton_obj = None
+
+
 class AutoSP:
+    vbo_type = [soup3D.name.FLOAT, soup3D.name.FLOAT, soup3D.name.FLOAT]  # 位置、纹理坐标、法线
+
     def __init__(self,
                  base_color: "Img",
                  normal: "list | tuple | Img" = (0.5, 0.5, 1),
                  emission: "list | tuple | Img" = (0, 0, 0),
                  double_side: bool = True,
                  max_light_count: int = 8,
-                 shader_program: ShaderProgram | None = None):
+                 shader_program: ShaderProgram | None = None,
+                 alpha_test: bool = False,
+                 unlit: bool = False,
+                 lightmap: "Img | None" = None):
         """
         更具用户提供的参数自动生成ShaderProgram类，并在需要时自动调用ShaderProgram的类成员，作为表面着色器渲染时使用的顶点列表格式：
         [
@@ -621,6 +1683,8 @@ class AutoSP:
 
         nx, ny, nz: 顶点法线偏移，默认为0
 
+        AutoSP作为材质使用，只保存纹理与材质常量；着色器程序由特性相同的材质共享的管线(Pipeline)管理。
+
         :param base_color:      主要颜色
         :param normal:          自定义法线或法线贴图
         :param emission:        自发光度，
@@ -628,43 +1692,38 @@ class AutoSP:
                                 当该参数为灰度图时，黑色为不发光，白色为完全发光
         :param double_side:     是否启用双面渲染
         :param max_light_count: 该着色器使用时会同时出现的最多的光源数量
-        :param shader_program:  被AutoSP管理的着色器程序，若为None，则生成着色器程序。该参数为内部调用参数，可以但不建议直接使用该参数。
+        :param shader_program:  被AutoSP管理的着色器程序，若为None，则使用共享的着色器程序。该参数为内部调用参数，可以但不建议直接使用
+                                该参数。
+        :param alpha_test:      是否丢弃不透明度低于0.5的片段
+        :param unlit:           是否跳过光照计算，直接显示主要颜色与自发光
+        :param lightmap:        烘焙的光照贴图，与主要颜色使用相同的uv坐标，通常由soup3D.bake生成。设置后不再逐片段计算光源
         """
         self.base_color = base_color
         self.normal = normal
         self.emission = emission
         self.double_side = double_side
         self.max_light_count = max_light_count
+        self.alpha_test = alpha_test
+        self.unlit = unlit
+        self.lightmap = lightmap
 
-        # 生成着色器程序
-        self.shader_program = shader_program
-        if shader_program is None:
-            self.shader_program = self.create_shader_program()
+        self._bound_models = weakref.WeakValueDictionary()  # 使用该材质的模型
 
-        # 存储矩阵
-        self.model_mat = glm.mat4(1.0)
-        self.view_mat = glm.mat4(1.0)
-        self.projection_mat = glm.mat4(1.0)
+        # 获取管线
+        self.pipeline = None
+        self.shader_program = None
+        self._set_pipeline(shader_program)
 
-        # 注册到矩阵更新队列
-        set_mat_queue[id(self)] = self
-
-        soup3D.light.dirty = True
-
-        self.dirty = True
-
-        self.model_dirty = True
-        self.view_dirty = True
-        self.projection_dirty = True
-
-        self.light_dirty = True
+        # 生成纹理
+        self._gen_textures(True, True, True, True)
 
     def retexture(self,
                   base_color: "None | Img" = None,
                   normal: "None | list | tuple | Img" = None,
                   emission: "None | list | tuple | Img" = None):
         """
-        重新向着色器上传纹理，填写None则保持原纹理不变
+        重新设置材质的纹理，填写None则保持原纹理不变。当法线或自发光在常量与贴图之间切换时，会改用对应的管线。使用该材质的模型会在下一
+        帧重新生成显示列表。
         :param base_color: 主要颜色
         :param normal:     自定义法线或法线贴图
         :param emission:   自发光度，
@@ -672,248 +1731,198 @@ class AutoSP:
                            当该参数为灰度图时，黑色为不发光，白色为完全发光
         :return: None
         """
+        old_features = self._variant_features()
 
-        # 更新基础颜色纹理
         if base_color is not None:
             self.base_color = base_color
-            self.shader_program.uniform_tex("baseColor", self.base_color, 0)
-
-        # 更新法线贴图
         if normal is not None:
-                
             self.normal = normal
-            if isinstance(self.normal, (list, tuple)):
-                # 如果是元组或列表，创建混合通道纹理
-                normal_texture = MixChannel((1, 1), *self.normal)
-                self.shader_program.uniform_tex("normal", normal_texture, 1)
-            else:
-                # 如果是纹理对象，直接使用
-                self.shader_program.uniform_tex("normal", self.normal, 1)
-
-        # 更新自发光贴图
         if emission is not None:
             self.emission = emission
-            if isinstance(self.emission, (list, tuple)):
-                # 如果是元组或列表，创建混合通道纹理
-                emission_texture = MixChannel((1, 1), *self.emission)
-                self.shader_program.uniform_tex("emission", emission_texture, 3)
-            else:
-                # 如果是纹理对象，直接使用
-                self.shader_program.uniform_tex("emission", self.emission, 3)
 
-    def create_shader_program(self) -> ShaderProgram:
-        """根据参数创建着色器程序"""
-        vertex_shader = """
-        #version 330 core
-        layout(location = 0) in vec3 VertPos;
-        layout(location = 1) in vec2 VertUV;
-        layout(location = 2) in vec3 VertNormal;
-        
-        out vec2 TexCoord;
-        out vec3 FragPos;
-        out vec3 Normal;
-        
-        uniform mat4 model;       // 模型矩阵
-        uniform mat4 view;        // 相机矩阵
-        uniform mat4 projection;  // 透视矩阵
-        
-        void main()
-        {
-            FragPos = vec3(model * vec4(VertPos, 1.0));
-            mat3 normalMatrix = transpose(inverse(mat3(model)));
-            Normal = normalMatrix * VertNormal;
-        
-            gl_Position = projection * view * vec4(FragPos, 1.0);
-            TexCoord = vec2(VertUV.x, 1-VertUV.y);
-        }
-        
-        
+        if self._variant_features() != old_features:
+            # 贴图类型发生变化，切换管线
+            self._rebuild_shader_program()
+
+        self._gen_textures(base_color is not None, normal is not None, emission is not None)
+
+        # 纹理与材质常量被录制在显示列表中，需要重新生成显示列表
+        for model in list(self._bound_models.values()):
+            model.mark_list_dirty()
+
+    def set_lightmap(self, lightmap: "Img | None"):
         """
+        设置烘焙的光照贴图，填写None则恢复逐片段计算光源。使用该材质的模型会在下一帧重新生成显示列表。
+        :param lightmap: 光照贴图
+        :return: None
+        """
+        old_features = self._variant_features()
+        self.lightmap = lightmap
 
-        fragment_shader = """
-        #version 330 core
-        in vec2 TexCoord;
-        in vec3 FragPos;
-        in vec3 Normal;
-        out vec4 FragColor;
-        
-        // 材质属性
-        uniform sampler2D baseColor;
-        uniform sampler2D normal;
-        uniform sampler2D emission;
-        
-        // 光照属性
-        struct Light {
-            vec3 position;
-            vec3 direction;
-            vec3 color;
-            float attenuation;
-            float angle;
-            float cosAngle;
-            int type;
-        };
-        
-        uniform Light lights[%i];
-        uniform int lightCount;
-        uniform vec3 ambient;
-        
-        void main()
-        {
-            vec3 SideNormal = Normal;
-            %s
-        
-            // 基础颜色
-            vec4 base = texture(baseColor, TexCoord);
-        
-            // 法线处理
-            vec4 norm_tex = texture(normal, TexCoord);
-            vec3 norm = normalize(SideNormal) + vec3(norm_tex.rg*2-1, norm_tex.b-1);
-        
-            // 自发光
-            vec4 emi = texture(emission, TexCoord);
-        
-            // 漫反射贡献
-            vec3 diffuse = vec3(0.0);
-        
-            // 遍历所有光源
-            for (int i = 0; i < lightCount; i++) {
-                vec3 lightDir;
-                float attenuation = 1.0;
-                float spotFactor = 1.0;
-        
-                if (lights[i].type == 0) {
-                    lightDir = normalize(lights[i].position - FragPos);
-        
-                    // 计算衰减
-                    float distance = length(lights[i].position - FragPos);
-                    attenuation = 1.0 / (1.0 + lights[i].attenuation * distance);
-        
-                    // 计算聚光灯效果
-                    vec3 spotDir = normalize(-lights[i].direction);
-                    float cosTheta = dot(lightDir, spotDir);
-        
-                    // 检查是否在聚光灯锥角内
-                    if (cosTheta > lights[i].cosAngle) {
-                        // 计算聚光灯衰减（边缘平滑过渡）
-                        float epsilon = lights[i].cosAngle - lights[i].cosAngle * 0.9;
-                        spotFactor = clamp((cosTheta - lights[i].cosAngle) / epsilon, 0.0, 1.0);
-                    } else {
-                        spotFactor = 0.0;
-                    }
-                    attenuation *= spotFactor;
-                } else { // 方向光
-                    lightDir = normalize(lights[i].direction);
-                }
-        
-                // 漫反射计算
-                float diff = max(dot(norm, lightDir), 0.0);
-                diffuse += lights[i].color * diff * attenuation;
-            }
-        
-            // 最终颜色 = (环境光 + 漫反射) * 基础颜色 + 自发光
-            vec3 result = (ambient + diffuse) * base.rgb + base.rgb * emi.rgb;
-            FragColor = vec4(result, base.a);
+        if self._variant_features() != old_features:
+            self._rebuild_shader_program()
+
+        self._gen_textures(False, False, False, True)
+
+        for model in list(self._bound_models.values()):
+            model.mark_list_dirty()
+
+    def _variant_features(self) -> dict:
+        """
+        根据材质参数确定着色器变体特性
+        :return: 传入shader_variant的特性参数
+        """
+        has_emission_map = not isinstance(self.emission, (list, tuple))
+        return {
+            "double_side": self.double_side,
+            "alpha_test": self.alpha_test,
+            "normal_map": not isinstance(self.normal, (list, tuple)),
+            "emission": has_emission_map or any(value != 0 for value in self.emission),
+            "emission_map": has_emission_map,
+            "unlit": self.unlit,
+            "max_light_count": self.max_light_count,
+            "clustered": soup3D.light.clustered,
+            "deferred": soup3D.deferred.enabled,
+            "lightmap": self.lightmap is not None,
         }
+
+    def _get_skeleton(self):
         """
+        获取管线使用的骨架，普通材质不使用骨架
+        :return: 骨架
+        """
+        return None
 
-        if self.double_side:
-            fragment_shader = fragment_shader % (
-                self.max_light_count,
-                """
-                if (!gl_FrontFacing) {
-                    SideNormal = -Normal;
-                }
-                """
-            )
+    def _set_pipeline(self, shader_program: ShaderProgram | None = None):
+        """
+        设置材质使用的管线
+        :param shader_program: 管线使用的着色器程序，若为None，则获取特性相同的共享管线
+        :return: None
+        """
+        if shader_program is None:
+            self.pipeline = get_pipeline(self._variant_features(), self.vbo_type, self._get_skeleton())
         else:
-            fragment_shader = fragment_shader % (
-                self.max_light_count,
-                """
-                if (!gl_FrontFacing) {
-                    discard;
-                }
-                """
-            )
+            self.pipeline = Pipeline(self._variant_features(), self.vbo_type, shader_program, self._get_skeleton())
+        self.shader_program = self.pipeline.shader_program
 
-        # 创建着色器程序
-        shader_program = ShaderProgram(
-            vertex_shader,
-            fragment_shader,
-            vbo_type=[soup3D.FLOAT, soup3D.FLOAT, soup3D.FLOAT]  # 位置、纹理坐标、法线
-        )
+    def _rebuild_shader_program(self):
+        """根据当前材质参数重新获取管线"""
+        self._set_pipeline()
 
-        # 设置基础颜色纹理
-        shader_program.uniform_tex("baseColor", self.base_color, 0)
+    def _gen_textures(self, base_color: bool, normal: bool, emission: bool, lightmap: bool = False):
+        """
+        为材质用到的贴图生成OpenGL纹理
+        :param base_color: 是否生成主要颜色纹理
+        :param normal:     是否生成法线纹理
+        :param emission:   是否生成自发光纹理
+        :param lightmap:   是否生成光照贴图纹理
+        :return: None
+        """
+        if base_color:
+            self.base_color.gen_gl_texture(0)
+        if normal and not isinstance(self.normal, (list, tuple)):
+            self.normal.gen_gl_texture(1)
+        if emission and not isinstance(self.emission, (list, tuple)):
+            self.emission.gen_gl_texture(3)
+        if lightmap and self.lightmap is not None:
+            self.lightmap.gen_gl_texture(2)
 
-        # 设置法线
-        if isinstance(self.normal, (list | tuple)):
-            normal_texture = MixChannel((1, 1), *self.normal)
-            shader_program.uniform_tex("normal",
-                                       normal_texture,
-                                       1)
-        else:
-            shader_program.uniform_tex("normal",
-                                       self.normal,
-                                       1)
-
-        # 设置自发光
-        if isinstance(self.emission, (list | tuple)):
-            emission_texture = MixChannel((1, 1), *self.emission)
-            shader_program.uniform_tex("emission",
-                                       emission_texture,
-                                       3)
-        else:
-            shader_program.uniform_tex("emission",
-                                       self.emission,
-                                       3)
+    def create_shader_program(self) -> ShaderProgram:
+        """获取与该材质特性相同的共享管线的着色器程序"""
+        return get_pipeline(self._variant_features(), self.vbo_type, self._get_skeleton()).shader_program
 
-        return shader_program
+    def register_model(self, model):
+        """
+        记录使用该材质的模型，在生成显示列表时自动调用
+        :param model: 使用该材质的模型
+        :return: None
+        """
+        self._bound_models[id(model)] = model
 
     def set_model_mat(self, mat: glm.mat4):
         """
-        设置模型矩阵，在变换矩阵时自动调用
+        已弃用。模型矩阵已改由绘制数据环形缓冲区提供，传入的矩阵不会生效，请通过模型的移动、旋转与缩放设置模型变换。
         :param mat: 模型矩阵
         :return: None
         """
-        self.model_mat = mat
-        self.dirty = True
-        self.model_dirty = True
+        warnings.warn(
+            "AutoSP.set_model_mat() has no effect, model matrices come from the per-draw ring buffer",
+            DeprecationWarning, stacklevel=2
+        )
 
     def set_view_mat(self, mat: glm.mat4):
         """
-        设置投影矩阵，在变换矩阵时自动调用
-        :param mat: 投影矩阵
+        已弃用。视图矩阵已改由相机统一缓冲区提供，传入的矩阵不会生效，请通过soup3D.camera设置相机。
+        :param mat: 视图矩阵
         :return: None
         """
-        self.view_mat = mat
-        self.dirty = True
-        self.view_dirty = True
+        warnings.warn(
+            "AutoSP.set_view_mat() has no effect, the view matrix comes from the camera uniform buffer",
+            DeprecationWarning, stacklevel=2
+        )
+        soup3D.camera.mark_dirty()
 
     def set_projection_mat(self, mat: glm.mat4):
         """
-        设置视图矩阵，在变换矩阵时自动调用
-        :param mat: 视图矩阵
+        已弃用。投影矩阵已改由相机统一缓冲区提供，传入的矩阵不会生效，请通过soup3D.init与soup3D.resize设置透视。
+        :param mat: 投影矩阵
         :return: None
         """
-        self.projection_mat = mat
-        self.dirty = True
-        self.projection_dirty = True
+        warnings.warn(
+            "AutoSP.set_projection_mat() has no effect, the projection matrix comes from the camera uniform buffer",
+            DeprecationWarning, stacklevel=2
+        )
+        soup3D.camera.mark_dirty()
 
     def set_light(self):
         """
-        设置光照，在添加、减少光照时自动调用
-        :param light_queue: 光照列队
+        设置光照。光源已改由光源统一缓冲区提供，保留该方法以兼容旧代码。
         :return: None
         """
-        self.dirty = True
-        self.light_dirty = True
+        soup3D.light.dirty = True
+
+    def is_ready(self) -> bool:
+        """
+        查询着色器是否已编译完成，尚未发起编译时会发起编译
+        :return: 是否可以使用该着色器绘制
+        """
+        return self.pipeline.is_ready()
+
+    def warm_up(self, wait: bool = False):
+        """
+        预热着色器，提前发起编译，避免首次绘制时等待
+        :param wait: 是否等待编译完成
+        :return: None
+        """
+        self.pipeline.warm_up(wait)
 
     def use(self):
         """
         使用该着色器，会在应用时自动调用
         :return: None
         """
-        self.shader_program.use()
+        self.pipeline.use()
+        self.bind()
+
+    def bind(self):
+        """
+        绑定材质的纹理并设置材质常量，会在管线已启用后自动调用。生成显示列表时，这些操作会被录制在显示列表中。
+        :return: None
+        """
+        soup3D.state.bind_texture(0, GL_TEXTURE_2D, self.base_color.get_texture_id())
+
+        if isinstance(self.normal, (list, tuple)):
+            self.shader_program.uniform_now("normalConst", soup3D.FLOAT_VEC3, *self.normal[:3])
+        else:
+            soup3D.state.bind_texture(1, GL_TEXTURE_2D, self.normal.get_texture_id())
+
+        if isinstance(self.emission, (list, tuple)):
+            self.shader_program.uniform_now("emissionConst", soup3D.FLOAT_VEC3, *self.emission[:3])
+        else:
+            soup3D.state.bind_texture(3, GL_TEXTURE_2D, self.emission.get_texture_id())
+
+        if self.lightmap is not None:
+            soup3D.state.bind_texture(2, GL_TEXTURE_2D, self.lightmap.get_texture_id())
 
     def rend(self, mode, vertex):
         """
@@ -922,6 +1931,14 @@ class AutoSP:
         :param vertex: 表面中所有的顶点
         :return: None
         """
+        self.shader_program.rend(mode, self._split_vertices(vertex))
+
+    def _split_vertices(self, vertex) -> list:
+        """
+        将顶点拆分为位置、纹理坐标和法线三组顶点属性
+        :param vertex: 表面中所有的顶点
+        :return: [位置列表, 纹理坐标列表, 法线列表]
+        """
         # 计算面法线（使用前三个顶点）
         normal = [0.0, 0.0, 1.0]  # 默认法线
         if len(vertex) >= 3:
@@ -976,105 +1993,27 @@ class AutoSP:
         tex_coords = tex_coords[:min_len]
         normals = normals[:min_len]
 
-        # 渲染
-        self.shader_program.rend(mode, [positions, tex_coords, normals])
+        return [positions, tex_coords, normals]
+
 
     def unuse(self):
         """
         停用该着色器，会在结束应用时自动调用
         :return: None
         """
-        self.shader_program.unuse()
+        self.pipeline.unuse()
 
     def is_dirty(self):
-        return self.shader_program.dirty or self.dirty
+        return self.pipeline.is_dirty()
 
     def update(self):
-        if self.dirty:
-            if self.model_dirty:
-                self.shader_program.uniform(
-                    "model",
-                    soup3D.ARRAY_MATRIX_VEC4,
-                    1,
-                    GL_FALSE,
-                    glm.value_ptr(self.model_mat)
-                )
-                self.model_dirty = False
-            if self.view_dirty:
-                self.shader_program.uniform(
-                    "view",
-                    soup3D.ARRAY_MATRIX_VEC4,
-                    1,
-                    GL_FALSE,
-                    glm.value_ptr(self.view_mat)
-                )
-                self.view_dirty = False
-            if self.projection_dirty:
-                self.shader_program.uniform(
-                    "projection",
-                    soup3D.ARRAY_MATRIX_VEC4,
-                    1,
-                    GL_FALSE,
-                    glm.value_ptr(self.projection_mat)
-                )
-                self.projection_dirty = False
-            if self.light_dirty:
-                ambient = glGetFloatv(GL_LIGHT_MODEL_AMBIENT)[:3]
-                self.shader_program.uniform("ambient", soup3D.FLOAT_VEC3, *ambient)
-
-                # 收集有效光源
-                light_count = 0
-                for light_id, light in light_queue.items():
-                    if light.on and light_count < self.max_light_count:
-                        if isinstance(light, soup3D.light.Cone):
-                            # 点光源（聚光灯）
-                            direction = light._calc_direction()
-                            # 计算锥角的余弦值
-                            cos_angle = math.cos(math.radians(light.angle / 2))
-
-                            self.shader_program.uniform(f"lights[{light_count}].position", soup3D.FLOAT_VEC3,
-                                                        *light.place)
-                            self.shader_program.uniform(f"lights[{light_count}].direction", soup3D.FLOAT_VEC3,
-                                                        *direction)
-                            self.shader_program.uniform(f"lights[{light_count}].color", soup3D.FLOAT_VEC3, *light.color)
-                            self.shader_program.uniform(f"lights[{light_count}].attenuation", soup3D.FLOAT_VEC1,
-                                                        light.attenuation)
-                            self.shader_program.uniform(f"lights[{light_count}].cosAngle", soup3D.FLOAT_VEC1, cos_angle)
-                            self.shader_program.uniform(f"lights[{light_count}].type", soup3D.INT_VEC1, 0)
-                            light_count += 1
-                        elif isinstance(light, soup3D.light.Direct):
-                            # 方向光
-                            direction = light._calc_direction()
-                            self.shader_program.uniform(f"lights[{light_count}].position", soup3D.FLOAT_VEC3, 0, 0, 0)
-                            self.shader_program.uniform(f"lights[{light_count}].direction", soup3D.FLOAT_VEC3,
-                                                        *direction)
-                            self.shader_program.uniform(f"lights[{light_count}].color", soup3D.FLOAT_VEC3, *light.color)
-                            self.shader_program.uniform(f"lights[{light_count}].attenuation", soup3D.FLOAT_VEC1, 0.0)
-                            self.shader_program.uniform(f"lights[{light_count}].cosAngle", soup3D.FLOAT_VEC1, 0.0)
-                            self.shader_program.uniform(f"lights[{light_count}].type", soup3D.INT_VEC1, 1)
-                            light_count += 1
-
-                # 设置光源数量
-                self.shader_program.uniform("lightCount", soup3D.INT_VEC1, light_count)
-
-                # 填充剩余光源槽位
-                for i in range(light_count, self.max_light_count):
-                    self.shader_program.uniform(f"lights[{i}].color", soup3D.FLOAT_VEC3, 0.0, 0.0, 0.0)
-
-                self.light_dirty = False
-        if self.shader_program.is_dirty():
-            self.shader_program.update()
-        self.dirty = False
+        self.pipeline.update()
 
     def __del__(self):
         """
         深度清理着色器，清理该着色器本身及所有该着色器用到的元素。在确定不再使用该着色器时可使用该方法释放内存。
         :return: None
         """
-        # 从全局队列中移除
-        if id(self) in set_mat_queue:
-            del set_mat_queue[id(self)]
-
         # 清理材质相关资源
         if self.base_color:
             self.base_color = None
@@ -1085,16 +2024,16 @@ class AutoSP:
         if self.emission and not isinstance(self.emission, (list, tuple)):
             self.emission = None
 
-        if self.shader_program:
-            self.shader_program = None
-
-        # 清理矩阵
-        self.model_mat = None
-        self.view_mat = None
-        self.projection_mat = None
+        # 释放管线，没有材质使用的管线会被自动回收
+        self.shader_program = None
+        self.pipeline = None
 
 
 class BoneBinderSP(AutoSP):
+    vbo_type = [
+        soup3D.name.FLOAT, soup3D.name.FLOAT, soup3D.name.FLOAT, soup3D.name.INT_US, soup3D.name.FLOAT
+    ]  # 位置、纹理坐标、法线、骨骼编号、骨骼权重
+
     def __init__(self,
                  base_color: "Img",
                  normal: "list | tuple | Img" = (0.5, 0.5, 1),
@@ -1102,7 +2041,9 @@ class BoneBinderSP(AutoSP):
                  double_side: bool = True,
                  max_light_count: int = 8,
                  shader_program: ShaderProgram | None = None,
-                 skeleton: soup3D.skeleton.Skeleton | dict = None):
+                 skeleton: soup3D.skeleton.Skeleton | dict = None,
+                 alpha_test: bool = True,
+                 unlit: bool = False):
         """
         骨骼绑定着色器，作为表面着色器渲染时使用的顶点列表格式：
         [
@@ -1123,6 +2064,8 @@ class BoneBinderSP(AutoSP):
 
         nx, ny, nz: 顶点法线偏移，默认为0
 
+        使用同一骨架且特性相同的材质共享同一管线，骨骼矩阵每帧只需上传一次。
+
         :param base_color:      主要颜色
         :param normal:          自定义法线或法线贴图
         :param emission:        自发光度，
@@ -1130,8 +2073,11 @@ class BoneBinderSP(AutoSP):
                                 当该参数为灰度图时，黑色为不发光，白色为完全发光
         :param double_side:     是否启用双面渲染
         :param max_light_count: 该着色器使用时会同时出现的最多的光源数量
-        :param shader_program:  被AutoSP管理的着色器程序，若为None，则生成着色器程序。该参数为内部调用参数，可以但不建议直接使用该参数。
+        :param shader_program:  被AutoSP管理的着色器程序，若为None，则使用共享的着色器程序。该参数为内部调用参数，可以但不建议直接使用
+                                该参数。
         :param skeleton:        一个Skeleton对象或包含多个骨头的字典，格式：{name: bone, name: bone, ...}
+        :param alpha_test:      是否丢弃不透明度低于0.5的片段
+        :param unlit:           是否跳过光照计算，直接显示主要颜色与自发光
         """
         # 如果skeleton为None，创建一个空的Skeleton对象
         if skeleton is None:
@@ -1140,196 +2086,25 @@ class BoneBinderSP(AutoSP):
             self.skeleton = skeleton
 
         self.max_bones = len(self.skeleton.bones)  # 最大骨骼数量
-        self.bones_dirty = True  # 骨骼矩阵更新标记
 
-        super().__init__(base_color, normal, emission, double_side, max_light_count, shader_program)
+        super().__init__(base_color, normal, emission, double_side, max_light_count, shader_program, alpha_test, unlit)
 
-        # 将自身注册到所有骨骼的着色器通知列表
-        skeleton_obj = self._get_skeleton_obj()
-        for bone in skeleton_obj.bones.values():
-            bone._bound_shaders[id(self)] = self
-
-    def create_shader_program(self):
-        """根据参数创建着色器程序"""
-        vertex_shader = """
-        #version 330 core
-        layout(location = 0) in vec3 VertPos;
-        layout(location = 1) in vec2 VertUV;
-        layout(location = 2) in vec3 VertNormal;
-        layout(location = 3) in uvec4 BoneIDs;
-        layout(location = 4) in vec4 BoneWeights;
-
-        out vec2 TexCoord;
-        out vec3 FragPos;
-        out vec3 Normal;
-
-        uniform mat4 model;       // 模型矩阵
-        uniform mat4 view;        // 相机矩阵
-        uniform mat4 projection;  // 透视矩阵
-        uniform mat4 boneMatrices[%d];
-
-        void main()
-        {
-            // 计算骨骼蒙皮变换矩阵
-            mat4 skinMatrix = mat4(0.0);
-            float totalWeight = 0.0;
-            for (int i = 0; i < 4; i++) {
-                skinMatrix += BoneWeights[i] * boneMatrices[int(BoneIDs[i])];
-                totalWeight += BoneWeights[i];
-            }
-
-            // 无骨骼绑定时使用单位矩阵，避免顶点被移动到原点
-            if (totalWeight < 0.001) {
-                skinMatrix = mat4(1.0);
-            }
-
-            // 应用蒙皮变换
-            vec4 skinnedPos = skinMatrix * vec4(VertPos, 1.0);
-            FragPos = vec3(model * skinnedPos);
-
-            // 法线变换
-            mat3 skinNormalMatrix = transpose(inverse(mat3(model * skinMatrix)));
-            Normal = skinNormalMatrix * VertNormal;
-
-            gl_Position = projection * view * vec4(FragPos, 1.0);
-            TexCoord = vec2(VertUV.x, 1.0 - VertUV.y);
-        }
+    def _variant_features(self) -> dict:
         """
-
-        fragment_shader = """
-        #version 330 core
-        in vec2 TexCoord;
-        in vec3 FragPos;
-        in vec3 Normal;
-        out vec4 FragColor;
-
-        // 材质属性
-        uniform sampler2D baseColor;
-        uniform sampler2D normal;
-        uniform sampler2D emission;
-
-        // 光照属性
-        struct Light {
-            vec3 position;
-            vec3 direction;
-            vec3 color;
-            float attenuation;
-            float angle;
-            float cosAngle;
-            int type;
-        };
-
-        uniform Light lights[8];
-        uniform int lightCount;
-        uniform vec3 ambient;
-
-        void main()
-        {
-            vec3 SideNormal = Normal;
-            %s
-
-            // 基础颜色
-            vec4 base = texture(baseColor, TexCoord);
-            
-            if (base.a < 0.5) {
-                discard;
-            }
-
-            // 法线处理
-            vec4 norm_tex = texture(normal, TexCoord);
-            vec3 norm = normalize(SideNormal) + vec3(norm_tex.rg*2-1, norm_tex.b-1);
-
-            // 自发光
-            vec4 emi = texture(emission, TexCoord);
-
-            // 漫反射贡献
-            vec3 diffuse = vec3(0.0);
-
-            // 遍历所有光源
-            for (int i = 0; i < lightCount; i++) {
-                vec3 lightDir;
-                float attenuation = 1.0;
-                float spotFactor = 1.0;
-
-                if (lights[i].type == 0) {
-                    lightDir = normalize(lights[i].position - FragPos);
-
-                    // 计算衰减
-                    float distance = length(lights[i].position - FragPos);
-                    attenuation = 1.0 / (1.0 + lights[i].attenuation * distance);
-
-                    // 计算聚光灯效果
-                    vec3 spotDir = normalize(-lights[i].direction);
-                    float cosTheta = dot(lightDir, spotDir);
-
-                    // 检查是否在聚光灯锥角内
-                    if (cosTheta > lights[i].cosAngle) {
-                        // 计算聚光灯衰减（边缘平滑过渡）
-                        float epsilon = lights[i].cosAngle - lights[i].cosAngle * 0.9;
-                        spotFactor = clamp((cosTheta - lights[i].cosAngle) / epsilon, 0.0, 1.0);
-                    } else {
-                        spotFactor = 0.0;
-                    }
-                    attenuation *= spotFactor;
-                } else { // 方向光
-                    lightDir = normalize(lights[i].direction);
-                }
-
-                // 漫反射计算
-                float diff = max(dot(norm, lightDir), 0.0);
-                diffuse += lights[i].color * diff * attenuation;
-            }
-
-            // 最终颜色 = (环境光 + 漫反射) * 基础颜色 + 自发光
-            vec3 result = (ambient + diffuse) * base.rgb + base.rgb * emi.rgb;
-            FragColor = vec4(result, base.a);
-        }
+        根据材质参数确定着色器变体特性，在AutoSP的基础上开启骨骼蒙皮
+        :return: 传入shader_variant的特性参数
         """
+        features = super()._variant_features()
+        features["skinned"] = True
+        features["max_bones"] = self.max_bones
+        return features
 
-        vertex_shader = vertex_shader % self.max_bones
-
-        if self.double_side:
-            fragment_shader = fragment_shader % (
-                """
-                if (!gl_FrontFacing) {
-                    SideNormal = -Normal;
-                }
-                """
-            )
-        else:
-            fragment_shader = fragment_shader % (
-                """
-                if (!gl_FrontFacing) {
-                    discard;
-                }
-                """
-            )
-
-        # 创建着色器程序
-        shader_program = ShaderProgram(
-            vertex_shader,
-            fragment_shader,
-            vbo_type=[soup3D.FLOAT, soup3D.FLOAT, soup3D.FLOAT, soup3D.INT_US, soup3D.FLOAT]
-        )
-
-        # 设置基础颜色纹理
-        shader_program.uniform_tex("baseColor", self.base_color, 0)
-
-        # 设置法线
-        if isinstance(self.normal, (list | tuple)):
-            normal_texture = MixChannel((1, 1), *self.normal)
-            shader_program.uniform_tex("normal", normal_texture, 1)
-        else:
-            shader_program.uniform_tex("normal", self.normal, 1)
-
-        # 设置自发光
-        if isinstance(self.emission, (list | tuple)):
-            emission_texture = MixChannel((1, 1), *self.emission)
-            shader_program.uniform_tex("emission", emission_texture, 3)
-        else:
-            shader_program.uniform_tex("emission", self.emission, 3)
-
-        return shader_program
+    def _get_skeleton(self):
+        """
+        获取管线使用的骨架
+        :return: 骨架
+        """
+        return self.skeleton
 
     def rend(self, mode, vertex):
         """
@@ -1407,76 +2182,548 @@ class BoneBinderSP(AutoSP):
         # 渲染
         self.shader_program.rend(mode, [positions, tex_coords, normals, bone_ids, bone_weights])
 
-    def update(self):
-        """更新着色器"""
-        if self.dirty:
-            if self.bones_dirty:
-                self._update_bone_matrices()
-                self.bones_dirty = False
-
-        super().update()
 
     def set_skeleton(self, skeleton: soup3D.skeleton.Skeleton | dict):
         """
-        设置骨架
+        设置骨架，会改用该骨架对应的管线，使用该材质的模型会在下一帧重新生成显示列表
         :param skeleton: Skeleton对象或骨骼字典
         :return: None
         """
         self.skeleton = skeleton
-        self.bones_dirty = True
-        self.dirty = True
+        self._rebuild_shader_program()
+        for model in list(self._bound_models.values()):
+            model.mark_list_dirty()
 
     def mark_bones_dirty(self):
         """标记骨骼需要更新"""
-        self.bones_dirty = True
-        self.dirty = True
+        self.pipeline.mark_bones_dirty()
 
     def _get_skeleton_obj(self) -> soup3D.skeleton.Skeleton:
         """获取Skeleton对象"""
-        if isinstance(self.skeleton, soup3D.skeleton.Skeleton):
-            return self.skeleton
-        elif isinstance(self.skeleton, dict):
-            # 如果是字典，转换为Skeleton对象
-            skel = soup3D.skeleton.Skeleton()
-            for name, bone in self.skeleton.items():
-                skel.add_bone(name, bone)
-            return skel
-        else:
-            # 返回空骨架
-            return soup3D.skeleton.Skeleton()
+        return _skeleton_obj(self.skeleton)
 
     def _update_bone_matrices(self):
         """更新骨骼矩阵到着色器"""
-        skeleton_obj = self._get_skeleton_obj()
+        self.pipeline._update_bone_matrices()
 
-        # 获取最大骨骼数量
-        max_bones = min(skeleton_obj.get_max_bones(), self.max_bones)
-
-        # 获取骨骼矩阵
-        bone_matrices = skeleton_obj.get_bone_matrices()
-
-        # 上传到着色器
-        for i in range(max_bones):
-            mat_ptr = glm.value_ptr(bone_matrices[i])
-            self.shader_program.uniform(
-                f"boneMatrices[{i}]",
-                soup3D.ARRAY_MATRIX_VEC4,
-                1,
-                GL_FALSE,
-                mat_ptr
-            )
 
-        # 填充剩余骨骼矩阵为单位矩阵
-        for i in range(max_bones, self.max_bones):
-            identity_mat = glm.mat4(1.0)
-            mat_ptr = glm.value_ptr(identity_mat)
-            self.shader_program.uniform(
-                f"boneMatrices[{i}]",
-                soup3D.ARRAY_MATRIX_VEC4,
-                1,
-                GL_FALSE,
-                mat_ptr
-            )
+class ArraySP(AutoSP):
+    def __init__(self,
+                 base_color: TextureArray,
+                 normal: "list | tuple | TextureArray" = (0.5, 0.5, 1),
+                 emission: "list | tuple | TextureArray" = (0, 0, 0),
+                 double_side: bool = True,
+                 max_light_count: int = 8,
+                 shader_program: ShaderProgram | None = None,
+                 alpha_test: bool = False,
+                 unlit: bool = False):
+        """
+        纹理数组材质，主要颜色、法线与自发光贴图来自纹理数组，作为表面着色器渲染时使用的顶点列表格式：
+        [
+            (x, y, z, u, v, layer) | (x, y, z, u, v, nx, ny, nz, layer),
+            ...
+        ]
+        其中：
+        x, y, z: 顶点3维坐标
+
+        u, v: 顶点对应的贴图uv坐标位置
+
+        nx, ny, nz: 顶点法线偏移，默认为0
+
+        layer: 顶点使用的贴图在纹理数组中的层序号
+
+        只有贴图不同的多个材质可以合并为一个ArraySP，使用这些材质的面合并后只需绑定一次纹理、绘制一次。通常由soup3D.texarray生成。
+
+        :param base_color:      主要颜色的纹理数组
+        :param normal:          自定义法线或法线贴图的纹理数组
+        :param emission:        自发光度，
+                                当该参数为数字时，0.0为不发光，1.0为完全发光；
+                                当该参数为纹理数组时，黑色为不发光，白色为完全发光
+        :param double_side:     是否启用双面渲染
+        :param max_light_count: 该着色器使用时会同时出现的最多的光源数量
+        :param shader_program:  被AutoSP管理的着色器程序，若为None，则使用共享的着色器程序。该参数为内部调用参数，可以但不建议直接使用
+                                该参数。
+        :param alpha_test:      是否丢弃不透明度低于0.5的片段
+        :param unlit:           是否跳过光照计算，直接显示主要颜色与自发光
+        """
+        super().__init__(base_color, normal, emission, double_side, max_light_count, shader_program, alpha_test, unlit)
+
+    def _variant_features(self) -> dict:
+        """
+        根据材质参数确定着色器变体特性，在AutoSP的基础上从纹理数组采样
+        :return: 传入shader_variant的特性参数
+        """
+        features = super()._variant_features()
+        features["texture_array"] = True
+        return features
+
+    def bind(self):
+        """
+        绑定材质的纹理数组并设置材质常量，会在管线已启用后自动调用
+        :return: None
+        """
+        soup3D.state.bind_texture(0, GL_TEXTURE_2D_ARRAY, self.base_color.get_texture_id())
+
+        if isinstance(self.normal, (list, tuple)):
+            self.shader_program.uniform_now("normalConst", soup3D.FLOAT_VEC3, *self.normal[:3])
+        else:
+            soup3D.state.bind_texture(1, GL_TEXTURE_2D_ARRAY, self.normal.get_texture_id())
+
+        if isinstance(self.emission, (list, tuple)):
+            self.shader_program.uniform_now("emissionConst", soup3D.FLOAT_VEC3, *self.emission[:3])
+        else:
+            soup3D.state.bind_texture(3, GL_TEXTURE_2D_ARRAY, self.emission.get_texture_id())
+
+        if self.lightmap is not None:
+            soup3D.state.bind_texture(2, GL_TEXTURE_2D, self.lightmap.get_texture_id())
+
+    def rend(self, mode, vertex):
+        """
+        创建该着色器的渲染流程
+        :param mode:   绘制方式
+        :param vertex: 表面中所有的顶点，格式：
+                       [
+                           (x, y, z, u, v, layer) | (x, y, z, u, v, nx, ny, nz, layer),
+                           ...
+                       ]
+        :return: None
+        """
+        positions, tex_coords, normals = self._split_vertices([v[:-1] for v in vertex])
+        # 层序号作为纹理坐标的第三个分量
+        tex_coords = [(s, t, float(v[-1])) for (s, t), v in zip(tex_coords, vertex)]
+        self.shader_program.rend(mode, [positions, tex_coords, normals])
+
+
+def _init_parallel_compile() -> None:
+    """
+    检测驱动是否支持GL_KHR_parallel_shader_compile，支持时开启驱动的多线程编译
+    :return: None
+    """
+    global parallel_compile
+
+    if parallel_compile is not None:
+        return
+
+    parallel_compile = bool(
+        hasGLExtension("GL_KHR_parallel_shader_compile") or hasGLExtension("GL_ARB_parallel_shader_compile")
+    )
+    if parallel_compile and glMaxShaderCompilerThreadsKHR is not None:
+        glMaxShaderCompilerThreadsKHR(0xFFFFFFFF)
+
+
+def _issue_shader(source: str, shader_type) -> int:
+    """
+    发起单个着色器的编译，不检查编译结果。相同代码的着色器只会编译一次，编译结果会被多个着色器程序共享。
+    :param source:      着色器代码
+    :param shader_type: 着色器类型，如GL_VERTEX_SHADER
+    :return: 着色器对象
+    """
+    key = (shader_type, source)
+    shader = shader_cache.get(key)
+    if shader is None:
+        shader = glCreateShader(shader_type)
+        glShaderSource(shader, source)
+        glCompileShader(shader)
+        shader_cache[key] = shader
+    return shader
+
+
+def light_count_bucket(count: int) -> int:
+    """
+    将光源数量向上取整到2的幂，相近光源数量的材质可共享同一个着色器变体
+    :param count: 光源数量
+    :return: 取整后的光源数量
+    """
+    bucket = 1
+    while bucket < count:
+        bucket *= 2
+    return bucket
+
+
+def shader_variant(double_side: bool = True,
+                   alpha_test: bool = False,
+                   skinned: bool = False,
+                   instanced: bool = False,
+                   normal_map: bool = False,
+                   emission: bool = False,
+                   emission_map: bool = False,
+                   unlit: bool = False,
+                   max_light_count: int = 8,
+                   max_bones: int = 0,
+                   clustered: bool = False,
+                   deferred: bool = False,
+                   lightmap: bool = False,
+                   texture_array: bool = False) -> tuple[str, str]:
+    """
+    获取内置表面着色器的变体代码，变体特性通过 #define 写入着色器代码，相同特性的变体只会生成一次
+    :param double_side:     是否启用双面渲染，为False时剔除背面
+    :param alpha_test:      是否丢弃不透明度低于0.5的片段
+    :param skinned:         是否启用骨骼蒙皮
+    :param instanced:       是否从顶点属性(location = 5)读取实例模型矩阵
+    :param normal_map:      法线是否来自贴图，为False时使用常量法线
+    :param emission:        是否存在自发光
+    :param emission_map:    自发光是否来自贴图，为False时使用常量自发光
+    :param unlit:           是否跳过光照计算
+    :param max_light_count: 最多的光源数量，会向上取整到2的幂
+    :param max_bones:       最多的骨骼数量，会向上取整到2的幂
+    :param clustered:       是否使用分簇光照，为True时每个片段只计算所在簇的光源，不受最多光源数量限制
+    :param deferred:        是否用于延迟渲染，为True时只将基础颜色、法线与自发光写入G缓冲区，光照在光照阶段计算
+    :param lightmap:        是否使用烘焙的光照贴图，为True时不再逐片段计算光源
+    :param texture_array:   主要颜色、法线与自发光贴图是否来自纹理数组，为True时纹理坐标(location = 1)的第三个分量为层
+    :return: (顶点着色器代码, 片段着色器代码)
+    """
+    light_bucket = min(light_count_bucket(max_light_count), MAX_LIGHT_CAPACITY)
+    bone_bucket = light_count_bucket(max_bones) if skinned else 0
+    lit = not unlit and not lightmap
+    key = (double_side, alpha_test, skinned, instanced, normal_map, emission, emission and emission_map, unlit,
+           light_bucket, bone_bucket, clustered and lit and not deferred, deferred, lightmap, texture_array)
+    if key in variant_cache:
+        return variant_cache[key]
+
+    defines = [f"#define MAX_LIGHTS {light_bucket}"]
+    if double_side:
+        defines.append("#define DOUBLE_SIDE")
+    if alpha_test:
+        defines.append("#define ALPHA_TEST")
+    if skinned:
+        defines.append("#define SKINNED")
+        defines.append(f"#define MAX_BONES {bone_bucket}")
+    if instanced:
+        defines.append("#define INSTANCED")
+    if normal_map:
+        defines.append("#define NORMAL_MAP")
+    if emission:
+        defines.append("#define HAS_EMISSION")
+        if emission_map:
+            defines.append("#define EMISSION_MAP")
+    if unlit:
+        defines.append("#define UNLIT")
+    elif lightmap:
+        defines.append("#define LIGHTMAP")
+    if texture_array:
+        defines.append("#define TEXTURE_ARRAY")
+    if deferred:
+        defines.append("#define DEFERRED")
+    elif clustered and lit:
+        defines.append("#define CLUSTERED")
+
+    header = "#version 330 core\n" + "\n".join(defines) + "\n"
+    variant_cache[key] = (header + AUTO_VERTEX_SHADER, header + AUTO_FRAGMENT_SHADER)
+    return variant_cache[key]
+
+
+def get_pipeline(features: dict,
+                 vbo_type: list | tuple,
+                 skeleton: "soup3D.skeleton.Skeleton | dict | None" = None) -> Pipeline:
+    """
+    获取特性相同的共享管线，不存在时创建新的管线。变体代码相同的材质会共享同一管线；骨骼蒙皮管线还需使用同一骨架才会共享。
+    :param features: 传入shader_variant的特性参数
+    :param vbo_type: 定义传入着色器程序的顶点列表(vbo)的数据类型
+    :param skeleton: 骨骼蒙皮管线使用的骨架
+    :return: 管线
+    """
+    vertex_shader, fragment_shader = shader_variant(**features)
+    skeleton_id = id(skeleton) if features.get("skinned", False) else None
+    key = (vertex_shader, fragment_shader, tuple(vbo_type), skeleton_id)
+    pipeline = pipeline_cache.get(key)
+    if pipeline is None:
+        pipeline = Pipeline(features, vbo_type, skeleton=skeleton)
+        pipeline_cache[key] = pipeline
+    return pipeline
+
+
+def _skeleton_obj(skeleton: "soup3D.skeleton.Skeleton | dict | None") -> soup3D.skeleton.Skeleton:
+    """
+    将骨架参数转换为Skeleton对象
+    :param skeleton: 一个Skeleton对象或包含多个骨头的字典
+    :return: Skeleton对象
+    """
+    if isinstance(skeleton, soup3D.skeleton.Skeleton):
+        return skeleton
+    elif isinstance(skeleton, dict):
+        # 如果是字典，转换为Skeleton对象
+        skel = soup3D.skeleton.Skeleton()
+        for name, bone in skeleton.items():
+            skel.add_bone(name, bone)
+        return skel
+    else:
+        # 返回空骨架
+        return soup3D.skeleton.Skeleton()
+
+
+PNG_FORMATS = {0: 'L', 2: 'RGB', 6: 'RGBA'}  # 8位PNG的颜色类型 -> 解码后的图像格式
+JPEG_FORMATS = {1: 'L', 3: 'RGB'}            # JPEG的分量数 -> 解码后的图像格式
+JPEG_SOF_MARKERS = {                         # 记录图像尺寸的JPEG帧头标记
+    0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF,
+}
+
+
+def _read_jpeg_header(f) -> tuple[str, int, int] | None:
+    """
+    逐段跳过JPEG标记，直到读取帧头中的尺寸与分量数
+    :param f: 已读取文件开头两个字节的文件对象
+    :return: (格式, 宽度, 高度)，无法识别时返回None
+    """
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        if marker[1] == 0xFF:
+            # 标记前的填充字节
+            f.seek(-1, 1)
+            continue
+        if marker[1] in (0x01, *range(0xD0, 0xD8)):
+            continue
+        length = f.read(2)
+        if len(length) < 2:
+            return None
+        length = struct.unpack(">H", length)[0]
+        if marker[1] in JPEG_SOF_MARKERS:
+            frame = f.read(6)
+            if len(frame) < 6:
+                return None
+            _, height, width, components = struct.unpack(">BHHB", frame)
+            format = JPEG_FORMATS.get(components)
+            return None if format is None else (format, width, height)
+        f.seek(length - 2, 1)
+
+
+def read_image_header(path: str) -> tuple[str, int, int] | None:
+    """
+    只读取PNG与JPEG文件头中的尺寸与格式，不解码图像。格式与read_image解码后的格式一致。
+    :param path: 文件路径
+    :return: (格式, 宽度, 高度)，压缩贴图、其它文件格式或解码后格式无法确定时返回None
+    """
+    if soup3D.compressed.is_container(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            head = f.read(2)
+            if head == b"\x89P":
+                data = f.read(24)
+                if len(data) < 24 or data[:6] != b"NG\r\n\x1a\n" or data[10:14] != b"IHDR":
+                    return None
+                width, height, depth, color_type = struct.unpack(">IIBB", data[14:24])
+                format = PNG_FORMATS.get(color_type) if depth == 8 else None
+                return None if format is None else (format, width, height)
+            if head == b"\xff\xd8":
+                return _read_jpeg_header(f)
+    except OSError:
+        return None
+    return None
+
+
+def read_image(path: str) -> tuple:
+    """
+    读取图像文件，不修改任何贴图，可以在后台线程中调用。压缩贴图只解析容器，由GPU解码。
+    :param path: 文件路径
+    :return: (格式, 宽度, 高度, 像素数据, 压缩贴图的各级mipmap或None, 磁盘缓存的各级mipmap或None)
+    """
+    if soup3D.compressed.is_container(path):
+        format, width, height, levels = soup3D.compressed.load(path)
+        return format, width, height, levels[0][2], levels, None
+
+    img, mipmaps = soup3D.diskcache.imread(path)
+    height, width = img.shape[:2]
+    # 磁盘缓存的映射直接作为像素数据，不复制到内存
+    data = img.reshape(-1) if mipmaps is not None else img.tobytes()
+    if len(img.shape) == 2:  # 灰度图
+        return 'L', width, height, data, None, mipmaps
+    elif img.shape[2] == 3:  # RGB
+        return 'RGB', width, height, data, None, mipmaps
+    elif img.shape[2] == 4:  # RGBA
+        return 'RGBA', width, height, data, None, mipmaps
+    return 'RGBA', width, height, None, None, None
+
+
+def image_array(format: str, width: int, height: int, data) -> np.ndarray:
+    """
+    将未压缩的像素数据转换为像素数组，不复制数据
+    :param format: 图像格式
+    :param width:  图像宽度
+    :param height: 图像高度
+    :param data:   像素数据
+    :return: 形状为(高, 宽, 通道数)的uint8数组
+    """
+    channels = len(FORMAT_CHANNELS.get(format, FORMAT_CHANNELS['RGBA']))
+    return np.frombuffer(data, dtype=np.uint8).reshape((height, width, channels))
+
+
+def _source_array(texture: "Img", arrays: dict | None) -> tuple[str, np.ndarray]:
+    """
+    获取混合通道贴图的来源贴图的格式与像素数组
+    :param texture: 来源贴图
+    :param arrays:  贴图id -> (格式, 像素数组)，预先解码的来源贴图，None表示从来源贴图读取
+    :return: (格式, 像素数组)
+    """
+    if arrays is not None:
+        return arrays[id(texture)]
+    array = texture.get_array()
+    return texture.get_format(), array
+
+
+def upload_mipmaps(mipmaps: list, internal_format, data_format) -> None:
+    """
+    向当前绑定的纹理上传预先生成的各级mipmap
+    :param mipmaps:         各级mipmap的像素数组，第0级为最高分辨率
+    :param internal_format: OpenGL 内部格式
+    :param data_format:     数据格式
+    :return: None
+    """
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, len(mipmaps) - 1)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    for level, array in enumerate(mipmaps):
+        height, width = array.shape[:2]
+        glTexImage2D(GL_TEXTURE_2D, level, internal_format, width, height, 0, data_format, GL_UNSIGNED_BYTE, array)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+
+
+def _extract_channel(array: np.ndarray, format: str, channel_id: int) -> np.ndarray:
+    """
+    从像素数组中提取单个通道，图像格式中没有该通道时返回255
+    :param array:      形状为(高, 宽, 通道数)的uint8数组
+    :param format:     图像格式
+    :param channel_id: 通道编号
+    :return: 形状为(高, 宽)的uint8数组
+    """
+    layout = FORMAT_CHANNELS.get(format, FORMAT_CHANNELS['RGBA'])
+    if channel_id in layout:
+        return array[:, :, layout.index(channel_id)]
+    return np.full(array.shape[:2], 255, dtype=np.uint8)
+
+
+def _bilinear_axis(src: int, dst: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    计算双线性缩放在单个方向上的采样位置，按像素中心对齐
+    :param src: 原始长度
+    :param dst: 目标长度
+    :return: (较小的索引, 较大的索引, 较大索引的权重)
+    """
+    position = np.clip((np.arange(dst, dtype=np.float32) + 0.5) * src / dst - 0.5, 0, src - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, src - 1)
+    return lower, upper, position - lower
+
+
+def _box_axis(src: int, dst: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    计算区域平均缩放在单个方向上，每个目标像素覆盖的原始像素范围
+    :param src: 原始长度
+    :param dst: 目标长度
+    :return: (起始索引, 结束索引)，结束索引不包含在范围内，且每个范围至少包含一个像素
+    """
+    start = np.arange(dst, dtype=np.int64) * src // dst
+    end = -(-np.arange(1, dst + 1, dtype=np.int64) * src // dst)
+    return start, np.maximum(end, start + 1)
+
+
+def resize_image(array: np.ndarray, size: tuple[int, int], resample: str = soup3D.name.NEAREST) -> np.ndarray:
+    """
+    缩放图像，通过索引数组一次算出所有像素，尺寸相同时直接返回原数组
+    :param array:    形状为(高, 宽)或(高, 宽, 通道数)的uint8数组
+    :param size:     目标尺寸(宽, 高)
+    :param resample: 缩放方式，可以是soup3D.NEAREST、soup3D.BILINEAR或soup3D.BOX
+    :return: 缩放后的uint8数组
+    """
+    dst_w, dst_h = size
+    src_h, src_w = array.shape[:2]
+    if (src_w, src_h) == (dst_w, dst_h):
+        return array
+    channel_axes = (1,) * (array.ndim - 2)
+
+    if resample == soup3D.name.NEAREST:
+        xs = np.minimum(np.arange(dst_w, dtype=np.int64) * src_w // dst_w, src_w - 1)
+        ys = np.minimum(np.arange(dst_h, dtype=np.int64) * src_h // dst_h, src_h - 1)
+        return array[ys[:, None], xs]
+
+    if resample == soup3D.name.BILINEAR:
+        x0, x1, fx = _bilinear_axis(src_w, dst_w)
+        y0, y1, fy = _bilinear_axis(src_h, dst_h)
+        fx = fx.reshape((1, dst_w) + channel_axes)
+        fy = fy.reshape((dst_h, 1) + channel_axes)
+        image = array.astype(np.float32)
+        top = image[y0[:, None], x0] * (1 - fx) + image[y0[:, None], x1] * fx
+        bottom = image[y1[:, None], x0] * (1 - fx) + image[y1[:, None], x1] * fx
+        result = top * (1 - fy) + bottom * fy
+        return np.clip(np.rint(result), 0, 255).astype(np.uint8)
+
+    if resample == soup3D.name.BOX:
+        # 通过积分图求出每个目标像素覆盖区域的总和
+        x0, x1 = _box_axis(src_w, dst_w)
+        y0, y1 = _box_axis(src_h, dst_h)
+        table = np.zeros((src_h + 1, src_w + 1) + array.shape[2:], dtype=np.int64)
+        table[1:, 1:] = array.cumsum(axis=0, dtype=np.int64).cumsum(axis=1)
+        total = (table[y1[:, None], x1] - table[y0[:, None], x1]
+                 - table[y1[:, None], x0] + table[y0[:, None], x0])
+        count = ((y1 - y0)[:, None] * (x1 - x0)).reshape((dst_h, dst_w) + channel_axes)
+        return ((total + count // 2) // count).astype(np.uint8)
+
+    raise ValueError(f"Unknown resample mode: {resample}")
+
+
+def _uniform_bytes(v_type: str, value: tuple) -> tuple:
+    """
+    将uniform的值转换为可直接比较的形式，数组与矩阵会被复制为字节串，避免比较指针
+    :param v_type: 数据类型
+    :param value:  填入glUniform方法的参数
+    :return: 可比较的值
+    """
+    if v_type not in uniform_size:
+        return (v_type,) + tuple(value)
+
+    count = value[0]
+    data = value[-1]
+    size = count * uniform_size[v_type]
+    if isinstance(data, np.ndarray):
+        raw = data.tobytes()[:size]
+    elif isinstance(data, (list, tuple)):
+        dtype = np.int32 if "int" in v_type else np.float32
+        raw = np.asarray(data, dtype=dtype).tobytes()[:size]
+    else:
+        # glm.value_ptr 返回的指针
+        raw = ctypes.string_at(data, size)
+    return (v_type,) + tuple(value[1:-1]) + (raw,)
+
+
+def get_uniform_stats() -> dict:
+    """
+    获取uniform上传统计，可用于确认未变化的值是否被跳过
+    :return: {"uploaded": 实际上传的数量, "skipped": 跳过的数量}
+    """
+    return {"uploaded": uniform_uploads, "skipped": uniform_skips}
+
+
+def reset_uniform_stats() -> None:
+    """
+    清空uniform上传统计
+    :return: None
+    """
+    global uniform_uploads, uniform_skips
+    uniform_uploads = 0
+    uniform_skips = 0
+
+
+def poll_compile() -> None:
+    """
+    自动调用函数，无需手动调用。在每帧检查正在编译的着色器是否已经完成编译。
+    :return: None
+    """
+    for program in list(compile_queue.values()):
+        if program.compiling:
+            program.is_ready()
+
+
+def warm_up(wait: bool = False) -> None:
+    """
+    预热着色器，为所有尚未编译的着色器发起编译
+    :param wait: 是否等待所有着色器编译完成，为False时支持并行编译的驱动会在后台完成编译
+    :return: None
+    """
+    for program in list(compile_queue.values()):
+        if wait:
+            program.wait()
+        else:
+            program.compile()
 
 
 Img = Texture | MixChannel
@@ -0,0 +1,346 @@
+"""
+调用：soup3D.shadow
+阴影贴图，为开启阴影的光源渲染深度贴图。方向光使用按视锥划分的多级阴影贴图(级联)，锥形光线使用一张透视阴影贴图，所有阴影贴图
+共享一个深度纹理数组。
+阴影贴图按光源缓存，只有光源的阴影矩阵变化，或其阴影范围内的模型移动、重建、骨骼姿态变化时才会重新渲染；每帧最多重新渲染
+UPDATE_BUDGET个光源，其余光源沿用上一次的阴影贴图，在之后的帧中依次更新。
+"""
+from OpenGL.GL import *
+from pyglm import glm
+from math import *
+import ctypes
+import numpy as np
+
+import soup3D
+import soup3D.shader
+import soup3D.state
+import soup3D.ring
+
+__all__ : list[str] = [
+    "get_stats",
+]
+
+SHADOW_SIZE = 1024         # 每层阴影贴图的分辨率
+SHADOW_UNIT = 4            # 着色器读取阴影贴图的纹理单元
+CASCADE_COUNT = 3          # 方向光的级联数量
+CASCADE_LAMBDA = 0.75      # 级联划分中对数划分所占的比例，其余为均匀划分
+SHADOW_DISTANCE = 100.0    # 方向光阴影的最远距离，不超过远裁剪面
+CASTER_MARGIN = 50.0       # 方向光阴影向光源方向额外包含的距离，使视锥外的模型也能投射阴影
+RADIUS_STEP = 0.25         # 级联包围球半径向上取整的步长，避免浮点误差使相机转动时半径变化
+MAX_CONE_FOV = 170.0       # 锥形光线阴影贴图的最大视角
+UPDATE_BUDGET = 2          # 每帧最多重新渲染阴影贴图的光源数量
+
+# 将[-1, 1]的裁剪坐标变换到[0, 1]的纹理坐标与深度
+BIAS_MATRIX = glm.mat4(
+    0.5, 0.0, 0.0, 0.0,
+    0.0, 0.5, 0.0, 0.0,
+    0.0, 0.0, 0.5, 0.0,
+    0.5, 0.5, 0.5, 1.0,
+)
+
+casters = []           # [(光源, 首个阴影层, 阴影层数量)]，由assign_layers在打包光源时更新
+cache_keys = {}        # 光源id -> 阴影贴图对应的(阴影层, 阴影矩阵, 范围内模型)
+matrices = np.zeros((soup3D.shader.MAX_SHADOW_LAYERS, 16), dtype=np.float32)  # 每层的阴影矩阵
+
+texture = None         # 阴影贴图深度纹理数组
+fbo = None             # 渲染阴影贴图使用的帧缓冲
+ubo = None             # 阴影统一缓冲区
+camera_ubo = None      # 渲染阴影贴图时代替相机统一缓冲区的光源相机
+
+frame = 0              # 帧编号
+rendered_frames = {}   # 光源id -> 上次重新渲染阴影贴图的帧编号，用于轮流更新超出预算的光源
+
+render_count = 0       # 重新渲染的阴影贴图层数
+skip_count = 0         # 沿用缓存的光源次数
+
+
+def assign_layers(lights: list) -> np.ndarray:
+    """
+    自动调用函数，无需手动调用。为开启阴影的光源分配阴影贴图层，层数不足时后面的光源不投射阴影
+    :param lights: 点亮的光源列表，顺序与打包后的光源数组相同
+    :return: 每个光源的(首个阴影层, 阴影层数量)数组
+    """
+    global casters
+
+    casters = []
+    layers = np.zeros((len(lights), 2), dtype=np.float32)
+    next_layer = 0
+    for i, light in enumerate(lights):
+        if not getattr(light, "shadow", False):
+            continue
+        count = CASCADE_COUNT if isinstance(light, soup3D.light.Direct) else 1
+        if next_layer + count > soup3D.shader.MAX_SHADOW_LAYERS:
+            continue
+        casters.append((light, next_layer, count))
+        layers[i] = (next_layer, count)
+        next_layer += count
+    return layers
+
+
+def _allocate_buffers() -> None:
+    """
+    创建阴影统一缓冲区与光源相机统一缓冲区。没有光源投射阴影时也会绑定阴影统一缓冲区，确保着色器中的统一块有对应的缓冲区。
+    :return: None
+    """
+    global ubo, camera_ubo
+
+    ubo = glGenBuffers(1)
+    glBindBuffer(GL_UNIFORM_BUFFER, ubo)
+    glBufferData(GL_UNIFORM_BUFFER, matrices.nbytes, matrices, GL_DYNAMIC_DRAW)
+    camera_ubo = glGenBuffers(1)
+    glBindBuffer(GL_UNIFORM_BUFFER, camera_ubo)
+    glBufferData(GL_UNIFORM_BUFFER, 144, None, GL_DYNAMIC_DRAW)
+    glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+
+def _allocate() -> None:
+    """
+    创建阴影贴图深度纹理数组与帧缓冲，在第一次有光源投射阴影时调用
+    :return: None
+    """
+    global texture, fbo
+
+    texture = glGenTextures(1)
+    soup3D.state.bind_texture(SHADOW_UNIT, GL_TEXTURE_2D_ARRAY, texture)
+    glTexImage3D(GL_TEXTURE_2D_ARRAY, 0, GL_DEPTH_COMPONENT24, SHADOW_SIZE, SHADOW_SIZE,
+                 soup3D.shader.MAX_SHADOW_LAYERS, 0, GL_DEPTH_COMPONENT, GL_FLOAT, None)
+    glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+    glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+    glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_COMPARE_MODE, GL_COMPARE_REF_TO_TEXTURE)
+    glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_COMPARE_FUNC, GL_LEQUAL)
+
+    fbo = glGenFramebuffers(1)
+    glBindFramebuffer(GL_FRAMEBUFFER, fbo)
+    glDrawBuffer(GL_NONE)
+    glReadBuffer(GL_NONE)
+    glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+
+def _look_at(eye: glm.vec3, direction: glm.vec3) -> glm.mat4:
+    """
+    生成朝向指定方向的相机矩阵，方向接近竖直时改用x轴作为上方向
+    :param eye:       相机位置
+    :param direction: 朝向
+    :return: 相机矩阵
+    """
+    up = glm.vec3(0, 1, 0)
+    if abs(glm.dot(glm.normalize(direction), up)) > 0.99:
+        up = glm.vec3(1, 0, 0)
+    return glm.lookAt(eye, eye + direction, up)
+
+
+def _cone_matrices(light) -> list:
+    """
+    计算锥形光线的透视阴影矩阵
+    :param light: 锥形光线
+    :return: [(相机矩阵, 透视矩阵)]
+    """
+    direction = glm.vec3(*light._calc_direction())
+    if light.attenuation > 0:
+        far = soup3D.light.LIGHT_CUTOFF / light.attenuation
+    else:
+        far = float(soup3D.proj_far)
+    near = max(far * 0.0005, 0.01)
+    fov = min(light.angle, MAX_CONE_FOV)
+    view = _look_at(glm.vec3(*light.place), direction)
+    projection = glm.perspective(glm.radians(fov), 1.0, near, far)
+    return [(view, projection)]
+
+
+def _direct_matrices(light) -> list:
+    """
+    将相机视锥按距离划分为多个级联，每个级联用包围球拟合一个正交阴影矩阵，从近到远排列。包围球中心在光源空间中按阴影贴图纹素对齐，
+    相机在一个纹素内移动时阴影矩阵不变，阴影贴图无需重新渲染，也不会闪烁。
+    :param light: 方向光
+    :return: [(相机矩阵, 透视矩阵), ...]
+    """
+    near = float(soup3D.proj_near)
+    far = min(float(soup3D.proj_far), SHADOW_DISTANCE)
+    tan_y = tan(radians(soup3D.proj_fov) / 2)
+    tan_x = tan_y * soup3D.proj_width / soup3D.proj_height
+    inv_view = glm.inverse(soup3D.camera.get_view_mat())
+
+    splits = []
+    for i in range(CASCADE_COUNT + 1):
+        uniform = near + (far - near) * i / CASCADE_COUNT
+        logarithmic = near * (far / near) ** (i / CASCADE_COUNT)
+        splits.append(CASCADE_LAMBDA * logarithmic + (1 - CASCADE_LAMBDA) * uniform)
+
+    # 方向光记录的是指向光源的方向
+    toward_light = glm.vec3(*light._calc_direction())
+    rotation = _look_at(glm.vec3(0), -toward_light)
+    inv_rotation = glm.inverse(rotation)
+    result = []
+    for i in range(CASCADE_COUNT):
+        corners = []
+        for depth in (splits[i], splits[i + 1]):
+            for sx in (-1, 1):
+                for sy in (-1, 1):
+                    corners.append(glm.vec3(inv_view * glm.vec4(sx * depth * tan_x, sy * depth * tan_y, -depth, 1)))
+        center = sum(corners, glm.vec3(0)) / len(corners)
+        radius = ceil(max(glm.length(corner - center) for corner in corners) / RADIUS_STEP) * RADIUS_STEP
+
+        # 在光源空间中将中心对齐到纹素
+        texel = radius * 2 / SHADOW_SIZE
+        local = glm.vec3(rotation * glm.vec4(center, 1))
+        local = glm.floor(local / texel) * texel
+        center = glm.vec3(inv_rotation * glm.vec4(local, 1))
+
+        eye = center + toward_light * (radius + CASTER_MARGIN)
+        view = _look_at(eye, -toward_light)
+        projection = glm.ortho(-radius, radius, -radius, radius, 0.0, radius * 2 + CASTER_MARGIN)
+        result.append((view, projection))
+    return result
+
+
+def _frustum_planes(view_proj: glm.mat4) -> np.ndarray:
+    """
+    从矩阵中提取视锥的6个平面
+    :param view_proj: 透视矩阵与相机矩阵的乘积
+    :return: 形状为(6, 4)的平面数组，法线已归一化并指向视锥内部
+    """
+    rows = soup3D.ring.pack_mat4(view_proj).reshape(4, 4).T
+    planes = np.array([
+        rows[3] + rows[0], rows[3] - rows[0],
+        rows[3] + rows[1], rows[3] - rows[1],
+        rows[3] + rows[2], rows[3] - rows[2],
+    ], dtype=np.float32)
+    planes /= np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+    return planes
+
+
+def _visible_casters(layers: list, centers: np.ndarray, radii: np.ndarray) -> np.ndarray:
+    """
+    求出包围球与任一阴影视锥相交的模型
+    :param layers:  [(相机矩阵, 透视矩阵), ...]
+    :param centers: 模型包围球球心数组，形状为(模型数量, 3)
+    :param radii:   模型包围球半径数组
+    :return: 模型序号数组
+    """
+    visible = np.zeros(len(radii), dtype=bool)
+    for view, projection in layers:
+        planes = _frustum_planes(projection * view)
+        distance = centers @ planes[:, :3].T + planes[:, 3]
+        visible |= np.all(distance >= -radii[:, None], axis=1)
+    return np.nonzero(visible)[0]
+
+
+def _render_layer(layer: int, view: glm.mat4, projection: glm.mat4, models: list, indices: np.ndarray) -> None:
+    """
+    渲染一层阴影贴图。模型使用原本的显示列表绘制，相机统一缓冲区临时替换为光源相机，只写入深度。
+    :param layer:      阴影层
+    :param view:       光源相机矩阵
+    :param projection: 光源透视矩阵
+    :param models:     本帧绘制的模型列表，序号与环形缓冲区中的绘制序号相同
+    :param indices:    需要绘制的模型序号
+    :return: None
+    """
+    global render_count
+
+    data = (
+        ctypes.string_at(glm.value_ptr(view), 64) +
+        ctypes.string_at(glm.value_ptr(projection), 64) +
+        bytes(16)
+    )
+    glBindBuffer(GL_UNIFORM_BUFFER, camera_ubo)
+    glBufferSubData(GL_UNIFORM_BUFFER, 0, len(data), data)
+    glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+    glFramebufferTextureLayer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, texture, 0, layer)
+    glClear(GL_DEPTH_BUFFER_BIT)
+    for slot in indices:
+        soup3D.ring.bind(int(slot))
+        soup3D.state.call_list(models[slot].list_id)
+
+    matrices[layer] = soup3D.ring.pack_mat4(BIAS_MATRIX * projection * view)
+    render_count += 1
+
+
+def render(models: list) -> None:
+    """
+    自动调用函数，无需手动调用。在绘制模型前更新需要重新渲染的阴影贴图，并绑定阴影贴图与阴影统一缓冲区
+    :param models: 本帧绘制的模型列表，需已写入环形缓冲区，序号与绘制序号相同
+    :return: None
+    """
+    global frame, skip_count
+
+    frame += 1
+    if ubo is None:
+        _allocate_buffers()
+    glBindBufferBase(GL_UNIFORM_BUFFER, soup3D.shader.SHADOW_BINDING, ubo)
+
+    if not casters:
+        return
+    if texture is None:
+        _allocate()
+
+    bounds = [model.get_world_bounds() for model in models]
+    centers = np.array([center for center, radius in bounds], dtype=np.float32).reshape(-1, 3)
+    radii = np.array([radius for center, radius in bounds], dtype=np.float32)
+
+    # 找出阴影矩阵或范围内模型变化的光源
+    pending = []
+    for order, (light, first, count) in enumerate(casters):
+        if isinstance(light, soup3D.light.Direct):
+            layers = _direct_matrices(light)
+        else:
+            layers = _cone_matrices(light)
+        indices = _visible_casters(layers, centers, radii)
+        key = (
+            first,
+            b"".join(soup3D.ring.pack_mat4(projection * view).tobytes() for view, projection in layers),
+            tuple((id(models[i]),) + models[i].get_shadow_key() for i in indices),
+        )
+        if cache_keys.get(id(light)) == key:
+            skip_count += 1
+            continue
+        # 按上次渲染的帧编号排序，超出预算时优先更新等待最久的光源
+        pending.append((rendered_frames.get(id(light), 0), order, light, first, layers, indices, key))
+
+    if pending:
+        # 渲染期间不能读取正在写入的阴影贴图
+        soup3D.state.bind_texture(SHADOW_UNIT, GL_TEXTURE_2D_ARRAY, 0)
+        glBindFramebuffer(GL_FRAMEBUFFER, fbo)
+        glViewport(0, 0, SHADOW_SIZE, SHADOW_SIZE)
+        glBindBufferBase(GL_UNIFORM_BUFFER, soup3D.shader.CAMERA_BINDING, camera_ubo)
+        soup3D.state.enable(GL_POLYGON_OFFSET_FILL)
+        glPolygonOffset(2.0, 4.0)
+
+        pending.sort()
+        for last_frame, order, light, first, layers, indices, key in pending[:UPDATE_BUDGET]:
+            for i, (view, projection) in enumerate(layers):
+                _render_layer(first + i, view, projection, models, indices)
+            cache_keys[id(light)] = key
+            rendered_frames[id(light)] = frame
+        skip_count += max(len(pending) - UPDATE_BUDGET, 0)
+
+        soup3D.state.disable(GL_POLYGON_OFFSET_FILL)
+        glBindBufferBase(GL_UNIFORM_BUFFER, soup3D.shader.CAMERA_BINDING, soup3D.camera.ubo)
+        glViewport(0, 0, int(soup3D.proj_width), int(soup3D.proj_height))
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+        glBindBuffer(GL_UNIFORM_BUFFER, ubo)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, matrices.nbytes, matrices)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+    soup3D.state.bind_texture(SHADOW_UNIT, GL_TEXTURE_2D_ARRAY, texture)
+
+
+def forget(light) -> None:
+    """
+    移除光源的阴影缓存记录，光源摧毁时调用，避免之后复用同一id的光源误用旧缓存
+    :param light: 被摧毁的光源
+    :return: None
+    """
+    cache_keys.pop(id(light), None)
+    rendered_frames.pop(id(light), None)
+
+
+def get_stats() -> dict:
+    """
+    获取阴影贴图统计
+    :return: {"casters": 投射阴影的光源数量, "rendered": 重新渲染的层数, "skipped": 沿用缓存的光源次数}
+    """
+    return {"casters": len(casters), "rendered": render_count, "skipped": skip_count}
@@ -1,4 +1,6 @@
 from pyglm import glm
+import numpy as np
+import ctypes
 import math
 import weakref
 
@@ -27,6 +29,7 @@ class Bone:
         self._matrix_dirty = True
         self._world_matrix = glm.mat4(1.0)
         self._inverse_bind_matrix = glm.mat4(1.0)
+        self.version = 0  # 姿态版本，骨骼每次变化时递增
 
         # 关联的着色器（弱引用，防止循环引用导致内存泄漏）
         self._bound_shaders = weakref.WeakValueDictionary()
@@ -142,6 +145,7 @@ class Bone:
     def _mark_dirty(self):
         """标记矩阵需要更新"""
         self._matrix_dirty = True
+        self.version += 1
         # 递归标记所有子骨骼为dirty
         for child in self.children:
             child._mark_dirty()
@@ -170,6 +174,10 @@ class Skeleton:
         self._bone_index_map = {}
         self._max_bones = 0
 
+        # 骨骼矩阵调色板缓存
+        self._palette = None
+        self._palette_key = None
+
     def add_bone(self, name: str, bone: Bone):
         """
         添加骨骼到骨架
@@ -213,6 +221,33 @@ class Skeleton:
 
         return matrices
 
+    def get_bone_palette(self, size: int = None) -> np.ndarray:
+        """
+        获取打包为连续float32数组的骨骼矩阵调色板，可通过一次glUniformMatrix4fv上传。骨骼姿态未变化时返回缓存的调色板，多个着色器共
+        享同一骨架时只需计算一次。
+        :param size: 调色板中矩阵的数量，超出骨骼数量的部分为单位矩阵，默认为骨骼数量
+        :return: 形状为(size, 4, 4)的数组，每个矩阵按列主序排列
+        """
+        if size is None:
+            size = self._max_bones
+
+        key = (size, tuple(bone.version for bone in self.bones.values()))
+        if self._palette is not None and self._palette_key == key:
+            return self._palette
+
+        palette = np.empty((size, 4, 4), dtype=np.float32)
+        palette[:] = np.identity(4, dtype=np.float32)
+        for name, bone in self.bones.items():
+            idx = self._bone_index_map[name]
+            if idx < size:
+                # np.array(glm.mat4)按行复制，着色器以transpose=GL_FALSE读取时需要列主序的原始内存
+                matrix = bone.get_bone_matrix()
+                palette[idx] = np.frombuffer(ctypes.string_at(glm.value_ptr(matrix), 64), np.float32).reshape(4, 4)
+
+        self._palette = palette
+        self._palette_key = key
+        return palette
+
     def get_max_bones(self) -> int:
         """
         获取骨架中的骨骼数量
@@ -0,0 +1,253 @@
+"""
+调用：soup3D.state
+OpenGL状态缓存，在CPU端记录当前绑定的着色器程序、纹理、顶点数组对象、开关状态和混合函数，跳过重复的状态切换，并避免在渲染循
+环中使用glGet查询状态
+"""
+from OpenGL.GL import *
+
+__all__ : list[str] = [
+    "use_program", "active_texture", "bind_texture", "bind_vertex_array",
+    "enable", "disable", "blend_func",
+    "delete_textures", "delete_program",
+    "call_list", "invalidate", "begin_record", "end_record",
+    "get_stats", "reset_stats",
+]
+
+program = None         # 当前着色器程序，None表示未知
+active_unit = None     # 当前激活的纹理单元，None表示未知
+textures = {}          # {纹理单元: {纹理类型: 纹理id}}
+vertex_array = None    # 当前顶点数组对象，None表示未知
+enabled = {}           # {开关: 是否开启}
+blend = None           # 当前混合函数(src, dst)，None表示未知
+
+recording = False      # 是否正在录制显示列表
+
+issued_calls = 0       # 实际调用的次数
+skipped_calls = 0      # 跳过的重复调用次数
+
+
+def use_program(shader: int) -> None:
+    """
+    切换着色器程序，与当前程序相同时跳过
+    :param shader: 着色器程序
+    :return: None
+    """
+    global program, issued_calls, skipped_calls
+
+    if recording:
+        glUseProgram(shader)
+        return
+    if program == shader:
+        skipped_calls += 1
+        return
+    glUseProgram(shader)
+    program = shader
+    issued_calls += 1
+
+
+def active_texture(unit: int) -> None:
+    """
+    激活纹理单元，与当前纹理单元相同时跳过
+    :param unit: 纹理单元编号（0 表示 GL_TEXTURE0）
+    :return: None
+    """
+    global active_unit, issued_calls, skipped_calls
+
+    if recording:
+        glActiveTexture(GL_TEXTURE0 + unit)
+        return
+    if active_unit == unit:
+        skipped_calls += 1
+        return
+    glActiveTexture(GL_TEXTURE0 + unit)
+    active_unit = unit
+    issued_calls += 1
+
+
+def bind_texture(unit: int, target, texture_id: int) -> None:
+    """
+    将纹理绑定到指定纹理单元，该单元已绑定同一纹理时跳过
+    :param unit:       纹理单元编号（0 表示 GL_TEXTURE0）
+    :param target:     纹理类型，如GL_TEXTURE_2D
+    :param texture_id: 纹理id
+    :return: None
+    """
+    global issued_calls, skipped_calls
+
+    if recording:
+        glActiveTexture(GL_TEXTURE0 + unit)
+        glBindTexture(target, texture_id)
+        return
+    bound = textures.setdefault(unit, {})
+    if bound.get(target) == texture_id:
+        skipped_calls += 1
+        return
+    active_texture(unit)
+    glBindTexture(target, texture_id)
+    bound[target] = texture_id
+    issued_calls += 1
+
+
+def bind_vertex_array(vao: int) -> None:
+    """
+    绑定顶点数组对象，与当前绑定相同时跳过。顶点数组对象的绑定不会被录制到显示列表中，录制时也会立即执行。
+    :param vao: 顶点数组对象
+    :return: None
+    """
+    global vertex_array, issued_calls, skipped_calls
+
+    if vertex_array == vao:
+        skipped_calls += 1
+        return
+    glBindVertexArray(vao)
+    vertex_array = vao
+    issued_calls += 1
+
+
+def enable(cap) -> None:
+    """
+    开启OpenGL功能，已开启时跳过
+    :param cap: 功能，如GL_DEPTH_TEST
+    :return: None
+    """
+    global issued_calls, skipped_calls
+
+    if recording:
+        glEnable(cap)
+        return
+    if enabled.get(cap) is True:
+        skipped_calls += 1
+        return
+    glEnable(cap)
+    enabled[cap] = True
+    issued_calls += 1
+
+
+def disable(cap) -> None:
+    """
+    关闭OpenGL功能，已关闭时跳过
+    :param cap: 功能，如GL_DEPTH_TEST
+    :return: None
+    """
+    global issued_calls, skipped_calls
+
+    if recording:
+        glDisable(cap)
+        return
+    if enabled.get(cap) is False:
+        skipped_calls += 1
+        return
+    glDisable(cap)
+    enabled[cap] = False
+    issued_calls += 1
+
+
+def blend_func(src, dst) -> None:
+    """
+    设置混合函数，与当前混合函数相同时跳过
+    :param src: 源因子
+    :param dst: 目标因子
+    :return: None
+    """
+    global blend, issued_calls, skipped_calls
+
+    if recording:
+        glBlendFunc(src, dst)
+        return
+    if blend == (src, dst):
+        skipped_calls += 1
+        return
+    glBlendFunc(src, dst)
+    blend = (src, dst)
+    issued_calls += 1
+
+
+def delete_textures(texture_ids: list) -> None:
+    """
+    删除纹理，并从缓存中移除这些纹理的绑定记录，避免纹理id被复用后误判为已绑定
+    :param texture_ids: 纹理id列表
+    :return: None
+    """
+    glDeleteTextures(texture_ids)
+    for bound in textures.values():
+        for target in list(bound):
+            if bound[target] in texture_ids:
+                del bound[target]
+
+
+def delete_program(shader: int) -> None:
+    """
+    删除着色器程序，并从缓存中移除该程序的绑定记录
+    :param shader: 着色器程序
+    :return: None
+    """
+    global program
+
+    glDeleteProgram(shader)
+    if program == shader:
+        program = None
+
+
+def call_list(list_id: int) -> None:
+    """
+    调用显示列表。显示列表内会切换着色器程序和纹理，调用后将这些状态标记为未知
+    :param list_id: 显示列表id
+    :return: None
+    """
+    global program, active_unit
+
+    glCallList(list_id)
+    program = None
+    active_unit = None
+    textures.clear()
+
+
+def invalidate() -> None:
+    """
+    将所有缓存的状态标记为未知，在外部代码直接修改OpenGL状态（如调用显示列表）后调用
+    :return: None
+    """
+    global program, active_unit, vertex_array, blend
+
+    program = None
+    active_unit = None
+    vertex_array = None
+    blend = None
+    textures.clear()
+    enabled.clear()
+
+
+def begin_record() -> None:
+    """
+    开始录制显示列表。录制期间的状态切换会被完整写入显示列表，不会被跳过，也不会改变缓存的状态。
+    :return: None
+    """
+    global recording
+    recording = True
+
+
+def end_record() -> None:
+    """
+    结束录制显示列表
+    :return: None
+    """
+    global recording
+    recording = False
+
+
+def get_stats() -> dict:
+    """
+    获取状态切换统计，可用于确认重复调用是否被跳过
+    :return: {"issued": 实际调用次数, "skipped": 跳过的重复调用次数}
+    """
+    return {"issued": issued_calls, "skipped": skipped_calls}
+
+
+def reset_stats() -> None:
+    """
+    清空状态切换统计
+    :return: None
+    """
+    global issued_calls, skipped_calls
+    issued_calls = 0
+    skipped_calls = 0
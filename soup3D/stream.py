@@ -0,0 +1,456 @@
+"""
+调用：soup3D.stream
+贴图流送。开启后，贴图生成纹理时只上传边长不超过MIN_SIZE的低分辨率mipmap；每帧根据使用该贴图的模型在屏幕上的尺寸计算需要的
+mipmap级别，在上传预算内逐级上传更高分辨率的图像。所有贴图占用的显存超出预算时，按最近使用顺序降低最久未使用的贴图的分辨率，释放
+其最高几级mipmap。
+改变分辨率时只上传新增的级别或将释放的级别重新指定为0x0，并通过GL_TEXTURE_BASE_LEVEL切换最高分辨率的级别，纹理id保持不变，已录
+制的显示列表无需重新生成。
+"""
+from OpenGL.GL import *
+import heapq
+import math
+import weakref
+import numpy as np
+
+import soup3D.camera
+import soup3D.compressed
+import soup3D.name
+import soup3D.shader
+import soup3D.state
+
+__all__ : list[str] = [
+    "use_streaming", "set_vram_budget", "get_residency", "get_stats",
+]
+
+STREAM_UNIT = 0        # 上传纹理时使用的纹理单元
+IMAGE_SLOTS = ("base_color", "normal", "emission", "lightmap")  # 材质中可能使用贴图的属性
+
+enabled = False        # 是否开启贴图流送
+VRAM_BUDGET = 512 * 1024 * 1024  # 流送贴图最多占用的显存字节数
+UPLOAD_BUDGET = 4 * 1024 * 1024  # 每帧最多上传的字节数，至少上传一张贴图
+MIN_SIZE = 64          # 始终常驻的最低分辨率mipmap的最大边长
+LOD_BIAS = 0           # 需要的mipmap级别的偏移，正数降低分辨率
+
+entries = weakref.WeakKeyDictionary()    # 贴图 -> 驻留状态
+by_id = weakref.WeakValueDictionary()    # 纹理 id -> 驻留状态
+frame = 0              # 帧序号
+resident_bytes = 0     # 所有流送贴图当前占用的显存字节数
+
+stream_count = 0       # 提高分辨率的次数
+evict_count = 0        # 降低分辨率的次数
+upload_bytes = 0       # 流送上传的总字节数
+
+
+class Residency:
+    def __init__(self, image: "soup3D.shader.Img", texture_id: int, width: int, height: int, format: str,
+                 level_bytes: list[int]):
+        """
+        贴图的驻留状态，由create自动创建
+        :param image:       贴图或混合通道贴图
+        :param texture_id:  纹理 id
+        :param width:       完整分辨率的宽度
+        :param height:      完整分辨率的高度
+        :param format:      图像格式
+        :param level_bytes: 完整mipmap链中每一级占用的字节数
+        """
+        self.image = weakref.ref(image)
+        self.texture_id = texture_id
+        self.width, self.height = width, height
+        self.format = format
+        self.level_bytes = level_bytes
+        self.min_level = next(
+            (level for level in range(len(level_bytes)) if max(width, height) >> level <= MIN_SIZE),
+            len(level_bytes) - 1
+        )
+        self.level = self.min_level   # 已上传的最高分辨率的级别
+        self.screen_size = 0.0        # 本帧使用该贴图的模型在屏幕上的最大尺寸(像素)
+        self.last_used = -1           # 最近一次被绘制的帧序号
+        self.stream_count = 0
+        self.evict_count = 0
+
+    def want(self, pixels: float, frame_index: int):
+        """
+        记录本帧使用该贴图的模型在屏幕上的尺寸
+        :param pixels:      模型在屏幕上的尺寸(像素)
+        :param frame_index: 帧序号
+        :return: None
+        """
+        if self.last_used != frame_index:
+            self.last_used = frame_index
+            self.screen_size = 0.0
+        self.screen_size = max(self.screen_size, pixels)
+
+    def get_target(self) -> int:
+        """
+        根据屏幕尺寸计算需要的mipmap级别
+        :return: 需要的级别，0为完整分辨率
+        """
+        if math.isinf(self.screen_size):
+            return 0
+        if self.screen_size <= 0:
+            return self.min_level
+        level = math.floor(math.log2(max(self.width, self.height) / self.screen_size)) + LOD_BIAS
+        return max(0, min(self.min_level, level))
+
+    def get_bytes(self, level: int | None = None) -> int:
+        """
+        获取从某一级开始的mipmap链占用的显存
+        :param level: 最高分辨率的级别，None表示当前已上传的级别
+        :return: 字节数
+        """
+        if level is None:
+            level = self.level
+        return sum(self.level_bytes[level:])
+
+    def get_stats(self) -> dict:
+        """
+        获取驻留统计
+        :return: {"width": 宽度, "height": 高度, "levels": 完整mipmap级数, "level": 已上传的最高分辨率级别,
+                  "min_level": 始终常驻的级别, "target": 需要的级别, "screen_size": 屏幕尺寸, "bytes": 占用的显存,
+                  "last_used": 最近一次被绘制的帧序号, "streamed": 提高分辨率的次数, "evicted": 降低分辨率的次数}
+        """
+        return {
+            "width": self.width,
+            "height": self.height,
+            "levels": len(self.level_bytes),
+            "level": self.level,
+            "min_level": self.min_level,
+            "target": self.get_target(),
+            "screen_size": self.screen_size,
+            "bytes": self.get_bytes(),
+            "last_used": self.last_used,
+            "streamed": self.stream_count,
+            "evicted": self.evict_count,
+        }
+
+    def __del__(self):
+        global resident_bytes
+        resident_bytes -= self.get_bytes()
+
+
+def use_streaming(enable: bool = True,
+                  vram_budget: int = 512 * 1024 * 1024,
+                  upload_budget: int = 4 * 1024 * 1024,
+                  min_size: int = 64,
+                  lod_bias: int = 0) -> None:
+    """
+    开启或关闭贴图流送，只影响之后生成纹理的贴图
+    :param enable:        是否开启贴图流送
+    :param vram_budget:   流送贴图最多占用的显存字节数
+    :param upload_budget: 每帧最多上传的字节数
+    :param min_size:      始终常驻的最低分辨率mipmap的最大边长
+    :param lod_bias:      需要的mipmap级别的偏移，正数降低分辨率
+    :return: None
+    """
+    global enabled, UPLOAD_BUDGET, MIN_SIZE, LOD_BIAS
+
+    enabled = enable
+    UPLOAD_BUDGET = upload_budget
+    MIN_SIZE = min_size
+    LOD_BIAS = lod_bias
+    set_vram_budget(vram_budget)
+
+
+def set_vram_budget(size: int) -> None:
+    """
+    设置流送贴图最多占用的显存字节数，超出时立即降低最久未使用的贴图的分辨率
+    :param size: 字节数
+    :return: None
+    """
+    global VRAM_BUDGET
+
+    VRAM_BUDGET = size
+    _make_room(0, None)
+
+
+def is_streamable(image: "soup3D.shader.Img") -> bool:
+    """
+    自动调用函数，无需手动调用。判断贴图是否需要流送，尺寸不超过MIN_SIZE的贴图与只有一级mipmap的压缩贴图直接上传
+    :param image: 已加载的贴图或混合通道贴图
+    :return: 是否需要流送
+    """
+    if image.width is None or image.height is None or max(image.width, image.height) <= MIN_SIZE:
+        return False
+    if isinstance(image, soup3D.shader.Texture) and image.levels is not None:
+        return len(image.levels) > 1
+    return True
+
+
+def create(image: "soup3D.shader.Img", texture_unit: int = 0, texture_id: int | None = None) -> int:
+    """
+    自动调用函数，无需手动调用。为贴图生成纹理并只上传低分辨率的mipmap
+    :param image:        已加载的贴图或混合通道贴图
+    :param texture_unit: 纹理单元编号
+    :param texture_id:   使用已有的纹理 id，None表示生成新的纹理
+    :return: 纹理 id
+    """
+    global resident_bytes, upload_bytes
+
+    if texture_id is None:
+        texture_id = glGenTextures(1)
+    soup3D.state.bind_texture(texture_unit, GL_TEXTURE_2D, texture_id)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
+
+    format = image.get_format()
+    if isinstance(image, soup3D.shader.Texture) and image.levels is not None:
+        level_bytes = [len(data) for _, _, data in image.levels]
+    else:
+        channels = len(soup3D.shader.FORMAT_CHANNELS.get(format, soup3D.shader.FORMAT_CHANNELS['RGBA']))
+        level_count = max(image.width, image.height).bit_length()
+        level_bytes = [
+            max(1, image.width >> level) * max(1, image.height >> level) * channels
+            for level in range(level_count)
+        ]
+
+    residency = Residency(image, texture_id, image.width, image.height, format, level_bytes)
+    entries[image] = residency
+    by_id[texture_id] = residency
+    resident_bytes += residency.get_bytes()
+
+    # 常驻的低分辨率级别只上传一次，之后只增减更高分辨率的级别
+    last_level = len(level_bytes) - 1
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_BASE_LEVEL, residency.min_level)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, last_level)
+    if format in soup3D.compressed.GL_FORMATS or image.mipmaps is not None:
+        for level in range(residency.min_level, last_level + 1):
+            _upload_level(residency, image, level)
+    else:
+        _upload_level(residency, image, residency.min_level)
+        glGenerateMipmap(GL_TEXTURE_2D)
+    upload_bytes += residency.get_bytes()
+    return texture_id
+
+
+def _upload_level(residency: Residency, image: "soup3D.shader.Img", level: int) -> None:
+    """
+    向当前绑定的纹理上传某一级mipmap
+    :param residency: 驻留状态
+    :param image:     贴图或混合通道贴图
+    :param level:     级别
+    :return: None
+    """
+    if residency.format in soup3D.compressed.GL_FORMATS:
+        # 像素数据可能已被贴图缓存释放，需要时重新读取
+        image.get_size()
+        width, height, data = image.levels[level]
+        internal_format = soup3D.compressed.GL_FORMATS[residency.format]
+        glCompressedTexImage2D(GL_TEXTURE_2D, level, internal_format, width, height, 0, len(data), data)
+        return
+
+    array = image.get_array()
+    internal_format, data_format = soup3D.shader.PIXEL_FORMATS.get(residency.format, (GL_RGBA, GL_RGBA))
+    if image.mipmaps is not None and level < len(image.mipmaps):
+        # 磁盘缓存中已有各级mipmap，直接从映射上传
+        array = image.mipmaps[level]
+    else:
+        size = (max(1, residency.width >> level), max(1, residency.height >> level))
+        array = soup3D.shader.resize_image(array, size, soup3D.name.BOX)
+    height, width = array.shape[:2]
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    glTexImage2D(GL_TEXTURE_2D, level, internal_format, width, height, 0, data_format, GL_UNSIGNED_BYTE,
+                 np.ascontiguousarray(array))
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+
+
+def _release_level(residency: Residency, level: int) -> None:
+    """
+    将当前绑定的纹理的某一级重新指定为0x0，释放其显存
+    :param residency: 驻留状态
+    :param level:     级别
+    :return: None
+    """
+    if residency.format in soup3D.compressed.GL_FORMATS:
+        internal_format = soup3D.compressed.GL_FORMATS[residency.format]
+        glCompressedTexImage2D(GL_TEXTURE_2D, level, internal_format, 0, 0, 0, 0, None)
+        return
+    internal_format, data_format = soup3D.shader.PIXEL_FORMATS.get(residency.format, (GL_RGBA, GL_RGBA))
+    glTexImage2D(GL_TEXTURE_2D, level, internal_format, 0, 0, 0, data_format, GL_UNSIGNED_BYTE, None)
+
+
+def _set_level(residency: Residency, level: int, texture_unit: int = STREAM_UNIT) -> None:
+    """
+    改变纹理的最高分辨率级别，只上传新增的级别或释放不再需要的级别
+    :param residency:    驻留状态
+    :param level:        新的最高分辨率的级别
+    :param texture_unit: 纹理单元编号
+    :return: None
+    """
+    global resident_bytes, upload_bytes
+
+    soup3D.state.bind_texture(texture_unit, GL_TEXTURE_2D, residency.texture_id)
+    if level < residency.level:
+        image = residency.image()
+        for index in range(level, residency.level):
+            _upload_level(residency, image, index)
+            upload_bytes += residency.level_bytes[index]
+    else:
+        for index in range(residency.level, level):
+            _release_level(residency, index)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_BASE_LEVEL, level)
+
+    resident_bytes += residency.get_bytes(level) - residency.get_bytes()
+    residency.level = level
+
+
+def _screen_size(center: np.ndarray, radius: float, camera: np.ndarray, scale: float) -> float:
+    """
+    估算模型包围球在屏幕上的直径
+    :param center: 包围球球心
+    :param radius: 包围球半径
+    :param camera: 相机位置
+    :param scale:  距离为1时1个单位长度对应的像素数
+    :return: 像素数，相机位于包围球内时为无穷大
+    """
+    if math.isinf(radius):
+        return math.inf
+    distance = float(np.linalg.norm(center - camera)) - radius
+    if distance <= 0:
+        return math.inf
+    return 2 * radius * scale / max(distance, soup3D.proj_near)
+
+
+def _surface_images(surface) -> list:
+    """
+    获取材质使用的所有贴图
+    :param surface: 表面着色器
+    :return: 贴图列表
+    """
+    images = []
+    for slot in IMAGE_SLOTS:
+        image = getattr(surface, slot, None)
+        if image is not None and not isinstance(image, (list, tuple, int, float)):
+            images.append(image)
+    return images
+
+
+def update(models: list) -> None:
+    """
+    自动调用函数，无需手动调用。根据本帧绘制的模型在屏幕上的尺寸更新贴图需要的分辨率，并在预算内逐级提高分辨率
+    :param models: 本帧绘制的模型
+    :return: None
+    """
+    global frame, stream_count
+
+    if not by_id:
+        return
+    frame += 1
+
+    scale = soup3D.proj_height / (2 * math.tan(math.radians(soup3D.proj_fov) / 2))
+    camera = np.array((soup3D.camera.X, soup3D.camera.Y, soup3D.camera.Z), dtype=np.float32)
+    for model in models:
+        center, radius = model.get_world_bounds()
+        pixels = _screen_size(center, radius, camera, scale)
+        for surface in model.surfaces.values():
+            for image in _surface_images(surface):
+                residency = by_id.get(image.texture_id)
+                if residency is not None:
+                    residency.want(pixels, frame)
+
+    # 最缺分辨率的贴图优先，每张贴图每帧最多提高一级
+    wanted = [residency for residency in by_id.values() if residency.last_used == frame and residency.get_target() < residency.level]
+    wanted.sort(key=_stream_order)
+    budget = UPLOAD_BUDGET
+    for residency in wanted:
+        level = residency.level - 1
+        size = residency.level_bytes[level]
+        if size > budget and budget < UPLOAD_BUDGET:
+            break
+        if not _make_room(size, residency):
+            break
+        _set_level(residency, level)
+        residency.stream_count += 1
+        stream_count += 1
+        budget -= size
+
+
+def _stream_order(residency: Residency) -> tuple[int, float]:
+    """
+    提高分辨率的顺序，缺少的级别越多、屏幕尺寸越大越优先
+    :param residency: 驻留状态
+    :return: 排序键
+    """
+    return residency.get_target() - residency.level, -residency.screen_size
+
+
+def _evict_order(residency: Residency) -> tuple[int, int]:
+    """
+    降低分辨率的顺序，最久未使用、占用显存越多越优先
+    :param residency: 驻留状态
+    :return: 排序键
+    """
+    return residency.last_used, -residency.get_bytes()
+
+
+def _evictable(residency: Residency, keep: Residency | None) -> bool:
+    """
+    判断贴图能否再降低一级分辨率
+    :param residency: 驻留状态
+    :param keep:      正在提高分辨率的贴图，不会被降低
+    :return: 能否降低
+    """
+    return (
+        residency is not keep and residency.level < residency.min_level
+        and (residency.last_used != frame or residency.level < residency.get_target())
+    )
+
+
+def _make_room(size: int, keep: Residency | None) -> bool:
+    """
+    降低最久未使用的贴图的分辨率，直到再占用size字节后不超过显存预算。本帧需要高分辨率的贴图不会被降低到需要的级别以下
+    :param size: 需要增加的字节数
+    :param keep: 正在提高分辨率的贴图，不会被降低
+    :return: 是否腾出了足够的显存
+    """
+    global evict_count
+
+    if resident_bytes + size <= VRAM_BUDGET:
+        return True
+
+    # 候选贴图只收集一次，降低一级后按新的排序键放回堆中
+    heap = [
+        (*_evict_order(residency), index, residency)
+        for index, residency in enumerate(by_id.values()) if _evictable(residency, keep)
+    ]
+    heapq.heapify(heap)
+    while resident_bytes + size > VRAM_BUDGET:
+        if not heap:
+            return False
+        _, _, index, victim = heapq.heappop(heap)
+        _set_level(victim, victim.level + 1)
+        victim.evict_count += 1
+        evict_count += 1
+        if _evictable(victim, keep):
+            heapq.heappush(heap, (*_evict_order(victim), index, victim))
+    return True
+
+
+def get_residency(image: "soup3D.shader.Img") -> dict | None:
+    """
+    获取贴图的驻留统计
+    :param image: 贴图或混合通道贴图
+    :return: Residency.get_stats()的返回值，未流送的贴图返回None
+    """
+    # 直接使用来源贴图纹理的混合通道贴图按纹理 id 查找
+    residency = entries.get(image) or by_id.get(image.texture_id)
+    if residency is None:
+        return None
+    return residency.get_stats()
+
+
+def get_stats() -> dict:
+    """
+    获取贴图流送统计
+    :return: {"textures": 流送的贴图数量, "resident_bytes": 占用的显存, "budget": 显存预算, "streamed": 提高分辨率的次数,
+              "evicted": 降低分辨率的次数, "upload_bytes": 上传的总字节数}
+    """
+    return {
+        "textures": len(by_id),
+        "resident_bytes": resident_bytes,
+        "budget": VRAM_BUDGET,
+        "streamed": stream_count,
+        "evicted": evict_count,
+        "upload_bytes": upload_bytes,
+    }
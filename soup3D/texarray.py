@@ -0,0 +1,153 @@
+"""
+调用：soup3D.texarray
+纹理数组批处理，在加载模型时将只有贴图不同的材质的主要颜色、法线与自发光贴图按尺寸放入GL_TEXTURE_2D_ARRAY的各层，合并为一个
+ArraySP材质，并在每个顶点后追加层序号。使用这些材质的面合并为同一个面，只需绑定一次纹理、绘制一次。
+与图集不同，纹理数组的每一层都是完整的贴图，uv坐标可以任意重复平铺，也不需要填充边缘。
+"""
+import soup3D.atlas
+import soup3D.shader
+
+__all__ : list[str] = [
+    "build", "get_stats",
+]
+
+MAX_LAYERS = 256       # 每个纹理数组的最多层数，OpenGL 3.3保证至少支持256层
+
+array_count = 0        # 已生成的纹理数组数量
+layer_count = 0        # 已放入纹理数组的贴图数量
+
+
+def _map_size(image) -> tuple[int, int] | None:
+    """
+    获取可以放入纹理数组的贴图的尺寸
+    :param image: 贴图或混合通道贴图
+    :return: (宽度, 高度)，压缩贴图返回None
+    """
+    if soup3D.atlas.is_compressed(image):
+        return None
+    if isinstance(image, soup3D.shader.Texture):
+        return image.get_size()
+    return tuple(image.resize)
+
+
+def _slot_key(value) -> tuple | None:
+    """
+    获取法线或自发光参数的合并键，常量必须相同，贴图只需尺寸相同
+    :param value: 常量或贴图
+    :return: 合并键，无法放入纹理数组时返回None
+    """
+    if isinstance(value, (list, tuple)):
+        return "const", tuple(value)
+    size = _map_size(value)
+    if size is None:
+        return None
+    return "map", size
+
+
+def _material_key(material, vertex_lists: list) -> tuple | None:
+    """
+    获取材质的合并键，合并键相同的材质可以放入同一组纹理数组
+    :param material:     材质
+    :param vertex_lists: 使用该材质的所有面的顶点
+    :return: 合并键，不能放入纹理数组时返回None
+    """
+    if type(material) is not soup3D.shader.AutoSP:
+        return None
+    if material.lightmap is not None:
+        return None
+    for vertices in vertex_lists:
+        if any(len(vertex) < 5 for vertex in vertices):
+            return None
+
+    base_size = _map_size(material.base_color)
+    normal_key = _slot_key(material.normal)
+    emission_key = _slot_key(material.emission)
+    if base_size is None or normal_key is None or emission_key is None:
+        return None
+    return (
+        base_size, normal_key, emission_key, material.double_side,
+        material.max_light_count, material.alpha_test, material.unlit
+    )
+
+
+def _slot_value(materials: list, slot: str):
+    """
+    获取合并后材质的法线或自发光参数
+    :param materials: 合并的材质，按层序号排列
+    :param slot:      "normal"或"emission"
+    :return: 常量或纹理数组
+    """
+    value = getattr(materials[0], slot)
+    if isinstance(value, (list, tuple)):
+        return value
+    return soup3D.shader.TextureArray([getattr(material, slot) for material in materials])
+
+
+def build(groups: list, max_layers: int = MAX_LAYERS) -> list:
+    """
+    将只有贴图不同的AutoSP材质合并为使用纹理数组的ArraySP材质。主要颜色贴图尺寸相同、法线与自发光同为相同常量或同为尺寸相同的贴
+    图、其它参数也相同的材质才会合并；使用光照贴图或压缩贴图的材质保持不变。
+    :param groups:     [(材质, 顶点列表), ...]，顶点按不相连三角形排列，同一个材质可以出现多次
+    :param max_layers: 每个纹理数组的最多层数
+    :return: 替换材质并追加层序号后的[(材质, 顶点列表), ...]，每个材质只出现一次，不能合并的材质保持不变
+    """
+    global array_count, layer_count
+
+    # 按材质收集顶点
+    materials = {}
+    for material, vertices in groups:
+        materials.setdefault(id(material), (material, []))[1].append(vertices)
+
+    # 按合并键分组，每组按层数上限拆分
+    batches = {}
+    for material, vertex_lists in materials.values():
+        key = _material_key(material, vertex_lists)
+        if key is not None:
+            batches.setdefault(key, []).append(material)
+
+    layers = {}  # 材质id -> (合并后的材质, 层序号)
+    for batch in batches.values():
+        for start in range(0, len(batch), max_layers):
+            chunk = batch[start:start + max_layers]
+            if len(chunk) < 2:
+                continue
+            first = chunk[0]
+            array_material = soup3D.shader.ArraySP(
+                base_color=soup3D.shader.TextureArray([material.base_color for material in chunk]),
+                normal=_slot_value(chunk, "normal"),
+                emission=_slot_value(chunk, "emission"),
+                double_side=first.double_side,
+                max_light_count=first.max_light_count,
+                alpha_test=first.alpha_test,
+                unlit=first.unlit,
+            )
+            for layer, material in enumerate(chunk):
+                layers[id(material)] = (array_material, layer)
+            array_count += 1 + sum(
+                isinstance(value, soup3D.shader.TextureArray)
+                for value in (array_material.normal, array_material.emission)
+            )
+            layer_count += len(chunk)
+    if not layers:
+        return groups
+
+    # 替换材质，使用同一合并材质的顶点合并为同一组
+    result = {}  # 材质id -> (材质, 顶点列表)
+    for material, vertices in groups:
+        entry = layers.get(id(material))
+        if entry is None:
+            result.setdefault(id(material), (material, []))[1].extend(vertices)
+            continue
+        array_material, layer = entry
+        result.setdefault(id(array_material), (array_material, []))[1].extend(
+            tuple(vertex) + (layer,) for vertex in vertices
+        )
+    return list(result.values())
+
+
+def get_stats() -> dict:
+    """
+    获取纹理数组统计
+    :return: {"arrays": 已生成的纹理数组数量, "layers": 已放入纹理数组的贴图数量}
+    """
+    return {"arrays": array_count, "layers": layer_count}
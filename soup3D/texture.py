@@ -0,0 +1,202 @@
+"""
+调用：soup3D.texture
+贴图管理，在整个进程内复用贴图。文件贴图按路径与修改时间复用，内存中的图像(如gltf内嵌图像)按内容摘要复用，同一张图像只解码一次，
+并且所有使用它的材质共享同一个OpenGL纹理。
+四个通道都是常数的混合通道贴图共享按颜色量化后的1x1纹理。
+贴图被材质引用时一直保留；不再被引用的贴图由Python的引用计数自动释放。从文件解码的像素数据按最近使用顺序保留在内存中，超出预算时
+释放最久未使用的数据，需要时再从文件重新解码。
+"""
+from collections import OrderedDict
+import hashlib
+import os
+import weakref
+
+import soup3D.shader
+
+__all__ : list[str] = [
+    "load", "from_bytes", "constant", "set_cpu_budget", "get_stats",
+]
+
+CPU_BUDGET = 256 * 1024 * 1024  # 从文件解码的像素数据最多占用的字节数
+
+cache = weakref.WeakValueDictionary()  # 缓存键 -> 贴图
+managed = weakref.WeakSet()            # 由load创建、像素数据可以释放后重新解码的贴图
+resident = OrderedDict()               # 贴图id -> (贴图的弱引用, 像素数据字节数)，按最近使用顺序排列，不阻止贴图被释放
+resident_bytes = 0                     # resident中像素数据的总字节数
+pinned = set()                         # 正在后台上传、像素数据不能释放的贴图id
+
+constants = {}         # 量化后的(R, G, B, A) -> 1x1常数贴图，常数贴图数量很少，不会被释放
+
+hit_count = 0          # 复用已有贴图的次数
+miss_count = 0         # 新建贴图的次数
+evict_count = 0        # 释放像素数据的次数
+
+
+def load(path: str) -> soup3D.shader.Texture:
+    """
+    获取文件贴图，路径与修改时间相同时返回同一个贴图对象
+    :param path: 图像文件路径
+    :return: 贴图
+    """
+    global hit_count, miss_count
+
+    path = os.path.abspath(path)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    key = ("file", path, mtime)
+
+    texture = cache.get(key)
+    if texture is not None:
+        hit_count += 1
+        return texture
+
+    texture = soup3D.shader.Texture(path)
+    cache[key] = texture
+    managed.add(texture)
+    # 贴图不再被引用时从resident中移除，像素数据随贴图一起释放
+    weakref.finalize(texture, _forget, id(texture))
+    touch(texture)
+    miss_count += 1
+    return texture
+
+
+def from_bytes(image_data: bytes, width: int, height: int, format: str = 'RGBA') -> soup3D.shader.Texture:
+    """
+    获取内存中的图像对应的贴图，内容、尺寸与格式都相同时返回同一个贴图对象
+    :param image_data: 二进制图像数据
+    :param width:      图像宽度
+    :param height:     图像高度
+    :param format:     图像格式，可以是 'RGBA', 'RGB', 'L' (灰度) 等
+    :return: 贴图
+    """
+    global hit_count, miss_count
+
+    key = ("bytes", hashlib.sha1(image_data).hexdigest(), width, height, format)
+    texture = cache.get(key)
+    if texture is not None:
+        hit_count += 1
+        return texture
+
+    texture = soup3D.shader.Texture(image_data, width=width, height=height, format=format)
+    cache[key] = texture
+    miss_count += 1
+    return texture
+
+
+def constant(values: tuple[int, int, int, int]) -> int:
+    """
+    获取常数颜色对应的共享1x1纹理，颜色相同的常数混合通道贴图使用同一个纹理
+    :param values: 量化为0~255的(R, G, B, A)
+    :return: 纹理 id
+    """
+    texture = constants.get(values)
+    if texture is None:
+        # 加0.5避免浮点误差使量化结果减1
+        texture = soup3D.shader.MixChannel((1, 1), *((value + 0.5) / 255 for value in values))
+        texture.upload()
+        constants[values] = texture
+    return texture.texture_id
+
+
+def touch(texture: soup3D.shader.Texture) -> None:
+    """
+    自动调用函数，无需手动调用。在由load创建的贴图解码或使用像素数据时调用，更新最近使用顺序与像素数据占用
+    :param texture: 贴图
+    :return: None
+    """
+    global resident_bytes
+
+    if texture not in managed:
+        return
+
+    entry = resident.pop(id(texture), None)
+    if entry is not None:
+        resident_bytes -= entry[1]
+    size = texture.get_cpu_bytes()
+    resident[id(texture)] = (weakref.ref(texture), size)
+    resident_bytes += size
+    _evict(texture)
+
+
+def _forget(texture_id: int) -> None:
+    """
+    自动调用函数，无需手动调用。在由load创建的贴图被释放时移除它的像素数据占用
+    :param texture_id: 贴图id
+    :return: None
+    """
+    global resident_bytes
+
+    entry = resident.pop(texture_id, None)
+    if entry is not None:
+        resident_bytes -= entry[1]
+
+
+def pin(texture: soup3D.shader.Texture) -> None:
+    """
+    自动调用函数，无需手动调用。在贴图进入后台上传队列时调用，上传完成前不释放它的像素数据
+    :param texture: 贴图
+    :return: None
+    """
+    pinned.add(id(texture))
+
+
+def unpin(texture: soup3D.shader.Texture) -> None:
+    """
+    自动调用函数，无需手动调用。在贴图上传完成或解码失败时调用，之后像素数据可以按预算释放
+    :param texture: 贴图
+    :return: None
+    """
+    pinned.discard(id(texture))
+
+
+def _evict(keep: soup3D.shader.Texture | None) -> None:
+    """
+    释放最久未使用的文件贴图的像素数据，直到像素数据占用不超过预算
+    :param keep: 正在使用的贴图，不会被释放
+    :return: None
+    """
+    global resident_bytes, evict_count
+
+    for texture_id in list(resident):
+        if resident_bytes <= CPU_BUDGET:
+            break
+        reference, size = resident[texture_id]
+        texture = reference()
+        if texture is keep or texture_id in pinned:
+            continue
+        del resident[texture_id]
+        resident_bytes -= size
+        if texture is None:
+            continue
+        texture.unload()
+        evict_count += 1
+
+
+def set_cpu_budget(size: int) -> None:
+    """
+    设置从文件解码的像素数据最多占用的字节数
+    :param size: 字节数
+    :return: None
+    """
+    global CPU_BUDGET
+
+    CPU_BUDGET = size
+    _evict(None)
+
+
+def get_stats() -> dict:
+    """
+    获取贴图缓存统计
+    :return: {"textures": 缓存中的贴图数量, "constants": 共享的常数纹理数量, "hits": 复用次数, "misses": 新建次数,
+              "resident_bytes": 像素数据占用的字节数, "evictions": 释放像素数据的次数}
+    """
+    return {
+        "textures": len(cache),
+        "constants": len(constants),
+        "hits": hit_count,
+        "misses": miss_count,
+        "resident_bytes": resident_bytes,
+        "evictions": evict_count,
+    }
@@ -51,11 +51,10 @@ class Shape:
 
     def _setup_projection(self) -> None:
         """设置正交投影"""
-        viewport = glGetIntegerv(GL_VIEWPORT)
         glMatrixMode(GL_PROJECTION)
         glPushMatrix()
         glLoadIdentity()
-        gluOrtho2D(0, viewport[2], viewport[3], 0)
+        gluOrtho2D(0, soup3D.proj_width, soup3D.proj_height, 0)
         glMatrixMode(GL_MODELVIEW)
         glPushMatrix()
         glLoadIdentity()
@@ -0,0 +1,345 @@
+"""
+调用：soup3D.upload
+后台贴图加载。开启后，从文件读取的贴图在线程池中解码，需要逐通道混合的混合通道贴图也在线程池中解码来源贴图并混合，生成纹理时先
+得到一个1x1的占位纹理；解码完成后，soup3D.update每帧在字节数与时间预算内通过像素缓冲区对象(PBO)把图像分批上传到同一个纹理对象。
+纹理id保持不变，已录制的显示列表无需重新生成。
+"""
+from OpenGL.GL import *
+from concurrent.futures import ThreadPoolExecutor
+import ctypes
+import time
+import numpy as np
+
+import soup3D.compressed
+import soup3D.diskcache
+import soup3D.shader
+import soup3D.state
+import soup3D.texture
+
+__all__ : list[str] = [
+    "use_async", "wait", "get_stats",
+]
+
+PLACEHOLDER_COLOR = (128, 128, 128, 255)  # 占位纹理的颜色
+PLACEHOLDER_COLORS = {                    # 纹理单元 -> 占位纹理的颜色，使法线贴图与自发光贴图在加载完成前不影响光照
+    1: (128, 128, 255, 255),
+    3: (0, 0, 0, 255),
+}
+UPLOAD_UNIT = 0        # 上传纹理时使用的纹理单元
+
+enabled = False        # 是否在后台加载贴图
+executor = None        # 解码线程池
+BYTE_BUDGET = 8 * 1024 * 1024  # 每帧最多上传的字节数，至少上传一行
+TIME_BUDGET = 0.004    # 每帧最多用于上传的时间(秒)
+
+pending = []           # [(贴图或混合通道贴图, 解码任务), ...]，按请求顺序排列
+staging = []           # [[贴图, 下一次上传的起始行], ...]，已解码、正在分批上传的贴图
+pbo = None             # 像素缓冲区对象
+
+request_count = 0      # 后台加载的贴图数量
+upload_count = 0       # 上传完成的贴图数量
+upload_bytes = 0       # 上传的总字节数
+
+
+def use_async(enable: bool = True,
+              workers: int | None = None,
+              byte_budget: int = 8 * 1024 * 1024,
+              time_budget: float = 0.004) -> None:
+    """
+    开启或关闭后台贴图加载，只影响之后首次生成纹理的贴图
+    :param enable:      是否在后台加载贴图
+    :param workers:     解码线程数量，None表示由线程池决定
+    :param byte_budget: 每帧最多上传的字节数
+    :param time_budget: 每帧最多用于上传的时间(秒)
+    :return: None
+    """
+    global enabled, executor, BYTE_BUDGET, TIME_BUDGET
+
+    enabled = enable
+    BYTE_BUDGET = byte_budget
+    TIME_BUDGET = time_budget
+    if enable and executor is None:
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="soup3D-decode")
+
+
+def request(texture: "soup3D.shader.Texture", texture_unit: int = 0) -> int:
+    """
+    自动调用函数，无需手动调用。为贴图生成占位纹理，并在线程池中解码贴图
+    :param texture:      从文件读取的贴图
+    :param texture_unit: 纹理单元编号，决定占位纹理的颜色
+    :return: 纹理 id，解码并上传完成后该纹理会变为贴图的内容
+    """
+    global request_count
+
+    texture_id = _placeholder(texture_unit)
+    # 上传完成前贴图缓存不会释放它的像素数据
+    soup3D.texture.pin(texture)
+    pending.append((texture, executor.submit(soup3D.shader.read_image, texture.image_path)))
+    request_count += 1
+    return texture_id
+
+
+def mix_sources(mix: "soup3D.shader.MixChannel") -> list | None:
+    """
+    自动调用函数，无需手动调用。获取混合通道贴图在后台混合所需的来源贴图
+    :param mix: 混合通道贴图
+    :return: [(来源贴图, 需要解码的文件路径或None, 已加载的(格式, 像素数组)或None), ...]，来源中有压缩贴图或混合通道贴图时返回
+             None，此时只能同步混合
+    """
+    sources = {}
+    for source in (mix.R, mix.G, mix.B, mix.A):
+        if not isinstance(source, soup3D.shader.Channel):
+            continue
+        texture = source.texture
+        if not isinstance(texture, soup3D.shader.Texture):
+            return None
+        if id(texture) in sources:
+            continue
+        if texture.image_data is not None:
+            if texture.is_compressed():
+                return None
+            sources[id(texture)] = (texture, None, (texture.get_format(), texture.get_array()))
+        elif texture.image_path and not soup3D.compressed.is_container(texture.image_path):
+            sources[id(texture)] = (texture, texture.image_path, None)
+        else:
+            return None
+    return list(sources.values())
+
+
+def request_mix(mix: "soup3D.shader.MixChannel", sources: list, texture_unit: int = 0) -> int:
+    """
+    自动调用函数，无需手动调用。为混合通道贴图生成占位纹理，并在线程池中解码来源贴图并混合通道
+    :param mix:          混合通道贴图
+    :param sources:      mix_sources的返回值
+    :param texture_unit: 纹理单元编号，决定占位纹理的颜色
+    :return: 纹理 id，混合并上传完成后该纹理会变为混合结果
+    """
+    global request_count
+
+    texture_id = _placeholder(texture_unit)
+    pending.append((mix, executor.submit(_mix_job, mix, sources)))
+    request_count += 1
+    return texture_id
+
+
+def _placeholder(texture_unit: int) -> int:
+    """
+    生成1x1的占位纹理
+    :param texture_unit: 纹理单元编号，决定占位纹理的颜色
+    :return: 纹理 id
+    """
+    texture_id = glGenTextures(1)
+    soup3D.state.bind_texture(texture_unit, GL_TEXTURE_2D, texture_id)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+    color = PLACEHOLDER_COLORS.get(texture_unit, PLACEHOLDER_COLOR)
+    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, 1, 1, 0, GL_RGBA, GL_UNSIGNED_BYTE, bytes(color))
+    return texture_id
+
+
+def _mix_job(mix: "soup3D.shader.MixChannel", sources: list) -> tuple:
+    """
+    在线程池中解码混合通道贴图的来源贴图并混合通道，不修改任何贴图。使用磁盘缓存且缓存存在时不解码来源贴图。
+    :param mix:     混合通道贴图
+    :param sources: mix_sources的返回值
+    :return: ([(来源贴图, read_image的返回值), ...], 混合后的像素数组, 磁盘缓存的各级mipmap或None)
+    """
+    key = None
+    if soup3D.diskcache.enabled:
+        key = soup3D.diskcache.source_key(mix)
+        mipmaps = soup3D.diskcache.load(key)
+        if mipmaps is not None:
+            return [], mipmaps[0], mipmaps
+
+    images = []
+    arrays = {}  # 贴图id -> (格式, 像素数组)
+    for texture, path, entry in sources:
+        if path is not None:
+            image = soup3D.shader.read_image(path)
+            images.append((texture, image))
+            format, width, height, data = image[:4]
+            entry = (format, soup3D.shader.image_array(format, width, height, data))
+        arrays[id(texture)] = entry
+
+    array = mix._composite(arrays)
+    if key is not None:
+        mipmaps = soup3D.diskcache.store(key, array)
+        return images, mipmaps[0], mipmaps
+    return images, array, None
+
+
+def _collect(block: bool) -> None:
+    """
+    将解码完成的贴图移入上传队列
+    :param block: 是否等待所有解码任务完成
+    :return: None
+    """
+    for entry in list(pending):
+        texture, future = entry
+        if not block and not future.done():
+            continue
+        # 先移出队列，解码失败时只抛出这一张贴图的异常，之后的帧不会重复处理
+        pending.remove(entry)
+        if future.exception() is not None:
+            soup3D.texture.unpin(texture)
+        if isinstance(texture, soup3D.shader.MixChannel):
+            images, array, mipmaps = future.result()
+            # 来源贴图的解码结果同样保留，之后使用这些贴图时无需再次解码
+            for source, image in images:
+                if source.get_cpu_bytes() == 0:
+                    source.set_image(image)
+            if texture.array is None:
+                texture.set_array(array, mipmaps)
+            staging.append([texture, 0])
+            continue
+        image = future.result()
+        if texture.get_cpu_bytes() == 0:
+            # 解码期间可能已被同步加载
+            texture.set_image(image)
+        staging.append([texture, 0])
+
+
+def _stage(data: np.ndarray) -> None:
+    """
+    将数据写入像素缓冲区对象，并保持其绑定在GL_PIXEL_UNPACK_BUFFER上
+    :param data: 需要上传的数据
+    :return: None
+    """
+    global pbo
+
+    if pbo is None:
+        pbo = glGenBuffers(1)
+    glBindBuffer(GL_PIXEL_UNPACK_BUFFER, pbo)
+    # 每次重新分配存储，驱动无需等待上一次上传完成
+    glBufferData(GL_PIXEL_UNPACK_BUFFER, data.nbytes, data, GL_STREAM_DRAW)
+
+
+def _upload_compressed(texture: "soup3D.shader.Texture") -> int:
+    """
+    上传压缩贴图的各级mipmap，压缩数据较小，一次上传完成
+    :param texture: 压缩贴图
+    :return: 上传的字节数
+    """
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, len(texture.levels) - 1)
+    internal_format = soup3D.compressed.GL_FORMATS[texture.format]
+    total = 0
+    for level, (width, height, data) in enumerate(texture.levels):
+        _stage(np.frombuffer(data, dtype=np.uint8))
+        glCompressedTexImage2D(GL_TEXTURE_2D, level, internal_format, width, height, 0, len(data), ctypes.c_void_p(0))
+        total += len(data)
+    glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+    if len(texture.levels) > 1:
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
+    return total
+
+
+def _upload_rows(entry: list, budget: int) -> tuple[bool, int]:
+    """
+    在预算内上传贴图的若干行，全部上传后生成mipmap
+    :param entry:  [贴图, 下一次上传的起始行]
+    :param budget: 本次最多上传的字节数
+    :return: (是否上传完成, 上传的字节数)
+    """
+    texture, row = entry
+    if isinstance(texture, soup3D.shader.Texture) and texture.image_path and texture.image_data is None:
+        # 排队前已加载的像素数据可能已被贴图缓存释放，重新解码
+        texture._load_image()
+    width, height = texture.width, texture.height
+    soup3D.state.bind_texture(UPLOAD_UNIT, GL_TEXTURE_2D, texture.texture_id)
+
+    if soup3D.stream.enabled and soup3D.stream.is_streamable(texture):
+        # 由贴图流送先上传低分辨率的mipmap
+        soup3D.stream.create(texture, UPLOAD_UNIT, texture.texture_id)
+        return True, 0
+
+    if isinstance(texture, soup3D.shader.Texture) and texture.levels is not None:
+        return True, _upload_compressed(texture)
+
+    internal_format, data_format = soup3D.shader.PIXEL_FORMATS.get(texture.format, (GL_RGBA, GL_RGBA))
+    row_bytes = width * len(soup3D.shader.FORMAT_CHANNELS.get(texture.format, soup3D.shader.FORMAT_CHANNELS['RGBA']))
+    if row == 0:
+        # 分批上传期间只使用第0级，避免采样到不完整的mipmap
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, 0)
+        glTexImage2D(GL_TEXTURE_2D, 0, internal_format, width, height, 0, data_format, GL_UNSIGNED_BYTE, None)
+
+    rows = min(height - row, max(1, budget // row_bytes))
+    _stage(texture.get_array().reshape(-1)[row * row_bytes:(row + rows) * row_bytes])
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    glTexSubImage2D(GL_TEXTURE_2D, 0, 0, row, width, rows, data_format, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+    glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+
+    entry[1] = row + rows
+    if entry[1] < height:
+        return False, rows * row_bytes
+
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
+    if texture.mipmaps is not None:
+        # 磁盘缓存中已有各级mipmap，第0级已分批上传，其余级别较小，直接从映射上传
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, len(texture.mipmaps) - 1)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        for level, array in enumerate(texture.mipmaps[1:], 1):
+            level_height, level_width = array.shape[:2]
+            glTexImage2D(GL_TEXTURE_2D, level, internal_format, level_width, level_height, 0, data_format,
+                         GL_UNSIGNED_BYTE, array)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+    else:
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, 1000)
+        glGenerateMipmap(GL_TEXTURE_2D)
+    return True, rows * row_bytes
+
+
+def _drain(byte_budget: float, time_budget: float) -> None:
+    """
+    在预算内上传已解码的贴图
+    :param byte_budget: 最多上传的字节数
+    :param time_budget: 最多用于上传的时间(秒)
+    :return: None
+    """
+    global upload_count, upload_bytes
+
+    start = time.perf_counter()
+    while staging and byte_budget > 0 and time.perf_counter() - start < time_budget:
+        done, size = _upload_rows(staging[0], byte_budget)
+        byte_budget -= size
+        upload_bytes += size
+        if done:
+            soup3D.texture.unpin(staging.pop(0)[0])
+            upload_count += 1
+
+
+def process() -> None:
+    """
+    自动调用函数，无需手动调用。每帧接收解码完成的贴图，并在预算内上传
+    :return: None
+    """
+    if not pending and not staging:
+        return
+    _collect(False)
+    _drain(BYTE_BUDGET, TIME_BUDGET)
+
+
+def wait() -> None:
+    """
+    等待所有后台加载的贴图解码并上传完成，不受每帧预算限制，可在加载界面结束时调用
+    :return: None
+    """
+    _collect(True)
+    _drain(float("inf"), float("inf"))
+
+
+def get_stats() -> dict:
+    """
+    获取后台贴图加载统计
+    :return: {"pending": 正在解码的贴图数量, "staging": 正在上传的贴图数量, "requested": 后台加载的贴图数量,
+              "uploaded": 上传完成的贴图数量, "bytes": 上传的总字节数}
+    """
+    return {
+        "pending": len(pending),
+        "staging": len(staging),
+        "requested": request_count,
+        "uploaded": upload_count,
+        "bytes": upload_bytes,
+    }